@@ -21,46 +21,50 @@ from numpy import nan
 
 import scipy.sparse
 
-from sklearn.decomposition import PCA, FastICA, TruncatedSVD
-from sklearn.manifold import TSNE
-from miscellaneous.incremental_pca import IncrementalPCA
-import sklearn.metrics.cluster
-
-from matplotlib import pyplot
-import matplotlib.patches
-import matplotlib.lines
-import matplotlib.gridspec
-from mpl_toolkits.axes_grid1 import make_axes_locatable, axes_size
-from matplotlib.ticker import LogFormatterSciNotation
 from textwrap import wrap
 
-import seaborn
-
-from PIL import Image
-
-from pandas import DataFrame
-
 from data import createLabelSorter
 
 import os
 import gzip
 import pickle
+import tempfile
+import hashlib
 
 import copy
 import re
 
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import contextlib
+import io
+
 from time import time
 from auxiliary import (
     loadNumberOfEpochsTrained, loadLearningCurves, loadAccuracies,
     loadCentroids, loadKLDivergences,
     formatTime, formatDuration,
-    normaliseString, properString, subheading
+    normaliseString, properString, subheading,
+    LazyModule
 )
 from miscellaneous.prediction import prediction_method_names
-import warnings
 
-standard_palette = seaborn.color_palette('Set2', 8)
-standard_colour_map = seaborn.cubehelix_palette(light = .95, as_cmap = True)
+# Modules for decompositions and plotting are only imported when first used,
+# so runs without analyses do not load them.
+
+sklearn = LazyModule("sklearn")
+randomized_pca = LazyModule("miscellaneous.randomized_pca")
+
+pyplot = LazyModule("matplotlib.pyplot",
+    initialisation = lambda: reset_plot_look())
+matplotlib = LazyModule("matplotlib")
+seaborn = LazyModule("seaborn")
+pandas = LazyModule("pandas")
+Image = LazyModule("PIL.Image")
+
+standard_palette = lambda: seaborn.color_palette("Set2", 8)
+standard_colour_map = lambda: seaborn.cubehelix_palette(
+    light = .95, as_cmap = True)
 neutral_colour = (0.7, 0.7, 0.7)
 
 lighter_palette = lambda N: seaborn.husl_palette(N, l = .75)
@@ -69,9 +73,8 @@ darker_palette = lambda N: seaborn.husl_palette(N, l = .55)
 reset_plot_look = lambda: seaborn.set(
     context = "notebook",
     style = "ticks",
-    palette = standard_palette
+    palette = standard_palette()
 )
-reset_plot_look()
 
 figure_extension = ".png"
 image_extension = ".png"
@@ -79,13 +82,27 @@ image_extension = ".png"
 maximum_feature_size_for_analyses = 2000
 
 maximum_number_of_bins_for_histograms = 20000
+number_of_bins_for_continuous_histograms = 1000
+
+heat_map_resolution = (1000, 1000)
+heat_map_batch_elements = 1e7
+
+heat_map_comparisons = {
+    "difference": lambda x_tilde, x: x_tilde - x,
+    "log_ratio": lambda x_tilde, x: numpy.log1p(x_tilde) - numpy.log1p(x)
+}
 
-maximum_number_of_values_for_heat_maps = 5000 * 25000
+maximum_number_of_examples_for_scatter_plots = 100000
+aggregated_scatter_plot_resolution = 500
 
 maximum_number_of_features_for_t_sne = 100
-maximum_number_of_examples_for_t_sne = 200000
+maximum_number_of_examples_for_exact_t_sne = 50000
+number_of_landmarks_for_t_sne = 20000
+number_of_neighbours_for_t_sne_interpolation = 10
 number_of_pca_components_before_tsne = 50
 
+decomposition_cache_extension = ".pkl.gz"
+
 number_of_random_examples = 100
 
 evaluation_subset_maximum_number_of_examples = 25
@@ -110,7 +127,8 @@ analysis_groups["complete"] += analysis_groups["default"]
 def analyseData(data_sets,
     decomposition_methods = ["PCA"], highlight_feature_indices = [],
     analyses = ["default"], analysis_level = "normal",
-    export_options = [], results_directory = "results"):
+    export_options = [], results_directory = "results",
+    cache_directory = None, number_of_figure_workers = 1):
     
     # Setup
     
@@ -195,88 +213,103 @@ def analyseData(data_sets,
     
     # Loop over data sets
     
-    for data_set in data_sets:
+    with FigureRenderer(number_of_figure_workers):
         
-        print(subheading("Analyses of {} set".format(data_set.kind)))
-        
-        # Examples for data set
-        
-        if "images" in analyses and data_set.example_type == "images":
-            print("Saving image of {} random examples from {} set.".format(
-                number_of_random_examples, data_set.kind))
-            image_time_start = time()
-            image, image_name = combineImagesFromDataSet(
-                data_set,
-                number_of_random_examples,
-                name = data_set.kind
-            )
-            saveImage(image, image_name, results_directory)
-            image_duration = time() - image_time_start
-            print("Image saved ({}).".format(formatDuration(image_duration)))
-            print()
-        
-        # Distributions
-        
-        if "distributions" in analyses:
+        for data_set in data_sets:
             
-            analyseDistributions(
-                data_set,
-                cutoffs = default_cutoffs,
-                analysis_level = analysis_level,
-                export_options = export_options,
-                results_directory = results_directory
-            )
-        
-        # Heat map for data set
-        
-        if "heat_maps" in analyses and \
-            data_set.number_of_values <= maximum_number_of_values_for_heat_maps:
+            print(subheading("Analyses of {} set".format(data_set.kind)))
             
-            print("Plotting heat map for {} set.".format(data_set.kind))
+            # Examples for data set
             
-            heat_maps_directory = os.path.join(results_directory, "heat_maps")
+            if "images" in analyses and data_set.example_type == "images":
+                print("Saving image of {} random examples from {} set.".format(
+                    number_of_random_examples, data_set.kind))
+                image_time_start = time()
+                image, image_name = combineImagesFromDataSet(
+                    data_set,
+                    number_of_random_examples,
+                    name = data_set.kind
+                )
+                saveImage(image, image_name, results_directory)
+                image_duration = time() - image_time_start
+                print("Image saved ({}).".format(
+                    formatDuration(image_duration)))
+                print()
             
-            heat_maps_time_start = time()
+            # Distributions
             
-            if data_set.labels is not None:
-                labels = data_set.labels
-            else:
-                labels = None
+            if "distributions" in analyses:
+                
+                analyseDistributions(
+                    data_set,
+                    cutoffs = default_cutoffs,
+                    analysis_level = analysis_level,
+                    export_options = export_options,
+                    results_directory = results_directory
+                )
             
-            figure, figure_name = plotHeatMap(
-                data_set.values,
-                labels = labels,
-                normalisation = data_set.heat_map_normalisation,
-                normalisation_constants = data_set.count_sum,
-                x_name = data_set.tags["feature"].capitalize() + "s",
-                y_name = data_set.tags["example"].capitalize() + "s",
-                z_name = data_set.tags["value"].capitalize() + "s",
-                z_symbol = "x",
-                name = data_set.kind
-            )
-            saveFigure(figure, figure_name, export_options, heat_maps_directory)
+            # Heat map for data set
             
-            heat_maps_duration = time() - heat_maps_time_start
-            print("Heat map for {} set plotted and saved ({})."\
-                .format(data_set.kind, formatDuration(heat_maps_duration)))
+            if "heat_maps" in analyses:
+                
+                print("Plotting heat map for {} set.".format(data_set.kind))
+                
+                heat_maps_directory = os.path.join(results_directory,
+                    "heat_maps")
+                
+                heat_maps_time_start = time()
+                
+                if data_set.labels is not None:
+                    labels = data_set.labels
+                else:
+                    labels = None
+                
+                if labels is not None and analysis_level == "extensive":
+                    feature_clusters = classFeatureClusters(
+                        data_set.values, labels, data_set.label_sorter)
+                else:
+                    feature_clusters = None
+                
+                renderFigure(
+                    plotHeatMap,
+                    data_set.values,
+                    labels = labels,
+                    label_sorter = data_set.label_sorter,
+                    feature_clusters = feature_clusters,
+                    normalisation = data_set.heat_map_normalisation,
+                    normalisation_constants = data_set.count_sum,
+                    x_name = data_set.tags["feature"].capitalize() + "s",
+                    y_name = data_set.tags["example"].capitalize() + "s",
+                    z_name = data_set.tags["value"].capitalize() + "s",
+                    z_symbol = "x",
+                    name = data_set.kind,
+                    export_options = export_options,
+                    results_directory = heat_maps_directory
+                )
+                
+                heat_maps_duration = time() - heat_maps_time_start
+                print("Heat map for {} set {} ({})."\
+                    .format(data_set.kind, renderingStatus(),
+                        formatDuration(heat_maps_duration)))
+                
+                print()
             
-            print()
-        
-        # Decompositions
-        
-        if "decompositions" in analyses:
+            # Decompositions
             
-            analyseDecompositions(
-                data_set,
-                decomposition_methods = decomposition_methods,
-                highlight_feature_indices = highlight_feature_indices,
-                symbol = "x",
-                title = "original space",
-                specifier = lambda data_set: data_set.kind,
-                analysis_level = analysis_level,
-                export_options = export_options,
-                results_directory = results_directory
-            )
+            if "decompositions" in analyses:
+                
+                analyseDecompositions(
+                    data_set,
+                    decomposition_methods = decomposition_methods,
+                    highlight_feature_indices = highlight_feature_indices,
+                    symbol = "x",
+                    title = "original space",
+                    specifier = lambda data_set: data_set.kind,
+                    analysis_level = analysis_level,
+                    export_options = export_options,
+                    results_directory = results_directory,
+                    cache_directory = cache_directory
+                )
 
 def analyseModel(model, analyses = ["default"], analysis_level = "normal",
     export_options = [], results_directory = "results"):
@@ -615,6 +648,254 @@ def analyseIntermediateResults(learning_curves = None, epoch_start = None,
         print("{} plotted and saved ({}).".format(
             latent_set_name.capitalize(), formatDuration(plot_duration)))
 
+# Data set for intermediate results set before forking worker processes, since
+# data sets include closures and cannot be sent to workers
+_intermediate_results_data_set = None
+
+def _analyseIntermediateResultsInWorker(arguments):
+    
+    if arguments["latent_values"] is not None:
+        arguments["data_set"] = _intermediate_results_data_set
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyseIntermediateResults(**arguments)
+    
+    return arguments["epoch"]
+
+def _initialiseIntermediateResultsWorker():
+    pyplot.switch_backend("Agg")
+
+class IntermediateResultsAnalyser(object):
+    """
+    Analyse intermediate results in a bounded pool of background processes.
+    
+    At most `number_of_workers` tasks are submitted at a time, and at most one
+    further task is kept waiting. A new task arriving when the pool is busy is
+    coalesced with the waiting one: The newest learning curves are used, and
+    the newest latent values supersede older ones, whose plots are dropped.
+    
+    The pool is forked before any TensorFlow session is created, so workers
+    inherit the data set used for colouring latent values. Used as a context
+    manager, the pool is closed on leaving it, also on errors.
+    """
+    
+    def __init__(self, data_set = None, number_of_workers = 1):
+        
+        global _intermediate_results_data_set
+        _intermediate_results_data_set = data_set
+        
+        self.number_of_workers = number_of_workers
+        
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(
+            processes = number_of_workers,
+            initializer = _initialiseIntermediateResultsWorker
+        )
+        
+        self.submitted_tasks = []
+        self.waiting_task = None
+        
+        self.number_of_submitted_tasks = 0
+        self.number_of_dropped_latent_plots = 0
+    
+    def analyse(self, learning_curves = None, epoch_start = None,
+        epoch = None, latent_values = None, data_set = None, centroids = None,
+        model_name = None, model_type = None, results_directory = "results"):
+        # Same arguments as `analyseIntermediateResults`, but `data_set` is
+        # ignored in favour of the one given when the pool was created.
+        
+        task = copy.deepcopy({
+            "learning_curves": learning_curves,
+            "epoch_start": epoch_start,
+            "epoch": epoch,
+            "latent_values": latent_values,
+            "centroids": centroids,
+            "model_name": model_name,
+            "model_type": model_type,
+            "results_directory": results_directory
+        })
+        
+        if self.waiting_task is not None:
+            if task["latent_values"] is None:
+                for key in ["epoch", "latent_values", "centroids"]:
+                    task[key] = self.waiting_task[key]
+            elif self.waiting_task["latent_values"] is not None:
+                self.number_of_dropped_latent_plots += 1
+        
+        self.waiting_task = task
+        
+        self._submitWaitingTask()
+        
+        print("Intermediate results queued for plotting.")
+    
+    def _collectFinishedTasks(self):
+        
+        unfinished_tasks = []
+        
+        for submitted_task in self.submitted_tasks:
+            if submitted_task.ready():
+                try:
+                    submitted_task.get()
+                except Exception as exception:
+                    print("Intermediate results could not be plotted:",
+                        exception)
+            else:
+                unfinished_tasks.append(submitted_task)
+        
+        self.submitted_tasks = unfinished_tasks
+    
+    def _submitWaitingTask(self):
+        
+        self._collectFinishedTasks()
+        
+        if self.waiting_task is not None \
+            and len(self.submitted_tasks) < self.number_of_workers:
+            
+            submitted_task = self.pool.apply_async(
+                _analyseIntermediateResultsInWorker,
+                (self.waiting_task,)
+            )
+            self.submitted_tasks.append(submitted_task)
+            self.waiting_task = None
+            self.number_of_submitted_tasks += 1
+    
+    def close(self):
+        
+        print("Finishing plotting of intermediate results.")
+        closing_time_start = time()
+        
+        while self.waiting_task is not None:
+            self.submitted_tasks[0].wait()
+            self._submitWaitingTask()
+        
+        self.pool.close()
+        self.pool.join()
+        self._collectFinishedTasks()
+        
+        closing_duration = time() - closing_time_start
+        print("Intermediate results plotted in {} tasks ({}).".format(
+            self.number_of_submitted_tasks, formatDuration(closing_duration)))
+        
+        if self.number_of_dropped_latent_plots:
+            print("{} latent-space plots dropped to keep up with training."\
+                .format(self.number_of_dropped_latent_plots))
+        
+        print()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception_details):
+        self.close()
+
+# Figure jobs set before forking worker processes, since their arguments can
+# include closures from data sets, which cannot be sent to workers
+_figure_jobs = []
+_figure_renderer = None
+
+def _renderFigureInWorker(job_index):
+    _renderFigure(*_figure_jobs[job_index])
+
+def _renderFigure(plotting_function, arguments, keyword_arguments,
+    export_options, results_directory):
+    figure, figure_name = plotting_function(*arguments, **keyword_arguments)
+    saveFigure(figure, figure_name, export_options, results_directory)
+
+def _initialiseFigureWorker():
+    pyplot.switch_backend("Agg")
+
+def renderFigure(plotting_function, *arguments, export_options = [],
+    results_directory = "results", **keyword_arguments):
+    # Plot a figure using `plotting_function` and save it, or queue this for
+    # the active figure renderer.
+    
+    job = (plotting_function, arguments, keyword_arguments, export_options,
+        results_directory)
+    
+    if _figure_renderer is not None:
+        _figure_renderer.jobs.append(job)
+    else:
+        _renderFigure(*job)
+
+def renderingStatus():
+    if _figure_renderer is not None:
+        return "queued for plotting"
+    else:
+        return "plotted and saved"
+
+class FigureRenderer(object):
+    """
+    Plot and save figures in a pool of forked processes.
+    
+    While the renderer is open, `renderFigure` queues figure jobs instead of
+    running them. When it is closed, the queued jobs are run by
+    `number_of_workers` processes using the Agg backend (one per CPU core if
+    `None`). Figure names only depend on the jobs, so figures are saved to
+    the same paths as when plotted one after another. With at most one
+    worker, figures are plotted in the current process as they are queued.
+    Used as a context manager, the renderer is closed on leaving it, also on
+    errors, so figures queued until then are still saved, and later figures
+    are not queued on a renderer that is never closed.
+    """
+    
+    def __init__(self, number_of_workers = None):
+        
+        global _figure_renderer
+        
+        if number_of_workers is None:
+            number_of_workers = multiprocessing.cpu_count()
+        
+        self.number_of_workers = number_of_workers
+        self.jobs = []
+        
+        if number_of_workers > 1:
+            _figure_renderer = self
+        else:
+            _figure_renderer = None
+    
+    def close(self):
+        
+        global _figure_renderer
+        
+        if _figure_renderer is self:
+            _figure_renderer = None
+        
+        if not self.jobs:
+            return
+        
+        number_of_jobs = len(self.jobs)
+        number_of_workers = min(self.number_of_workers, number_of_jobs)
+        
+        print("Plotting and saving {} figures using {} processes.".format(
+            number_of_jobs, number_of_workers))
+        rendering_time_start = time()
+        
+        _figure_jobs[:] = self.jobs
+        
+        try:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(
+                processes = number_of_workers,
+                initializer = _initialiseFigureWorker
+            ) as pool:
+                pool.map(_renderFigureInWorker, range(number_of_jobs),
+                    chunksize = 1)
+        finally:
+            _figure_jobs.clear()
+            self.jobs = []
+        
+        rendering_duration = time() - rendering_time_start
+        print("{} figures plotted and saved ({}).".format(
+            number_of_jobs, formatDuration(rendering_duration)))
+        
+        print()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception_details):
+        self.close()
+
 def analyseResults(evaluation_set, reconstructed_evaluation_set,
     latent_evaluation_sets, model,
     decomposition_methods = ["PCA"], evaluation_subset_indices = set(),
@@ -623,7 +904,9 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
     number_of_classes = None,
     early_stopping = False, best_model = False,
     analyses = ["default"], analysis_level = "normal",
-    export_options = [], results_directory = "results"):
+    metric_accumulators = None,
+    export_options = [], results_directory = "results",
+    cache_directory = None, number_of_figure_workers = 1):
     
     if early_stopping and best_model:
         raise ValueError("Early-stopping model and best model cannot be"
@@ -641,15 +924,6 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
     
     analyses = parseAnalyses(analyses)
     
-    ## Comparison arrays
-    
-    if ("metrics" in analyses or "heat_maps" in analyses) \
-        and analysis_level == "extensive":
-        
-        x_diff = reconstructed_evaluation_set.values - evaluation_set.values
-        x_log_ratio = numpy.log1p(reconstructed_evaluation_set.values) \
-            - numpy.log1p(evaluation_set.values)
-    
     ## Directory path
     
     evaluation_directory_parts = ["e_" + str(number_of_epochs_trained)]
@@ -708,30 +982,66 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
         print("Calculating metrics for results.")
         metrics_time_start = time()
         
-        evaluation_set_statistics = [
-            statistics(data_set.values, data_set.version, tolerance = 0.5)
-                for data_set in [evaluation_set, reconstructed_evaluation_set]
-        ]
-        
-        if analysis_level == "extensive":
-            evaluation_set_statistics.append(statistics(numpy.abs(x_diff),
-                "differences", skip_sparsity = True))
-            evaluation_set_statistics.append(statistics(numpy.abs(x_log_ratio),
-                "log-ratios", skip_sparsity = True))
-        
-        if evaluation_set.values.max() > 20:
-            count_accuracy_method = "orders of magnitude"
-        else:
-            count_accuracy_method = None
+        if metric_accumulators:
+            
+            statistics_names = {
+                "original": evaluation_set.version,
+                "reconstructed": reconstructed_evaluation_set.version,
+                "differences": "differences",
+                "log-ratios": "log-ratios"
+            }
+            
+            evaluation_set_statistics = []
+            
+            for kind, name in statistics_names.items():
+                if kind in metric_accumulators:
+                    statistics_set = metric_accumulators[kind].result()
+                    statistics_set["name"] = name
+                    evaluation_set_statistics.append(statistics_set)
+            
+            if "count accuracies" in metric_accumulators:
+                count_accuracies = \
+                    metric_accumulators["count accuracies"].result()
+            else:
+                count_accuracies = None
+            
+            if "classes" in metric_accumulators:
+                class_statistics = metric_accumulators["classes"].result()
+            else:
+                class_statistics = None
         
-        if analysis_level == "extensive":
-            count_accuracies = computeCountAccuracies(
-                evaluation_set.values,
-                reconstructed_evaluation_set.values,
-                method = count_accuracy_method
-            )
         else:
-            count_accuracies = None
+            
+            evaluation_set_statistics = [
+                statistics(data_set.values, data_set.version, tolerance = 0.5)
+                    for data_set in [evaluation_set,
+                        reconstructed_evaluation_set]
+            ]
+            
+            if analysis_level == "extensive":
+                for kind in ["differences", "log-ratios"]:
+                    evaluation_set_statistics.append(accumulateStatistics(
+                        evaluation_set.values,
+                        reconstructed_evaluation_set.values,
+                        values = kind,
+                        skip_sparsity = True
+                    ).result())
+            
+            if evaluation_set.values.max() > 20:
+                count_accuracy_method = "orders of magnitude"
+            else:
+                count_accuracy_method = None
+            
+            if analysis_level == "extensive":
+                count_accuracies = computeCountAccuracies(
+                    evaluation_set.values,
+                    reconstructed_evaluation_set.values,
+                    method = count_accuracy_method
+                )
+            else:
+                count_accuracies = None
+            
+            class_statistics = None
         
         if evaluation_set.has_labels:
             
@@ -832,6 +1142,9 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
                     .format(100 * superset_accuracy_eval[-1])
             metrics_string += "\n" \
                 + formatStatistics(evaluation_set_statistics) + "\n"
+            if class_statistics:
+                metrics_string += "\n" + formatStatistics(class_statistics,
+                    name = "Class") + "\n"
             if count_accuracies:
                 metrics_string += "\n" + \
                     formatCountAccuracies(count_accuracies) + "\n"
@@ -846,6 +1159,7 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
                 "superset_accuracy": superset_accuracy_eval,
                 "statistics": evaluation_set_statistics,
                 "count accuracies": count_accuracies,
+                "class statistics": class_statistics,
             }
             pickle.dump(metrics_dictionary, metrics_file)
         
@@ -943,367 +1257,413 @@ def analyseResults(evaluation_set, reconstructed_evaluation_set,
             print(formatCountAccuracies(count_accuracies))
             print()
     
-    # Reconstructions
-    
-    if "images" in analyses and \
-        reconstructed_evaluation_set.example_type == "images" \
-        or "profile_comparisons" in analyses:
-        
-        print(subheading("Reconstructions"))
-    
-    ## Examples
-    
-    if "images" in analyses and \
-        reconstructed_evaluation_set.example_type == "images":
-        
-        print("Saving image of {} random examples".format(
-            number_of_random_examples),
-            "from reconstructed {} set.".format(
-                evaluation_set.kind
-            ))
-        image_time_start = time()
-        image, image_name = combineImagesFromDataSet(
-            reconstructed_evaluation_set,
-            number_of_random_examples,
-            name = reconstructed_evaluation_set.version
-        )
-        saveImage(image, image_name, results_directory)
-        image_duration = time() - image_time_start
-        print("Image saved ({}).".format(formatDuration(image_duration)))
-        print()
-
-    ## Profile comparisons
+    # Figures from the following analyses are queued and, with several
+    # workers, plotted in parallel at the end
     
-    if "profile_comparisons" in analyses:
+    with FigureRenderer(number_of_figure_workers):
         
-        print("Plotting profile comparisons.")
+        # Reconstructions
         
-        image_comparisons_directory = os.path.join(
-                results_directory, "image_comparisons")
-        
-        profile_comparisons_directory = os.path.join(
-                results_directory, "profile_comparisons")
+        if "images" in analyses and \
+            reconstructed_evaluation_set.example_type == "images" \
+            or "profile_comparisons" in analyses:
+            
+            print(subheading("Reconstructions"))
         
-        profile_comparisons_time_start = time()
+        ## Examples
         
-        y_cutoff = profile_comparison_count_cut_off
+        if "images" in analyses and \
+            reconstructed_evaluation_set.example_type == "images":
+            
+            print("Saving image of {} random examples".format(
+                number_of_random_examples),
+                "from reconstructed {} set.".format(
+                    evaluation_set.kind
+                ))
+            image_time_start = time()
+            image, image_name = combineImagesFromDataSet(
+                reconstructed_evaluation_set,
+                number_of_random_examples,
+                name = reconstructed_evaluation_set.version
+            )
+            saveImage(image, image_name, results_directory)
+            image_duration = time() - image_time_start
+            print("Image saved ({}).".format(formatDuration(image_duration)))
+            print()
+
+        ## Profile comparisons
         
-        for i in evaluation_subset_indices:
+        if "profile_comparisons" in analyses:
             
-            observed_series = evaluation_set.values[i]
-            expected_series = reconstructed_evaluation_set.values[i]
-            example_name = str(evaluation_set.example_names[i])
+            print("Plotting profile comparisons.")
             
-            if evaluation_set.has_labels:
-                example_label = str(evaluation_set.labels[i])
+            image_comparisons_directory = os.path.join(
+                    results_directory, "image_comparisons")
             
-            if reconstructed_evaluation_set.total_standard_deviations \
-                is not None:
-                expected_series_total_standard_deviations = \
-                    reconstructed_evaluation_set.total_standard_deviations[i]
-            else:
-                expected_series_total_standard_deviations = None
+            profile_comparisons_directory = os.path.join(
+                    results_directory, "profile_comparisons")
             
-            if reconstructed_evaluation_set.explained_standard_deviations \
-                is not None:
-                
-                expected_series_explained_standard_deviations = \
-                    reconstructed_evaluation_set.explained_standard_deviations[i]
-            else:
-                expected_series_explained_standard_deviations = None
+            profile_comparisons_time_start = time()
             
-            maximum_count = max(observed_series.max(), expected_series.max())
+            y_cutoff = profile_comparison_count_cut_off
             
-            if evaluation_set.has_labels:
-                example_name_base_parts = [example_name, example_label]
-            else:
-                example_name_base_parts = [example_name]
-            
-            for sort_profile_comparison in [True, False]:
-                for y_scale in ["linear"]:
-                    example_name_parts = example_name_base_parts.copy()
-                    example_name_parts.append(y_scale)
-                    if sort_profile_comparison:
-                        sort_name_part = "sorted"
-                    else:
-                        sort_name_part = "unsorted"
-                    example_name_parts.append(sort_name_part)
-                    figure, figure_name = plotProfileComparison(
-                        observed_series,
-                        expected_series,
-                        expected_series_total_standard_deviations,
-                        expected_series_explained_standard_deviations,
-                        x_name = evaluation_set.tags["feature"],
-                        y_name = evaluation_set.tags["value"],
-                        sort = sort_profile_comparison,
-                        sort_by = "expected",
-                        sort_direction = "descending",
-                        x_scale = "log",
-                        y_scale = y_scale,
+            for i in evaluation_subset_indices:
+                
+                observed_series = evaluation_set.values[i]
+                expected_series = reconstructed_evaluation_set.values[i]
+                example_name = str(evaluation_set.example_names[i])
+                
+                if evaluation_set.has_labels:
+                    example_label = str(evaluation_set.labels[i])
+                
+                if reconstructed_evaluation_set.total_standard_deviations \
+                    is not None:
+                    expected_series_total_standard_deviations = \
+                        reconstructed_evaluation_set\
+                        .total_standard_deviations[i]
+                else:
+                    expected_series_total_standard_deviations = None
+                
+                if reconstructed_evaluation_set.explained_standard_deviations \
+                    is not None:
+                    
+                    expected_series_explained_standard_deviations = \
+                        reconstructed_evaluation_set\
+                        .explained_standard_deviations[i]
+                else:
+                    expected_series_explained_standard_deviations = None
+                
+                maximum_count = max(observed_series.max(),
+                    expected_series.max())
+                
+                if evaluation_set.has_labels:
+                    example_name_base_parts = [example_name, example_label]
+                else:
+                    example_name_base_parts = [example_name]
+                
+                for sort_profile_comparison in [True, False]:
+                    for y_scale in ["linear"]:
+                        example_name_parts = example_name_base_parts.copy()
+                        example_name_parts.append(y_scale)
+                        if sort_profile_comparison:
+                            sort_name_part = "sorted"
+                        else:
+                            sort_name_part = "unsorted"
+                        example_name_parts.append(sort_name_part)
+                        renderFigure(
+                            plotProfileComparison,
+                            observed_series,
+                            expected_series,
+                            expected_series_total_standard_deviations,
+                            expected_series_explained_standard_deviations,
+                            x_name = evaluation_set.tags["feature"],
+                            y_name = evaluation_set.tags["value"],
+                            sort = sort_profile_comparison,
+                            sort_by = "expected",
+                            sort_direction = "descending",
+                            x_scale = "log",
+                            y_scale = y_scale,
+                            name = example_name_parts,
+                            export_options = export_options,
+                            results_directory = profile_comparisons_directory
+                        )
+                
+                if maximum_count > 3 * y_cutoff:
+                    for y_scale in ["linear", "log", "both"]:
+                        example_name_parts = example_name_base_parts.copy()
+                        example_name_parts.append("cutoff")
+                        example_name_parts.append(y_scale)
+                        renderFigure(
+                            plotProfileComparison,
+                            observed_series,
+                            expected_series,
+                            expected_series_total_standard_deviations,
+                            expected_series_explained_standard_deviations,
+                            x_name = evaluation_set.tags["feature"],
+                            y_name = evaluation_set.tags["value"],
+                            sort = True,
+                            sort_by = "expected",
+                            sort_direction = "descending",
+                            x_scale = "log",
+                            y_scale = y_scale,
+                            y_cutoff = y_cutoff,
+                            name = example_name_parts,
+                            export_options = export_options,
+                            results_directory = profile_comparisons_directory
+                        )
+                
+                # Plot image examples for subset
+                if evaluation_set.example_type == "images":
+                    example_name_parts = ["original"] + example_name_base_parts
+                    image, image_name = combineImagesFromDataSet(
+                        evaluation_set,
+                        number_of_random_examples = 1,
+                        indices = [i],
                         name = example_name_parts
                     )
-                    saveFigure(figure, figure_name, export_options,
-                        profile_comparisons_directory)
-            
-            if maximum_count > 3 * y_cutoff:
-                for y_scale in ["linear", "log", "both"]:
-                    example_name_parts = example_name_base_parts.copy()
-                    example_name_parts.append("cutoff")
-                    example_name_parts.append(y_scale)
-                    figure, figure_name = plotProfileComparison(
-                        observed_series,
-                        expected_series,
-                        expected_series_total_standard_deviations,
-                        expected_series_explained_standard_deviations,
-                        x_name = evaluation_set.tags["feature"],
-                        y_name = evaluation_set.tags["value"],
-                        sort = True,
-                        sort_by = "expected",
-                        sort_direction = "descending",
-                        x_scale = "log",
-                        y_scale = y_scale,
-                        y_cutoff = y_cutoff,
+                    saveImage(image, image_name, image_comparisons_directory)
+                
+                if reconstructed_evaluation_set.example_type == "images":
+                    example_name_parts = ["reconstructed"] \
+                        + example_name_base_parts
+                    image, image_name = combineImagesFromDataSet(
+                        reconstructed_evaluation_set,
+                        number_of_random_examples = 1,
+                        indices = [i],
                         name = example_name_parts
                     )
-                    saveFigure(figure, figure_name, export_options,
-                        profile_comparisons_directory)
-            
-            # Plot image examples for subset
-            if evaluation_set.example_type == "images":
-                example_name_parts = ["original"] + example_name_base_parts
-                image, image_name = combineImagesFromDataSet(
-                    evaluation_set,
-                    number_of_random_examples = 1,
-                    indices = [i],
-                    name = example_name_parts
-                )
-                saveImage(image, image_name, image_comparisons_directory)
+                    saveImage(image, image_name, image_comparisons_directory)
+                
+                if analysis_level == "limited":
+                    break
             
-            if reconstructed_evaluation_set.example_type == "images":
-                example_name_parts = ["reconstructed"] + example_name_base_parts
-                image, image_name = combineImagesFromDataSet(
-                    reconstructed_evaluation_set,
-                    number_of_random_examples = 1,
-                    indices = [i],
-                    name = example_name_parts
-                )
-                saveImage(image, image_name, image_comparisons_directory)
+            profile_comparisons_duration = \
+                time() - profile_comparisons_time_start
+            print("Profile comparisons {} ({}).".format(
+                renderingStatus(),
+                formatDuration(profile_comparisons_duration)))
             
-            if analysis_level == "limited":
-                break
-        
-        profile_comparisons_duration = time() - profile_comparisons_time_start
-        print("Profile comparisons plotted and saved ({}).".format(
-            formatDuration(profile_comparisons_duration)))
-        
-        print()
-    
-    # Distributions
-    
-    evaluation_set_maximum_value = evaluation_set.values.max()
-    
-    if "distributions" in analyses:
-        
-        analyseDistributions(
-            reconstructed_evaluation_set,
-            colouring_data_set = evaluation_set,
-            preprocessed = evaluation_set.preprocessing_methods,
-            original_maximum_count = evaluation_set_maximum_value,
-            analysis_level = analysis_level,
-            export_options = export_options,
-            results_directory = results_directory
-        )
-    
-    ## Reconstructions decomposed
-    
-    if "decompositions" in analyses:
-        
-        analyseDecompositions(
-            reconstructed_evaluation_set,
-            colouring_data_set = evaluation_set,
-            decomposition_methods = decomposition_methods,
-            highlight_feature_indices = highlight_feature_indices,
-            prediction_method = prediction_method,
-            number_of_classes = number_of_classes,
-            symbol = "\\tilde{{x}}",
-            pca_limits = evaluation_set.pca_limits,
-            title = "reconstruction space",
-            analysis_level = analysis_level,
-            export_options = export_options,
-            results_directory = results_directory,
-        )
-        
-        ## Reconstructions plotted in original decomposed space
-        
-        analyseDecompositions(
-            evaluation_set,
-            reconstructed_evaluation_set,
-            colouring_data_set = evaluation_set,
-            decomposition_methods = decomposition_methods,
-            highlight_feature_indices = highlight_feature_indices,
-            prediction_method = prediction_method,
-            number_of_classes = number_of_classes,
-            symbol = "x",
-            pca_limits = evaluation_set.pca_limits,
-            title = "original space",
-            analysis_level = analysis_level,
-            export_options = export_options,
-            results_directory = results_directory,
-        )
-    
-    # Heat maps
-    
-    if "heat_maps" in analyses and \
-        reconstructed_evaluation_set.number_of_values \
-        <= maximum_number_of_values_for_heat_maps:
-        
-        print("Plotting heat maps.")
-        
-        heat_maps_directory = os.path.join(results_directory, "heat_maps")
-        
-        ## Reconstructions
+            print()
         
-        heat_maps_time_start = time()
+        # Distributions
         
-        figure, figure_name = plotHeatMap(
-            reconstructed_evaluation_set.values,
-            labels = reconstructed_evaluation_set.labels,
-            normalisation =
-                reconstructed_evaluation_set.heat_map_normalisation,
-            normalisation_constants = evaluation_set.count_sum,
-            x_name = evaluation_set.tags["feature"].capitalize() + "s",
-            y_name = evaluation_set.tags["example"].capitalize() + "s",
-            z_name = evaluation_set.tags["value"].capitalize() + "s",
-            z_symbol = "\\tilde{{x}}",
-            name = "reconstruction"
-        )
-        saveFigure(figure, figure_name, export_options, heat_maps_directory)
+        evaluation_set_maximum_value = evaluation_set.values.max()
         
-        heat_maps_duration = time() - heat_maps_time_start
-        print("    Reconstruction heat map plotted and saved ({})." \
-            .format(formatDuration(heat_maps_duration)))
+        if "distributions" in analyses:
+            
+            analyseDistributions(
+                reconstructed_evaluation_set,
+                colouring_data_set = evaluation_set,
+                preprocessed = evaluation_set.preprocessing_methods,
+                original_maximum_count = evaluation_set_maximum_value,
+                analysis_level = analysis_level,
+                export_options = export_options,
+                results_directory = results_directory
+            )
         
-        ## Differences
+        ## Reconstructions decomposed
         
-        if analysis_level == "extensive":
-            heat_maps_time_start = time()
+        if "decompositions" in analyses:
             
-            figure, figure_name = plotHeatMap(
-                x_diff,
-                labels = reconstructed_evaluation_set.labels,
-                x_name = evaluation_set.tags["feature"].capitalize() + "s",
-                y_name = evaluation_set.tags["example"].capitalize() + "s",
-                z_name = "Differences",
-                z_symbol = "\\tilde{{x}} - x",
-                name = "difference",
-                center = 0
+            analyseDecompositions(
+                reconstructed_evaluation_set,
+                colouring_data_set = evaluation_set,
+                decomposition_methods = decomposition_methods,
+                highlight_feature_indices = highlight_feature_indices,
+                prediction_method = prediction_method,
+                number_of_classes = number_of_classes,
+                symbol = "\\tilde{{x}}",
+                pca_limits = evaluation_set.pca_limits,
+                title = "reconstruction space",
+                analysis_level = analysis_level,
+                export_options = export_options,
+                results_directory = results_directory,
+                cache_directory = cache_directory
             )
-            saveFigure(figure, figure_name, export_options, heat_maps_directory)
             
-            heat_maps_duration = time() - heat_maps_time_start
-            print("    Difference heat map plotted and saved ({})." \
-                .format(formatDuration(heat_maps_duration)))
-    
-        ## log-ratios
+            ## Reconstructions plotted in original decomposed space
+            
+            analyseDecompositions(
+                evaluation_set,
+                reconstructed_evaluation_set,
+                colouring_data_set = evaluation_set,
+                decomposition_methods = decomposition_methods,
+                highlight_feature_indices = highlight_feature_indices,
+                prediction_method = prediction_method,
+                number_of_classes = number_of_classes,
+                symbol = "x",
+                pca_limits = evaluation_set.pca_limits,
+                title = "original space",
+                analysis_level = analysis_level,
+                export_options = export_options,
+                results_directory = results_directory,
+                cache_directory = cache_directory
+            )
         
-        if analysis_level == "extensive":
+        # Heat maps
+        
+        if "heat_maps" in analyses:
+            
+            print("Plotting heat maps.")
+            
+            heat_maps_directory = os.path.join(results_directory, "heat_maps")
+            
+            ## Feature clusters (shared by all heat maps)
+            
+            if reconstructed_evaluation_set.labels is not None \
+                and analysis_level == "extensive":
+                feature_clusters = classFeatureClusters(
+                    evaluation_set.values,
+                    reconstructed_evaluation_set.labels,
+                    evaluation_set.label_sorter
+                )
+            else:
+                feature_clusters = None
+            
+            ## Reconstructions
+            
             heat_maps_time_start = time()
             
-            figure, figure_name = plotHeatMap(
-                x_log_ratio,
+            renderFigure(
+                plotHeatMap,
+                reconstructed_evaluation_set.values,
                 labels = reconstructed_evaluation_set.labels,
+                label_sorter = evaluation_set.label_sorter,
+                feature_clusters = feature_clusters,
+                normalisation =
+                    reconstructed_evaluation_set.heat_map_normalisation,
+                normalisation_constants = evaluation_set.count_sum,
                 x_name = evaluation_set.tags["feature"].capitalize() + "s",
                 y_name = evaluation_set.tags["example"].capitalize() + "s",
-                z_name = "log-ratios",
-                z_symbol = "\\log \\frac{{\\tilde{{x}} + 1}}{{x + 1}}",
-                name = "log_ratio",
-                center = 0
+                z_name = evaluation_set.tags["value"].capitalize() + "s",
+                z_symbol = "\\tilde{{x}}",
+                name = "reconstruction",
+                export_options = export_options,
+                results_directory = heat_maps_directory
             )
-            saveFigure(figure, figure_name, export_options, heat_maps_directory)
             
             heat_maps_duration = time() - heat_maps_time_start
-            print("    log-ratio heat map plotted and saved ({})." \
-                .format(formatDuration(heat_maps_duration)))
-    
-    print()
-    
-    # Latent space
-    
-    if "latent_space" in analyses and "VAE" in model.type:
-        
-        print(subheading("Latent space"))
-        
-        if model.latent_distribution_name == "gaussian_mixture":
-        
-            print("Loading centroids from model log directory.")
-            loading_time_start = time()
+            print("    Reconstruction heat map {} ({})." \
+                .format(renderingStatus(), formatDuration(heat_maps_duration)))
             
-            centroids = loadCentroids(model, data_set_kinds = "evaluation",
-                early_stopping = early_stopping, best_model = best_model)
+            ## Differences
             
-            loading_duration = time() - loading_time_start
-            print("Centroids loaded ({}).".format(
-                formatDuration(loading_duration)))
-            print()
-        
-        else:
-            centroids = None
-        
-        analyseDecompositions(
-            latent_evaluation_sets,
-            centroids = centroids,
-            colouring_data_set = evaluation_set,
-            decomposition_methods = decomposition_methods,
-            highlight_feature_indices = highlight_feature_indices,
-            prediction_method = prediction_method,
-            number_of_classes = number_of_classes,
-            title = "latent space",
-            specifier = lambda data_set: data_set.version,
-            analysis_level = analysis_level,
-            export_options = export_options,
-            results_directory = results_directory,
-        )
+            if analysis_level == "extensive":
+                heat_maps_time_start = time()
+                
+                renderFigure(
+                    plotHeatMap,
+                    reconstructed_evaluation_set.values,
+                    reference_values = evaluation_set.values,
+                    comparison = "difference",
+                    labels = reconstructed_evaluation_set.labels,
+                    label_sorter = evaluation_set.label_sorter,
+                    feature_clusters = feature_clusters,
+                    x_name = evaluation_set.tags["feature"].capitalize() + "s",
+                    y_name = evaluation_set.tags["example"].capitalize() + "s",
+                    z_name = "Differences",
+                    z_symbol = "\\tilde{{x}} - x",
+                    name = "difference",
+                    center = 0,
+                    export_options = export_options,
+                    results_directory = heat_maps_directory
+                )
+                
+                heat_maps_duration = time() - heat_maps_time_start
+                print("    Difference heat map {} ({})." \
+                    .format(renderingStatus(),
+                        formatDuration(heat_maps_duration)))
         
-        if centroids:
-            analyseCentroidProbabilities(
-                centroids,
-                analysis_level = "normal",
-                results_directory = results_directory
-            )
+            ## log-ratios
             
-            print()
-    
-    # Latent correlations
-    
-    if "latent_correlations" in analyses and "VAE" in model.type:
-        
-        print(subheading("Latent correlations"))
+            if analysis_level == "extensive":
+                heat_maps_time_start = time()
+                
+                renderFigure(
+                    plotHeatMap,
+                    reconstructed_evaluation_set.values,
+                    reference_values = evaluation_set.values,
+                    comparison = "log_ratio",
+                    labels = reconstructed_evaluation_set.labels,
+                    label_sorter = evaluation_set.label_sorter,
+                    feature_clusters = feature_clusters,
+                    x_name = evaluation_set.tags["feature"].capitalize() + "s",
+                    y_name = evaluation_set.tags["example"].capitalize() + "s",
+                    z_name = "log-ratios",
+                    z_symbol = "\\log \\frac{{\\tilde{{x}} + 1}}{{x + 1}}",
+                    name = "log_ratio",
+                    center = 0,
+                    export_options = export_options,
+                    results_directory = heat_maps_directory
+                )
+                
+                heat_maps_duration = time() - heat_maps_time_start
+                print("    log-ratio heat map {} ({})." \
+                    .format(renderingStatus(),
+                        formatDuration(heat_maps_duration)))
         
-        correlations_directory = os.path.join(results_directory,
-            "latent_correlations")
+        print()
         
-        print("Plotting latent correlations.")
+        # Latent space
         
-        for set_name in latent_evaluation_sets:
-            correlations_time_start = time()
+        if "latent_space" in analyses and "VAE" in model.type:
+            
+            print(subheading("Latent space"))
+            
+            if model.latent_distribution_name == "gaussian_mixture":
             
-            latent_evaluation_set = latent_evaluation_sets[set_name]
-            figure, figure_name = plotVariableCorrelations(
-                latent_evaluation_set.values,
-                latent_evaluation_set.feature_names,
-                latent_evaluation_set,
-                name = ["latent correlations", set_name]
+                print("Loading centroids from model log directory.")
+                loading_time_start = time()
+                
+                centroids = loadCentroids(model, data_set_kinds = "evaluation",
+                    early_stopping = early_stopping, best_model = best_model)
+                
+                loading_duration = time() - loading_time_start
+                print("Centroids loaded ({}).".format(
+                    formatDuration(loading_duration)))
+                print()
+            
+            else:
+                centroids = None
+            
+            analyseDecompositions(
+                latent_evaluation_sets,
+                centroids = centroids,
+                colouring_data_set = evaluation_set,
+                decomposition_methods = decomposition_methods,
+                highlight_feature_indices = highlight_feature_indices,
+                prediction_method = prediction_method,
+                number_of_classes = number_of_classes,
+                title = "latent space",
+                specifier = lambda data_set: data_set.version,
+                analysis_level = analysis_level,
+                export_options = export_options,
+                results_directory = results_directory,
+                cache_directory = cache_directory
             )
-            saveFigure(figure, figure_name, export_options,
-                correlations_directory)
             
-            correlations_duration = time() - correlations_time_start
-            print("    Latent correlations for {} plotted ({}).".format(
-                set_name,
-                formatDuration(correlations_duration)
-            ))
+            if centroids:
+                analyseCentroidProbabilities(
+                    centroids,
+                    analysis_level = "normal",
+                    results_directory = results_directory
+                )
+                
+                print()
         
-        print()
+        # Latent correlations
+        
+        if "latent_correlations" in analyses and "VAE" in model.type:
+            
+            print(subheading("Latent correlations"))
+            
+            correlations_directory = os.path.join(results_directory,
+                "latent_correlations")
+            
+            print("Plotting latent correlations.")
+            
+            for set_name in latent_evaluation_sets:
+                correlations_time_start = time()
+                
+                latent_evaluation_set = latent_evaluation_sets[set_name]
+                renderFigure(
+                    plotVariableCorrelations,
+                    latent_evaluation_set.values,
+                    latent_evaluation_set.feature_names,
+                    latent_evaluation_set,
+                    name = ["latent correlations", set_name],
+                    export_options = export_options,
+                    results_directory = correlations_directory
+                )
+                
+                correlations_duration = time() - correlations_time_start
+                print("    Latent correlations for {} {} ({}).".format(
+                    set_name,
+                    renderingStatus(),
+                    formatDuration(correlations_duration)
+                ))
+            
+            print()
 
 def analyseDistributions(data_set, colouring_data_set = None,
     cutoffs = None, preprocessed = False, original_maximum_count = None,
@@ -1330,7 +1690,12 @@ def analyseDistributions(data_set, colouring_data_set = None,
     
     data_set_discreteness = data_set.discreteness and not preprocessed
     
-    ## Maximum values for count histograms
+    ## Range of values and maximum values for count histograms
+    
+    minimum_value, maximum_value = storedValueRange(data_set.values)
+    
+    if minimum_value is None:
+        minimum_value, maximum_value = 0, 0
     
     maximum_counts = {0: None}
     
@@ -1338,16 +1703,98 @@ def analyseDistributions(data_set, colouring_data_set = None,
         
         for maximum_count_scale in maximum_count_scales:
             
-            maximum_count_indcises = data_set.values \
-                <= maximum_count_scale * original_maximum_count
+            maximum_count_bound = maximum_count_scale * original_maximum_count
             
-            number_of_outliers = data_set.number_of_values \
-                - maximum_count_indcises.sum()
-            
-            if number_of_outliers:
-                maximum_count = numpy.ceil(
-                    data_set.values[maximum_count_indcises].max())
-                maximum_counts[maximum_count_scale] = maximum_count
+            if maximum_value > maximum_count_bound:
+                maximum_count = storedValueRange(data_set.values,
+                    maximum = maximum_count_bound)[1]
+                if maximum_count is not None:
+                    maximum_counts[maximum_count_scale] = numpy.ceil(
+                        maximum_count)
+    
+    ## Classes
+    
+    class_histograms = analysis_level == "extensive" \
+        and colouring_data_set.labels is not None
+    
+    if class_histograms:
+        
+        if colouring_data_set.label_superset:
+            labels = colouring_data_set.superset_labels
+            class_names = colouring_data_set.superset_class_names
+            class_palette = colouring_data_set.superset_class_palette
+            label_sorter = colouring_data_set.superset_label_sorter
+        else:
+            labels = colouring_data_set.labels
+            class_names = colouring_data_set.class_names
+            class_palette = colouring_data_set.class_palette
+            label_sorter = colouring_data_set.label_sorter
+        
+        if not class_palette:
+            index_palette = lighter_palette(colouring_data_set.number_of_classes)
+            class_palette = {class_name: index_palette[i] for i, class_name in
+                             enumerate(sorted(class_names,
+                             key = label_sorter))}
+        
+        # Examples with labels not among the class names are assigned to an
+        # extra group, which is only included in the overall histograms.
+        
+        class_indices = {
+            class_name: i for i, class_name in enumerate(class_names)}
+        label_names, label_indices = numpy.unique(labels,
+            return_inverse = True)
+        groups = numpy.array([
+            class_indices.get(label_name, len(class_names))
+            for label_name in label_names
+        ])[label_indices]
+        number_of_groups = len(class_names) + 1
+        class_sizes = numpy.bincount(groups, minlength = number_of_groups)
+    
+    else:
+        groups = None
+        number_of_groups = 1
+    
+    ## Histograms
+    
+    # Histograms of values, cut-off counts, and count sums for all classes
+    # are computed together in one pass over batches of examples, and only
+    # the binned counts are plotted.
+    
+    print("Computing histograms for {}.".format(data_set_title))
+    histograms_time_start = time()
+    
+    count_bin_edge_sets = [
+        histogramBinEdges(
+            minimum_value,
+            maximum_count if maximum_count else maximum_value,
+            discrete = data_set_discreteness
+        )
+        for maximum_count in maximum_counts.values()
+    ]
+    
+    cutoff_histograms = analysis_level == "extensive" and cutoffs \
+        and data_set.example_type == "counts"
+    
+    if cutoff_histograms:
+        maximum_cutoff = max(cutoffs)
+        count_bin_edge_sets.append(numpy.append(
+            numpy.arange(maximum_cutoff + 1) - 0.5, numpy.inf))
+    
+    count_sum_bin_edges = histogramBinEdges(
+        data_set.count_sum.min(), data_set.count_sum.max())
+    
+    count_histograms, (count_sum_histogram,) = accumulateHistograms(
+        [
+            (data_set.values, count_bin_edge_sets),
+            (data_set.count_sum, [count_sum_bin_edges])
+        ],
+        groups = groups,
+        number_of_groups = number_of_groups
+    )
+    
+    histograms_duration = time() - histograms_time_start
+    print("Histograms computed ({}).".format(
+        formatDuration(histograms_duration)))
     
     # Plotting
     
@@ -1360,53 +1807,51 @@ def analyseDistributions(data_set, colouring_data_set = None,
         
         distribution_time_start = time()
         
-        figure, figure_name = plotClassHistogram(
+        renderFigure(
+            plotClassHistogram,
             labels = data_set.labels,
             class_names = data_set.class_names,
             class_palette = data_set.class_palette,
             normed = True,
             scale = "linear",
             label_sorter = data_set.label_sorter,
-            name = data_set_name
+            name = data_set_name,
+            export_options = export_options,
+            results_directory = distribution_directory
         )
-        saveFigure(figure, figure_name, export_options, distribution_directory)
         
         distribution_duration = time() - distribution_time_start
-        print("    Class distribution plotted and saved ({})."\
-            .format(formatDuration(distribution_duration)))
+        print("    Class distribution {} ({})."\
+            .format(renderingStatus(), formatDuration(distribution_duration)))
     
     if data_set.label_superset and colouring_data_set == data_set:
         
         distribution_time_start = time()
         
-        figure, figure_name = plotClassHistogram(
+        renderFigure(
+            plotClassHistogram,
             labels = data_set.superset_labels,
             class_names = data_set.superset_class_names,
             class_palette = data_set.superset_class_palette,
             normed = True,
             scale = "linear",
             label_sorter = data_set.superset_label_sorter,
-            name = [data_set_name, "superset"]
+            name = [data_set_name, "superset"],
+            export_options = export_options,
+            results_directory = distribution_directory
         )
-        saveFigure(figure, figure_name, export_options, distribution_directory)
         
         distribution_duration = time() - distribution_time_start
-        print("    Superset class distribution plotted and saved ({})."\
-            .format(formatDuration(distribution_duration)))
+        print("    Superset class distribution {} ({})."\
+            .format(renderingStatus(), formatDuration(distribution_duration)))
     
     ## Count distribution
     
-    if scipy.sparse.issparse(data_set.values):
-        series = data_set.values.data
-        excess_zero_count = data_set.values.size - series.size
-    else:
-        series = data_set.values.reshape(-1)
-        excess_zero_count = 0
-    
-    for maximum_count_scale, maximum_count in maximum_counts.items():
+    for (maximum_count_scale, maximum_count), count_histogram in zip(
+        maximum_counts.items(), count_histograms):
         
         distribution_time_start = time()
-            
+        
         if maximum_count:
             count_histogram_name = [
                 "counts",
@@ -1417,20 +1862,22 @@ def analyseDistributions(data_set, colouring_data_set = None,
         else:
             count_histogram_name = ["counts", data_set_name]
         
+        histogram, number_of_outliers = count_histogram.histogram()
+        
         for x_scale in ["linear", "log"]:
-            figure, figure_name = plotHistogram(
-                series = series,
-                excess_zero_count = excess_zero_count,
+            renderFigure(
+                plotHistogram,
+                histogram = histogram,
+                bin_edges = count_histogram.bin_edges,
+                number_of_outliers = number_of_outliers,
                 label = data_set.tags["value"].capitalize() + "s",
-                discrete = data_set_discreteness,
                 normed = True,
                 x_scale = x_scale,
                 y_scale = "log",
-                maximum_count = maximum_count,
-                name = count_histogram_name
+                name = count_histogram_name,
+                export_options = export_options,
+                results_directory = distribution_directory
             )
-            saveFigure(figure, figure_name, export_options,
-                distribution_directory)
         
         if maximum_count:
             maximum_count_string = " (with a maximum count of {:d})".format(
@@ -1439,141 +1886,130 @@ def analyseDistributions(data_set, colouring_data_set = None,
             maximum_count_string = ""
         
         distribution_duration = time() - distribution_time_start
-        print("    Count distribution{} plotted and saved ({})."\
+        print("    Count distribution{} {} ({})."\
             .format(maximum_count_string,
-                formatDuration(distribution_duration)))
+                renderingStatus(), formatDuration(distribution_duration)))
     
     ## Count distributions with cut-off
 
-    if analysis_level == "extensive" and cutoffs and \
-        data_set.example_type == "counts":
+    if cutoff_histograms:
         
         distribution_time_start = time()
+        
+        histogram, _ = count_histograms[-1].histogram()
 
         for cutoff in cutoffs:
-            figure, figure_name = plotCutOffCountHistogram(
-                series = series,
-                excess_zero_count = excess_zero_count,
+            renderFigure(
+                plotCutOffCountHistogram,
+                histogram = numpy.append(histogram[:cutoff],
+                    histogram[cutoff:].sum()),
                 cutoff = cutoff,
                 normed = True,
                 scale = "log",
-                name = data_set_name
+                name = data_set_name,
+                export_options = export_options,
+                results_directory = distribution_directory + "-counts"
             )
-            saveFigure(figure, figure_name, export_options,
-                distribution_directory + "-counts")
 
         distribution_duration = time() - distribution_time_start
-        print("    Count distributions with cut-offs plotted and saved ({})."\
-            .format(formatDuration(distribution_duration)))
+        print("    Count distributions with cut-offs {} ({})."\
+            .format(renderingStatus(), formatDuration(distribution_duration)))
     
     ## Count sum distribution
     
     distribution_time_start = time()
     
-    figure, figure_name = plotHistogram(
-        series = data_set.count_sum,
+    histogram, number_of_outliers = count_sum_histogram.histogram()
+    
+    renderFigure(
+        plotHistogram,
+        histogram = histogram,
+        bin_edges = count_sum_histogram.bin_edges,
+        number_of_outliers = number_of_outliers,
         label = "Total number of {}s per {}".format(
             data_set.tags["item"], data_set.tags["example"]
         ),
         normed = True,
         y_scale = "log",
-        name = ["count sum", data_set_name]
+        name = ["count sum", data_set_name],
+        export_options = export_options,
+        results_directory = distribution_directory
     )
-    saveFigure(figure, figure_name, export_options, distribution_directory)
     
     distribution_duration = time() - distribution_time_start
-    print("    Count sum distribution plotted and saved ({})."\
-        .format(formatDuration(distribution_duration)))
+    print("    Count sum distribution {} ({})."\
+        .format(renderingStatus(), formatDuration(distribution_duration)))
     
     ## Count distributions and count sum distributions for each class
     
-    if analysis_level == "extensive" and colouring_data_set.labels is not None:
+    if class_histograms:
         
         class_count_distribution_directory = distribution_directory
         
         if data_set.version == "original":
             class_count_distribution_directory += "-classes"
         
-        if colouring_data_set.label_superset:
-            labels = colouring_data_set.superset_labels
-            class_names = colouring_data_set.superset_class_names
-            class_palette = colouring_data_set.superset_class_palette
-            label_sorter = colouring_data_set.superset_label_sorter
-        else:
-            labels = colouring_data_set.labels
-            class_names = colouring_data_set.class_names
-            class_palette = colouring_data_set.class_palette
-            label_sorter = colouring_data_set.label_sorter
-        
-        N = colouring_data_set.number_of_features
-        
         distribution_time_start = time()
         
-        if not class_palette:
-            index_palette = lighter_palette(colouring_data_set.number_of_classes)
-            class_palette = {class_name: index_palette[i] for i, class_name in
-                             enumerate(sorted(class_names,
-                             key = label_sorter))}
-
-        for class_name in class_names:
-            
-            class_indices = labels == class_name
+        for i, class_name in enumerate(class_names):
             
-            if not class_indices.any():
+            if not class_sizes[i]:
                 continue
             
-            values_label = data_set.values[class_indices]
-            
-            if scipy.sparse.issparse(values_label):
-                series = values_label.data
-                excess_zero_count = values_label.size - series.size
-            else:
-                series = data_set.values.reshape(-1)
-                excess_zero_count = 0
+            histogram, number_of_outliers = \
+                count_histograms[0].histogram(group = i)
             
-            figure, figure_name = plotHistogram(
-                series = series,
-                excess_zero_count = excess_zero_count,
+            renderFigure(
+                plotHistogram,
+                histogram = histogram,
+                bin_edges = count_histograms[0].bin_edges,
+                number_of_outliers = number_of_outliers,
                 label = data_set.tags["value"].capitalize() + "s",
-                discrete = data_set_discreteness,
                 normed = True,
                 y_scale = "log",
                 colour = class_palette[class_name],
-                name = ["counts", data_set_name, "class", class_name]
+                name = ["counts", data_set_name, "class", class_name],
+                export_options = export_options,
+                results_directory = class_count_distribution_directory
             )
-            saveFigure(figure, figure_name, export_options,
-                class_count_distribution_directory)
     
         distribution_duration = time() - distribution_time_start
-        print("    Count distributions for each class plotted and saved ({})."\
-            .format(formatDuration(distribution_duration)))
+        print("    Count distributions for each class {} ({})."\
+            .format(renderingStatus(), formatDuration(distribution_duration)))
         
         distribution_time_start = time()
         
-        for class_name in class_names:
-            class_indices = labels == class_name
-            if not class_indices.any():
+        for i, class_name in enumerate(class_names):
+            
+            if not class_sizes[i]:
                 continue
-            figure, figure_name = plotHistogram(
-                series = data_set.count_sum[class_indices],
+            
+            histogram, number_of_outliers = \
+                count_sum_histogram.histogram(group = i)
+            
+            renderFigure(
+                plotHistogram,
+                histogram = histogram,
+                bin_edges = count_sum_histogram.bin_edges,
+                number_of_outliers = number_of_outliers,
                 label = "Total number of {}s per {}".format(
                     data_set.tags["item"], data_set.tags["example"]
                 ),
                 normed = True,
                 y_scale = "log",
                 colour = class_palette[class_name],
-                name = ["count sum", data_set_name, "class", class_name]
+                name = ["count sum", data_set_name, "class", class_name],
+                export_options = export_options,
+                results_directory = class_count_distribution_directory
             )
-            saveFigure(figure, figure_name, export_options,
-                class_count_distribution_directory)
     
         distribution_duration = time() - distribution_time_start
         print("    " + \
-            "Count sum distributions for each class plotted and saved ({})."\
-            .format(formatDuration(distribution_duration)))
+            "Count sum distributions for each class {} ({})."\
+            .format(renderingStatus(), formatDuration(distribution_duration)))
     
     print()
-    
+
 def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
     colouring_data_set = None, decomposition_methods = ["PCA"],
     highlight_feature_indices = [],
@@ -1581,7 +2017,7 @@ def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
     symbol = None, pca_limits = None,
     title = "data set", specifier = None,
     analysis_level = "normal", export_options = [],
-    results_directory = "results"):
+    results_directory = "results", cache_directory = None):
     
     centroids_original = centroids
     
@@ -1663,19 +2099,7 @@ def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
                 centroids_decomposed = centroids
                 
                 if decomposition_method == "t-SNE":
-                    if data_set.number_of_examples \
-                        > maximum_number_of_examples_for_t_sne:
-                        
-                        print(
-                            "The number of examples for {}".format(
-                                title_with_ID),
-                            "is too large to decompose it",
-                            "using {}. Skipping.".format(decomposition_method)
-                        )
-                        print()
-                        continue
-                        
-                    elif data_set.number_of_features > \
+                    if data_set.number_of_features > \
                         maximum_number_of_features_for_t_sne:
                         
                         print(
@@ -1695,7 +2119,9 @@ def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
                                 other_value_sets = other_values_decomposed,
                                 centroids = centroids_decomposed,
                                 method = "pca",
-                                components = number_of_pca_components_before_tsne
+                                components =
+                                    number_of_pca_components_before_tsne,
+                                cache_directory = cache_directory
                             )
                         
                         decompose_duration = time() - decompose_time_start
@@ -1710,8 +2136,31 @@ def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
                         if scipy.sparse.issparse(other_values_decomposed):
                             other_values_decomposed = values_decomposed.A
                 
-                print("Decomposing {} using {}.".format(
-                    title_with_ID, decomposition_method))
+                # Large data sets are embedded using t-SNE on landmarks
+                # stratified by class or cluster.
+                
+                if decomposition_method == "t-SNE" and \
+                    data_set.number_of_examples \
+                        > maximum_number_of_examples_for_exact_t_sne:
+                    
+                    if data_set.has_labels:
+                        landmark_labels = data_set.labels
+                    elif data_set.has_predicted_cluster_ids:
+                        landmark_labels = data_set.predicted_cluster_ids
+                    elif data_set.has_predicted_labels:
+                        landmark_labels = data_set.predicted_labels
+                    else:
+                        landmark_labels = None
+                    
+                    print("Decomposing {} using {} on {} landmarks.".format(
+                        title_with_ID, decomposition_method,
+                        number_of_landmarks_for_t_sne))
+                
+                else:
+                    landmark_labels = None
+                    print("Decomposing {} using {}.".format(
+                        title_with_ID, decomposition_method))
+                
                 decompose_time_start = time()
                 
                 values_decomposed, other_values_decomposed, \
@@ -1720,7 +2169,9 @@ def analyseDecompositions(data_sets, other_data_sets = [], centroids = None,
                         other_value_sets = other_values_decomposed,
                         centroids = centroids_decomposed,
                         method = decomposition_method,
-                        components = 2
+                        components = 2,
+                        labels = landmark_labels,
+                        cache_directory = cache_directory
                     )
                 
                 decompose_duration = time() - decompose_time_start
@@ -2208,35 +2659,222 @@ def evaluationSubsetIndices(evaluation_set,
     
     return subset
 
-def statistics(data_set, name = "", tolerance = 1e-3, skip_sparsity = False):
+statistics_batch_elements = 1e6
+
+def statistics(data_set, name = "", tolerance = 1e-3, skip_sparsity = False,
+    batch_size = None, number_of_workers = None):
+    """
+    Compute summary statistics of a dense, sparse, or disk-backed data set.
+    
+    Batches of examples are summarised in parallel and combined, so the data
+    set is only read once and never copied as a whole.
+    """
+    
+    statistics_accumulator = accumulateStatistics(
+        data_set,
+        name = name,
+        tolerance = tolerance,
+        skip_sparsity = skip_sparsity,
+        batch_size = batch_size,
+        number_of_workers = number_of_workers
+    )
+    
+    return statistics_accumulator.result()
+
+def accumulateStatistics(x, x_tilde = None, values = "original", name = None,
+    tolerance = 1e-3, skip_sparsity = False, batch_size = None,
+    number_of_workers = None):
+    
+    if x_tilde is None and values != "original":
+        raise ValueError("Comparison values `{}` require ".format(values)
+            + "reconstructed values.")
+    
+    if isinstance(x, numpy.ndarray) and x.ndim == 1:
+        x = x.reshape(-1, 1)
+    
+    if isinstance(x_tilde, numpy.ndarray) and x_tilde.ndim == 1:
+        x_tilde = x_tilde.reshape(-1, 1)
+    
+    M, N = x.shape
+    
+    if batch_size is None:
+        batch_size = max(1, int(statistics_batch_elements / max(N, 1)))
     
-    x_mean = data_set.mean()
-    x_std  = data_set.std(ddof = 1)
-    x_min  = data_set.min()
-    x_max  = data_set.max()
+    if number_of_workers is None:
+        number_of_workers = multiprocessing.cpu_count()
+    
+    def accumulator():
+        return StatisticsAccumulator(
+            values = values,
+            name = name,
+            tolerance = tolerance,
+            skip_sparsity = skip_sparsity
+        )
+    
+    def accumulateBatch(i):
+        batch_accumulator = accumulator()
+        if x_tilde is not None:
+            x_tilde_batch = x_tilde[i:i + batch_size]
+        else:
+            x_tilde_batch = None
+        batch_accumulator.update(x[i:i + batch_size], x_tilde_batch)
+        return batch_accumulator
+    
+    batch_starts = range(0, M, batch_size)
+    
+    statistics_accumulator = accumulator()
+    
+    # NumPy releases the global interpreter lock for the reductions over
+    # each batch, so threads parallelise them without copying the data.
+    if number_of_workers > 1 and len(batch_starts) > 1:
+        with ThreadPool(min(number_of_workers, len(batch_starts))) as pool:
+            for batch_accumulator in pool.imap(accumulateBatch, batch_starts):
+                statistics_accumulator.merge(batch_accumulator)
+    else:
+        for i in batch_starts:
+            statistics_accumulator.merge(accumulateBatch(i))
     
-    x_dispersion = x_std**2 / x_mean
+    return statistics_accumulator
+
+def histogramBinEdges(minimum, maximum, discrete = False):
     
-    if skip_sparsity:
-        x_sparsity = nan
+    if discrete and maximum < maximum_number_of_bins_for_histograms:
+        number_of_bins = int(numpy.ceil(maximum)) + 1
+        bin_range = (-0.5, maximum + 0.5)
     else:
-        if scipy.sparse.issparse(data_set):
-            x_sparsity = 1 - (data_set >= tolerance).sum() \
-                / numpy.prod(data_set.shape)
+        number_of_bins = number_of_bins_for_continuous_histograms
+        if minimum == maximum:
+            bin_range = (minimum - 0.5, maximum + 0.5)
         else:
-            x_sparsity = (data_set < tolerance).sum() / data_set.size
-    
-    statistics = {
-        "name": name,
-        "mean": x_mean,
-        "standard deviation": x_std,
-        "minimum": x_min,
-        "maximum": x_max,
-        "dispersion": x_dispersion,
-        "sparsity": x_sparsity
-    }
+            bin_range = (minimum, maximum)
+    
+    return numpy.linspace(*bin_range, num = number_of_bins + 1)
+
+def storedValues(values):
+    # Stored values of a batch of examples, the example of each value, and the
+    # number of implicit zeros for each example.
+    
+    if scipy.sparse.issparse(values):
+        values = values.tocsr()
+        M, N = values.shape
+        row_counts = numpy.diff(values.indptr)
+        row_indices = numpy.repeat(numpy.arange(M), row_counts)
+        return values.data, row_indices, N - row_counts
+    
+    else:
+        values = numpy.asarray(values)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        M, N = values.shape
+        row_indices = numpy.repeat(numpy.arange(M), N)
+        return values.reshape(-1), row_indices, numpy.zeros(M, numpy.int64)
+
+def storedValueRange(values, maximum = None, batch_size = None):
+    # Minimum and maximum of the stored values at or below `maximum`, without
+    # flattening the values as a whole.
+    
+    M = values.shape[0]
+    
+    if scipy.sparse.issparse(values):
+        value_batches = [values.data]
+    else:
+        N = values.shape[1] if values.ndim > 1 else 1
+        if batch_size is None:
+            batch_size = max(1, int(statistics_batch_elements / N))
+        value_batches = (
+            numpy.asarray(values[i:i + batch_size]).reshape(-1)
+            for i in range(0, M, batch_size)
+        )
+    
+    minimum_value = numpy.inf
+    maximum_value = -numpy.inf
+    
+    for value_batch in value_batches:
+        if maximum is not None:
+            value_batch = value_batch[value_batch <= maximum]
+        if value_batch.size > 0:
+            minimum_value = min(minimum_value, value_batch.min())
+            maximum_value = max(maximum_value, value_batch.max())
+    
+    if minimum_value > maximum_value:
+        return None, None
+    
+    return minimum_value, maximum_value
+
+def accumulateHistograms(value_sets, groups = None, number_of_groups = 1,
+    batch_size = None, number_of_workers = None):
+    """
+    Accumulate histograms of several sets of values for the same examples.
+    
+    `value_sets` is a list of pairs of values and lists of bin edges, and a
+    list of lists of `HistogramAccumulator` is returned in the same order.
+    Each batch of examples is sliced once for each set of values and binned
+    for all of its bin edges, so every histogram is computed in one pass.
+    """
+    
+    M = value_sets[0][0].shape[0]
+    N = max(
+        values.shape[1] if len(values.shape) > 1 else 1
+        for values, bin_edge_sets in value_sets
+    )
+    
+    if batch_size is None:
+        batch_size = max(1, int(statistics_batch_elements / N))
+    
+    if number_of_workers is None:
+        number_of_workers = multiprocessing.cpu_count()
+    
+    if groups is not None:
+        groups = numpy.asarray(groups, numpy.int64)
+    
+    def accumulators():
+        return [
+            [HistogramAccumulator(bin_edges, number_of_groups)
+                for bin_edges in bin_edge_sets]
+            for values, bin_edge_sets in value_sets
+        ]
+    
+    def accumulateBatch(i):
+        
+        batch_accumulators = accumulators()
+        
+        if groups is not None:
+            groups_batch = groups[i:i + batch_size]
+        else:
+            groups_batch = None
+        
+        for (values, bin_edge_sets), value_set_accumulators in zip(
+            value_sets, batch_accumulators):
+            
+            stored_values = storedValues(values[i:i + batch_size])
+            
+            for accumulator in value_set_accumulators:
+                accumulator.updateWithStoredValues(*stored_values,
+                    groups = groups_batch)
+        
+        return batch_accumulators
+    
+    batch_starts = range(0, M, batch_size)
+    
+    histogram_accumulators = accumulators()
+    
+    def mergeBatch(batch_accumulators):
+        for value_set_accumulators, batch_value_set_accumulators in zip(
+            histogram_accumulators, batch_accumulators):
+            for accumulator, batch_accumulator in zip(
+                value_set_accumulators, batch_value_set_accumulators):
+                accumulator.merge(batch_accumulator)
+    
+    if number_of_workers > 1 and len(batch_starts) > 1:
+        with ThreadPool(min(number_of_workers, len(batch_starts))) as pool:
+            for batch_accumulators in pool.imap(accumulateBatch,
+                batch_starts):
+                mergeBatch(batch_accumulators)
+    else:
+        for i in batch_starts:
+            mergeBatch(accumulateBatch(i))
     
-    return statistics
+    return histogram_accumulators
 
 def excludeClassesFromLabelSet(*label_sets, excluded_classes = []):
     
@@ -2298,121 +2936,590 @@ def formatStatistics(statistics_sets, name = "Data set"):
     
     return table
 
-def computeCountAccuracies(x, x_tilde, method = None):
+count_accuracy_batch_elements = 1e6
+
+def computeCountAccuracies(x, x_tilde, method = None, batch_size = None):
     """
     Compute accuracies for every count in original data set
     using reconstructed data set.
-    """
     
-    # Setting up
+    Count histograms are accumulated in a single pass over batches of
+    examples, so the data sets are never compared as a whole.
+    """
     
-    count_accuracies = {}
     M, N = x.shape
     
-    ## Round data sets to be able to compare
-    x = numpy.round(x)
-    x_tilde = numpy.round(x_tilde)
+    if batch_size is None:
+        batch_size = max(1, int(count_accuracy_batch_elements / N))
+    
+    count_accuracy_accumulator = CountAccuracyAccumulator(method = method)
+    
+    for i in range(0, M, batch_size):
+        count_accuracy_accumulator.update(
+            x[i:i + batch_size],
+            x_tilde[i:i + batch_size]
+        )
+    
+    count_accuracies = count_accuracy_accumulator.result()
+    
+    return count_accuracies
+
+def formatCountAccuracies(count_accuracies):
+    
+    k_width = 5
+    
+    for k in count_accuracies.keys():
+        k_width = max(len(k), k_width)
+    
+    table_heading = "Count   Accuracy"
+    table_rows = [table_heading]
+    
+    for k, f in count_accuracies.items():
+        table_row_parts = [
+            "{:^{}}".format(k, k_width),
+            "{:6.2f}".format(100 * f)
+        ]
+        table_row = "    ".join(table_row_parts)
+        table_rows.append(table_row)
+    
+    table = "\n".join(table_rows)
+    
+    return table
+
+metric_accumulator_values = ["original", "reconstructed", "differences",
+    "log-ratios"]
+
+def comparisonValues(kind, x, x_tilde):
+    
+    if kind == "original":
+        return x
+    elif kind == "reconstructed":
+        return x_tilde
+    
+    if scipy.sparse.issparse(x):
+        x = x.toarray()
+    
+    if scipy.sparse.issparse(x_tilde):
+        x_tilde = x_tilde.toarray()
+    
+    if kind == "differences":
+        return numpy.abs(x_tilde - x)
+    elif kind == "log-ratios":
+        return numpy.abs(numpy.log1p(x_tilde) - numpy.log1p(x))
+    else:
+        raise ValueError("Comparison values `{}` not found.".format(kind))
+
+class StatisticsAccumulator(object):
+    """
+    Accumulate the statistics computed by `statistics` one batch at a time.
+    
+    The mean and variance are combined across batches using the pairwise
+    update of Chan et al., so each batch is only visited once.
+    """
+    
+    def __init__(self, values = "reconstructed", name = None,
+        tolerance = 1e-3, skip_sparsity = False):
+        
+        if values not in metric_accumulator_values:
+            raise ValueError("Comparison values `{}` not found.".format(values))
+        
+        self.values = values
+        self.name = name if name is not None else values
+        self.tolerance = tolerance
+        self.skip_sparsity = skip_sparsity
+        
+        self.count = 0
+        self.mean = 0.0
+        self.sum_of_squared_deviations = 0.0
+        self.minimum = numpy.inf
+        self.maximum = -numpy.inf
+        self.number_below_tolerance = 0
+    
+    def update(self, x, x_tilde, labels = None):
+        
+        values = comparisonValues(self.values, x, x_tilde)
+        
+        if scipy.sparse.issparse(values):
+            self.updateWithSparseValues(values)
+        else:
+            self.updateWithValues(values)
+    
+    def updateWithValues(self, values):
+        
+        values = numpy.asarray(values)
+        
+        count = values.size
+        
+        if count == 0:
+            return
+        
+        mean = values.mean(dtype = numpy.float64)
+        sum_of_squared_deviations = numpy.square(values - mean).sum()
+        
+        if self.skip_sparsity:
+            number_below_tolerance = 0
+        else:
+            number_below_tolerance = (values < self.tolerance).sum()
+        
+        self.combine(count, mean, sum_of_squared_deviations,
+            values.min(), values.max(), number_below_tolerance)
+    
+    def updateWithSparseValues(self, values):
+        
+        # Implicit zeros are accounted for without densifying the values.
+        
+        data = numpy.asarray(values.data, numpy.float64)
+        
+        count = values.shape[0] * values.shape[1]
+        
+        if count == 0:
+            return
+        
+        number_of_zeros = count - data.size
+        
+        mean = data.sum() / count
+        sum_of_squared_deviations = numpy.square(data - mean).sum() \
+            + number_of_zeros * mean**2
+        
+        minimum = data.min() if data.size > 0 else numpy.inf
+        maximum = data.max() if data.size > 0 else -numpy.inf
+        
+        if number_of_zeros > 0:
+            minimum = min(minimum, 0)
+            maximum = max(maximum, 0)
+        
+        if self.skip_sparsity:
+            number_below_tolerance = 0
+        else:
+            number_below_tolerance = (data < self.tolerance).sum()
+            if 0 < self.tolerance:
+                number_below_tolerance += number_of_zeros
+        
+        self.combine(count, mean, sum_of_squared_deviations,
+            minimum, maximum, number_below_tolerance)
+    
+    def merge(self, other):
+        
+        if other.count == 0:
+            return
+        
+        self.combine(other.count, other.mean,
+            other.sum_of_squared_deviations, other.minimum, other.maximum,
+            other.number_below_tolerance)
+    
+    def combine(self, count, mean, sum_of_squared_deviations,
+        minimum, maximum, number_below_tolerance):
+        
+        total_count = self.count + count
+        delta = mean - self.mean
+        
+        self.mean += delta * count / total_count
+        self.sum_of_squared_deviations += sum_of_squared_deviations \
+            + delta**2 * self.count * count / total_count
+        self.count = total_count
+        
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+        
+        self.number_below_tolerance += number_below_tolerance
+    
+    def result(self):
+        
+        if self.count > 1:
+            x_std = numpy.sqrt(self.sum_of_squared_deviations
+                / (self.count - 1))
+        else:
+            x_std = nan
+        
+        if self.count > 0:
+            x_mean = self.mean
+            x_min = self.minimum
+            x_max = self.maximum
+        else:
+            x_mean = nan
+            x_min = nan
+            x_max = nan
+        
+        x_dispersion = x_std**2 / x_mean
+        
+        if self.skip_sparsity or self.count == 0:
+            x_sparsity = nan
+        else:
+            x_sparsity = self.number_below_tolerance / self.count
+        
+        statistics = {
+            "name": self.name,
+            "mean": x_mean,
+            "standard deviation": x_std,
+            "minimum": x_min,
+            "maximum": x_max,
+            "dispersion": x_dispersion,
+            "sparsity": x_sparsity
+        }
+        
+        return statistics
+
+class CountAccuracyAccumulator(object):
+    """
+    Accumulate count histograms for `computeCountAccuracies` one batch at a
+    time.
+    
+    For every count, the number of times it occurs in the original data set
+    and the number of times it is also reconstructed are accumulated. Both
+    exact counts and counts floored to each order of magnitude are kept, so
+    either method can be chosen afterwards. The automatic method uses orders
+    of magnitude for counts above 20 like `analyseResults`. Sparse original
+    values are compared without densifying them.
+    """
     
-    ## Compute the max count value
-    k_max = x.max().astype(int)
+    def __init__(self, method = "automatic"):
+        
+        self.method = method
+        
+        self.maximum_count = 0
+        
+        self.count_totals = numpy.zeros(0, numpy.int64)
+        self.count_hits = numpy.zeros(0, numpy.int64)
+        
+        self.magnitude_totals = numpy.zeros((0, 10), numpy.int64)
+        self.magnitude_hits = numpy.zeros((0, 10), numpy.int64)
     
-    if method == "orders of magnitude":
+    def update(self, x, x_tilde, labels = None):
+        
+        if scipy.sparse.issparse(x_tilde):
+            x_tilde = x_tilde.toarray()
         
-        log_k_max_floored = numpy.floor(numpy.log10(k_max)).astype(int)
+        x_tilde = numpy.round(numpy.asarray(x_tilde))
         
-        for l in range(log_k_max_floored + 1):
+        if scipy.sparse.issparse(x):
             
-            x_scaled_floored = numpy.floor(x / pow(10, l))
-            x_tilde_scaled_floored = numpy.floor(x_tilde / pow(10, l))
+            # Only stored counts are compared directly, while implicit zeros
+            # are accounted for by counting zeros in the reconstruction.
+            x = x.tocoo()
+            x_values = numpy.round(x.data).astype(numpy.int64)
             
-            k_max_scaled_floored = x_scaled_floored.max().astype(int)
+            nonzero = x_values != 0
+            x_values = x_values[nonzero]
+            x_tilde_values = numpy.asarray(
+                x_tilde[x.row[nonzero], x.col[nonzero]]).ravel()
             
-            k_start = 1
+            self.accumulate(x_values, x_tilde_values)
+            
+            number_of_zeros = x_tilde.size - x_values.size
+            
+            if number_of_zeros > 0:
+                number_of_reconstructed_zeros = (x_tilde == 0).sum() \
+                    - (x_tilde_values == 0).sum()
+                self.accumulateZeros(number_of_zeros,
+                    number_of_reconstructed_zeros)
+        
+        else:
+            x = numpy.round(numpy.asarray(x)).astype(numpy.int64).ravel()
+            self.accumulate(x, x_tilde.ravel())
+    
+    def accumulate(self, x, x_tilde):
+        
+        if x.size == 0:
+            return
+        
+        k_max = int(x.max())
+        self.maximum_count = max(self.maximum_count, k_max)
+        
+        ## Exact counts
+        
+        self.count_totals = addBinCounts(self.count_totals,
+            numpy.bincount(x))
+        self.count_hits = addBinCounts(self.count_hits,
+            numpy.bincount(x[x == x_tilde], minlength = k_max + 1))
+        
+        ## Orders of magnitude
+        
+        self.addOrdersOfMagnitude(numberOfOrdersOfMagnitude(k_max))
+        
+        for l in range(numberOfOrdersOfMagnitude(k_max)):
             
             if l == 0:
-                k_start = 0
+                x_scaled_floored = x
+                x_tilde_scaled_floored = x_tilde
+            else:
+                # Only counts from this order of magnitude are reported
+                # for it, so smaller counts are skipped.
+                x_at_least = x >= pow(10, l)
+                x_scaled_floored = x[x_at_least] // pow(10, l)
+                x_tilde_scaled_floored = numpy.floor(
+                    x_tilde[x_at_least] / pow(10, l))
+            
+            # Counts of ten or more at this order of magnitude are
+            # accumulated at the next one.
+            in_range = x_scaled_floored < 10
+            reconstructed = in_range \
+                & (x_scaled_floored == x_tilde_scaled_floored)
+            
+            self.magnitude_totals[l] += numpy.bincount(
+                x_scaled_floored[in_range], minlength = 10)
+            self.magnitude_hits[l] += numpy.bincount(
+                x_scaled_floored[reconstructed], minlength = 10)
+    
+    def accumulateZeros(self, number_of_zeros, number_of_reconstructed_zeros):
+        
+        # Zeros are only reported for the exact counts and the first order
+        # of magnitude.
+        
+        self.count_totals = addBinCounts(self.count_totals,
+            numpy.array([number_of_zeros], numpy.int64))
+        self.count_hits = addBinCounts(self.count_hits,
+            numpy.array([number_of_reconstructed_zeros], numpy.int64))
+        
+        self.addOrdersOfMagnitude(1)
+        
+        self.magnitude_totals[0, 0] += number_of_zeros
+        self.magnitude_hits[0, 0] += number_of_reconstructed_zeros
+    
+    def addOrdersOfMagnitude(self, number_of_orders_of_magnitude):
+        
+        if number_of_orders_of_magnitude > self.magnitude_totals.shape[0]:
+            padding = ((0, number_of_orders_of_magnitude
+                - self.magnitude_totals.shape[0]), (0, 0))
+            self.magnitude_totals = numpy.pad(self.magnitude_totals, padding,
+                "constant")
+            self.magnitude_hits = numpy.pad(self.magnitude_hits, padding,
+                "constant")
+    
+    def result(self, method = None):
+        
+        if method is None:
+            method = self.method
+        
+        if method == "automatic":
+            if self.maximum_count > 20:
+                method = "orders of magnitude"
+            else:
+                method = None
+        
+        count_accuracies = {}
+        k_max = self.maximum_count
+        
+        if method == "orders of magnitude":
             
-            for k in range(k_start, min(10, k_max_scaled_floored + 1)):
+            for l in range(numberOfOrdersOfMagnitude(k_max)):
                 
-                with warnings.catch_warnings():
-                    warnings.simplefilter(
-                        "ignore",
-                        category = scipy.sparse.SparseEfficiencyWarning
-                    )
-                    k_indices = x_scaled_floored == k
+                k_max_scaled_floored = k_max // pow(10, l)
+                
+                k_start = 1
                 
-                k_size = k_indices.sum()
+                if l == 0:
+                    k_start = 0
                 
-                if scipy.sparse.issparse(x):
-                    k_indices = k_indices.tocoo()
-                    k_indices = (k_indices.row, k_indices.col)
+                for k in range(k_start, min(10, k_max_scaled_floored + 1)):
+                    
+                    k_size = self.magnitude_totals[l, k]
+                    k_sum = self.magnitude_hits[l, k]
+                    
+                    if k_size != 0:
+                        f = k_sum / k_size
+                    else:
+                        f = numpy.nan
+                    
+                    k_real = k * pow(10, l)
+                    
+                    if l == 0:
+                        k_string = str(k_real)
+                    else:
+                        k_real_end = min(k_max, k_real + pow(10, l) - 1)
+                        k_string = "{}-{}".format(k_real, k_real_end)
+                    
+                    count_accuracies[k_string] = f
+        
+        else:
+            
+            for k in range(k_max + 1):
                 
-                k_sum = (x_tilde_scaled_floored[k_indices] == k).sum()
+                if k < self.count_totals.size:
+                    k_size = self.count_totals[k]
+                    k_sum = self.count_hits[k]
+                else:
+                    k_size = 0
                 
                 if k_size != 0:
                     f = k_sum / k_size
                 else:
                     f = numpy.nan
                 
-                k_real = k * pow(10, l)
-                
-                if l == 0:
-                    k_string = str(k_real)
-                else:
-                    k_real_end = min(k_max, k_real + pow(10, l) - 1)
-                    k_string = "{}-{}".format(k_real, k_real_end)
-                
-                count_accuracies[k_string] = f
+                count_accuracies[str(k)] = f
+        
+        return count_accuracies
+
+class ClassStatisticsAccumulator(object):
+    """
+    Accumulate statistics separately for each class of examples.
+    """
     
-    else:
+    def __init__(self, values = ["original", "reconstructed"],
+        tolerance = 0.5):
         
-        for k in range(k_max + 1):
-            
-            with warnings.catch_warnings():
-                warnings.simplefilter(
-                    "ignore",
-                    category = scipy.sparse.SparseEfficiencyWarning
-                )
-                k_indices = x == k
-            
-            k_size = k_indices.sum()
-            
-            if scipy.sparse.issparse(x):
-                k_indices = k_indices.tocoo()
-                k_indices = (k_indices.row, k_indices.col)
+        self.values = values
+        self.tolerance = tolerance
+        
+        self.accumulators = {}
+    
+    def update(self, x, x_tilde, labels = None):
+        
+        if labels is None:
+            return
+        
+        for class_name in numpy.unique(labels):
             
-            k_sum = (x_tilde[k_indices] == k).sum()
+            class_indices = labels == class_name
             
-            if k_size != 0:
-                f = k_sum / k_size
-            else:
-                f = numpy.nan
+            x_class = x[class_indices]
+            x_tilde_class = x_tilde[class_indices]
             
-            count_accuracies[str(k)] = f
+            for kind in self.values:
+                
+                key = (class_name, kind)
+                
+                if key not in self.accumulators:
+                    self.accumulators[key] = StatisticsAccumulator(
+                        values = kind,
+                        name = "{}: {}".format(class_name, kind),
+                        tolerance = self.tolerance,
+                        skip_sparsity = kind not in ["original",
+                            "reconstructed"]
+                    )
+                
+                self.accumulators[key].update(x_class, x_tilde_class)
     
-    return count_accuracies
+    def result(self):
+        
+        class_names = sorted(set(class_name for class_name, kind
+            in self.accumulators))
+        
+        statistics_sets = []
+        
+        for class_name in class_names:
+            for kind in self.values:
+                statistics_sets.append(
+                    self.accumulators[(class_name, kind)].result())
+        
+        return statistics_sets
 
-def formatCountAccuracies(count_accuracies):
+class HistogramAccumulator(object):
+    """
+    Accumulate histograms of values for groups of examples one batch at a time.
     
-    k_width = 5
+    Only stored values of sparse batches are binned: implicit zeros are
+    counted separately and added to the bin containing zero, when the
+    histogram is returned. Values outside the bin edges are counted as
+    outliers.
+    """
     
-    for k in count_accuracies.keys():
-        k_width = max(len(k), k_width)
+    def __init__(self, bin_edges, number_of_groups = 1):
+        
+        self.bin_edges = numpy.asarray(bin_edges, numpy.float64)
+        self.number_of_bins = len(self.bin_edges) - 1
+        self.number_of_groups = number_of_groups
+        
+        self.counts = numpy.zeros((number_of_groups, self.number_of_bins),
+            numpy.int64)
+        self.zero_counts = numpy.zeros(number_of_groups, numpy.int64)
+        self.outlier_counts = numpy.zeros(number_of_groups, numpy.int64)
     
-    table_heading = "Count   Accuracy"
-    table_rows = [table_heading]
+    def update(self, values, groups = None):
+        self.updateWithStoredValues(*storedValues(values), groups = groups)
     
-    for k, f in count_accuracies.items():
-        table_row_parts = [
-            "{:^{}}".format(k, k_width),
-            "{:6.2f}".format(100 * f)
-        ]
-        table_row = "    ".join(table_row_parts)
-        table_rows.append(table_row)
+    def updateWithStoredValues(self, data, row_indices, row_zero_counts,
+        groups = None):
+        
+        G = self.number_of_groups
+        B = self.number_of_bins
+        
+        if groups is None:
+            groups = numpy.zeros(len(row_zero_counts), numpy.int64)
+        
+        value_groups = groups[row_indices]
+        
+        bin_indices = numpy.searchsorted(self.bin_edges, data,
+            side = "right") - 1
+        
+        # The last bin includes its right edge
+        bin_indices[data == self.bin_edges[-1]] = B - 1
+        
+        inside = (bin_indices >= 0) & (bin_indices < B)
+        
+        self.counts += numpy.bincount(
+            value_groups[inside] * B + bin_indices[inside],
+            minlength = G * B
+        ).reshape(G, B)
+        self.outlier_counts += numpy.bincount(value_groups[~inside],
+            minlength = G)
+        self.zero_counts += numpy.bincount(groups,
+            weights = row_zero_counts, minlength = G).astype(numpy.int64)
     
-    table = "\n".join(table_rows)
+    def merge(self, other):
+        self.counts += other.counts
+        self.zero_counts += other.zero_counts
+        self.outlier_counts += other.outlier_counts
     
-    return table
+    def histogram(self, group = None):
+        # Counts for each bin and number of outliers for one group or, if
+        # `group` is `None`, all groups.
+        
+        if group is None:
+            counts = self.counts.sum(axis = 0)
+            zero_count = self.zero_counts.sum()
+            outlier_count = self.outlier_counts.sum()
+        else:
+            counts = self.counts[group].copy()
+            zero_count = self.zero_counts[group]
+            outlier_count = self.outlier_counts[group]
+        
+        if zero_count:
+            zero_bin = numpy.searchsorted(self.bin_edges, 0,
+                side = "right") - 1
+            zero_bin = min(max(zero_bin, 0), self.number_of_bins - 1)
+            counts[zero_bin] += zero_count
+        
+        return counts, outlier_count
+
+def resultsMetricAccumulators(analysis_level = "normal"):
+    """
+    Set up accumulators for the metrics computed by `analyseResults`, which
+    can be updated batch by batch while evaluating a model.
+    """
+    
+    metric_accumulators = {
+        "original": StatisticsAccumulator("original", tolerance = 0.5),
+        "reconstructed": StatisticsAccumulator("reconstructed",
+            tolerance = 0.5)
+    }
+    
+    if analysis_level == "extensive":
+        metric_accumulators.update({
+            "differences": StatisticsAccumulator("differences",
+                skip_sparsity = True),
+            "log-ratios": StatisticsAccumulator("log-ratios",
+                skip_sparsity = True),
+            "count accuracies": CountAccuracyAccumulator(),
+            "classes": ClassStatisticsAccumulator()
+        })
+    
+    return metric_accumulators
+
+def addBinCounts(bin_counts, other_bin_counts):
+    
+    if other_bin_counts.size > bin_counts.size:
+        bin_counts, other_bin_counts = other_bin_counts, bin_counts
+    
+    bin_counts = bin_counts.copy()
+    bin_counts[:other_bin_counts.size] += other_bin_counts
+    
+    return bin_counts
+
+def numberOfOrdersOfMagnitude(k_max):
+    if k_max > 0:
+        return int(numpy.floor(numpy.log10(k_max))) + 1
+    else:
+        return 1
 
 decomposition_method_names = {
     "PCA": ["pca"],
@@ -2422,7 +3529,7 @@ decomposition_method_names = {
 }
 
 def decompose(values, other_value_sets = [], centroids = {}, method = "PCA",
-    components = 2, random = False):
+    components = 2, random = False, labels = None, cache_directory = None):
     
     method = normaliseString(method)
     
@@ -2435,22 +3542,114 @@ def decompose(values, other_value_sets = [], centroids = {}, method = "PCA",
     else:
         random_state = 42
     
-    if method == "pca":
-        if values.shape[1] <= maximum_feature_size_for_analyses \
-            and not scipy.sparse.issparse(values):
-            model = PCA(n_components = components)
-        else:
-            model = IncrementalPCA(n_components = components, batch_size = 100)
-    elif method == "svd":
-        model = TruncatedSVD(n_components = components)
-    elif method == "ica":
-        model = FastICA(n_components = components)
-    elif method == "t_sne":
-        model = TSNE(n_components = components, random_state = random_state)
+    # t-SNE is only run on landmarks for many examples, and the remaining
+    # examples are placed using their nearest landmarks.
+    
+    use_landmarks = method == "t_sne" \
+        and values.shape[0] > maximum_number_of_examples_for_exact_t_sne
+    
+    # Fitted models and decomposed values are cached by the content of the
+    # values and the decomposition parameters, so unchanged values, like the
+    # original evaluation set for different models and runs, are only
+    # decomposed once. Random decompositions are not cached.
+    
+    if cache_directory and random_state is not None:
+        cache_key = "{}-{}-{}-{}".format(method, components, random_state,
+            valuesHash(values))
+        if use_landmarks and labels is not None:
+            cache_key += "-" + valuesHash(
+                numpy.unique(labels, return_inverse = True)[1])
+        cache_path = os.path.join(cache_directory,
+            cache_key + decomposition_cache_extension)
     else:
-        raise ValueError("Method `{}` not found.".format(method))
+        cache_path = None
+    
+    cached_decomposition = None
+    
+    if cache_path and os.path.exists(cache_path):
+        # Unreadable cache files are decomposed again and then replaced.
+        try:
+            with gzip.open(cache_path, "r") as cache_file:
+                cached_decomposition = pickle.load(cache_file)
+        except Exception:
+            cached_decomposition = None
     
-    values_decomposed = model.fit_transform(values)
+    if cached_decomposition is not None:
+        
+        model, values_decomposed = cached_decomposition
+    
+    else:
+        
+        if method == "pca":
+            if values.shape[1] <= maximum_feature_size_for_analyses \
+                and not scipy.sparse.issparse(values):
+                model = sklearn.decomposition.PCA(
+                    n_components = components,
+                    random_state = random_state
+                )
+            else:
+                model = randomized_pca.RandomizedPCA(
+                    n_components = components,
+                    random_state = random_state
+                )
+        elif method == "svd":
+            model = sklearn.decomposition.TruncatedSVD(
+                n_components = components,
+                random_state = random_state
+            )
+        elif method == "ica":
+            model = sklearn.decomposition.FastICA(
+                n_components = components,
+                random_state = random_state
+            )
+        elif method == "t_sne":
+            model = sklearn.manifold.TSNE(
+                n_components = components,
+                random_state = random_state
+            )
+        else:
+            raise ValueError("Method `{}` not found.".format(method))
+        
+        if use_landmarks:
+            landmark_indices = stratifiedLandmarkIndices(
+                values.shape[0],
+                number_of_landmarks_for_t_sne,
+                labels = labels,
+                random_state = random_state
+            )
+            values_decomposed = interpolateEmbedding(
+                values,
+                landmark_indices,
+                model.fit_transform(values[landmark_indices]),
+                number_of_neighbours_for_t_sne_interpolation
+            )
+        else:
+            values_decomposed = model.fit_transform(values)
+        
+        if cache_path:
+            
+            os.makedirs(cache_directory, exist_ok = True)
+            
+            # t-SNE cannot transform other values, so only its embedding is
+            # kept.
+            if method == "t_sne":
+                model = None
+            
+            # The cache is shared by concurrent runs, so it is written to a
+            # temporary file, which then replaces the cache file at once.
+            
+            file_descriptor, temporary_cache_path = tempfile.mkstemp(
+                prefix = cache_key + "-", suffix = ".tmp",
+                dir = cache_directory)
+            os.close(file_descriptor)
+            
+            try:
+                with gzip.open(temporary_cache_path, "w") as cache_file:
+                    pickle.dump((model, values_decomposed), cache_file)
+                os.replace(temporary_cache_path, cache_path)
+            finally:
+                if os.path.exists(temporary_cache_path):
+                    os.remove(temporary_cache_path)
     
     if other_value_sets and method != "t_sne":
         other_value_sets_decomposed = []
@@ -2512,6 +3711,91 @@ def decompose(values, other_value_sets = [], centroids = {}, method = "PCA",
     else:
         return values_decomposed
 
+def stratifiedLandmarkIndices(M, number_of_landmarks, labels = None,
+    random_state = None):
+    
+    if number_of_landmarks >= M:
+        return numpy.arange(M)
+    
+    random_state = numpy.random.RandomState(random_state)
+    
+    if labels is not None:
+        class_indices = numpy.unique(labels, return_inverse = True)[1].ravel()
+    else:
+        class_indices = numpy.zeros(M, numpy.int64)
+    
+    # Landmarks are drawn from each class in proportion to its size, but
+    # every class gets at least one.
+    
+    class_counts = numpy.bincount(class_indices)
+    landmark_counts = numpy.minimum(
+        numpy.maximum(1, class_counts * number_of_landmarks // M),
+        class_counts
+    )
+    
+    examples_for_classes = numpy.split(
+        numpy.argsort(class_indices, kind = "mergesort"),
+        numpy.cumsum(class_counts)[:-1]
+    )
+    
+    landmark_indices = numpy.concatenate([
+        random_state.choice(class_examples, landmark_count, replace = False)
+        for class_examples, landmark_count
+        in zip(examples_for_classes, landmark_counts)
+    ])
+    
+    return numpy.sort(landmark_indices)
+
+def interpolateEmbedding(values, landmark_indices, landmark_embedding,
+    number_of_neighbours, batch_size = 100000):
+    
+    M = values.shape[0]
+    embedding = numpy.empty((M, landmark_embedding.shape[1]))
+    embedding[landmark_indices] = landmark_embedding
+    
+    other_indices = numpy.setdiff1d(numpy.arange(M), landmark_indices)
+    
+    # Neighbours are only searched for among landmarks, and queries are
+    # spread across all cores.
+    neighbours = sklearn.neighbors.NearestNeighbors(
+        n_neighbors = min(number_of_neighbours, len(landmark_indices)),
+        n_jobs = -1
+    ).fit(values[landmark_indices])
+    
+    for i in range(0, len(other_indices), batch_size):
+        
+        batch_indices = other_indices[i:i + batch_size]
+        
+        distances, neighbour_indices = neighbours.kneighbors(
+            values[batch_indices])
+        
+        # Inverse-distance weighted mean of the neighbouring landmarks
+        weights = 1 / numpy.maximum(distances, 1e-12)
+        weights /= weights.sum(axis = 1, keepdims = True)
+        
+        embedding[batch_indices] = numpy.einsum("ij,ijk->ik",
+            weights, landmark_embedding[neighbour_indices])
+    
+    return embedding
+
+def valuesHash(values):
+    
+    values_hash = hashlib.blake2b(digest_size = 16)
+    values_hash.update(str(values.shape).encode())
+    
+    if scipy.sparse.issparse(values):
+        values = values.tocsr()
+        arrays = [values.data, values.indices, values.indptr]
+    else:
+        arrays = [values]
+    
+    for array in arrays:
+        array = numpy.ascontiguousarray(array)
+        values_hash.update(str(array.dtype).encode())
+        values_hash.update(memoryview(array.reshape(-1)).cast("B"))
+    
+    return values_hash.hexdigest()
+
 def plotClassHistogram(labels, class_names = None, class_palette = None,
     normed = False, scale = "linear", label_sorter = None, name = None):
     
@@ -2606,11 +3890,11 @@ def plotClassHistogram(labels, class_names = None, class_palette = None,
     
     return figure, figure_name
 
-def plotHistogram(series, excess_zero_count = 0, label = None,
-    maximum_count = None, normed = False, discrete = False,
-    x_scale = "linear", y_scale = "linear", colour = None, name = None):
+def plotHistogram(histogram, bin_edges, number_of_outliers = 0,
+    label = None, normed = False, x_scale = "linear", y_scale = "linear",
+    colour = None, name = None):
     
-    series = series.copy()
+    bin_edges = numpy.array(bin_edges, numpy.float64)
     
     figure_name = "histogram"
     
@@ -2622,41 +3906,18 @@ def plotHistogram(series, excess_zero_count = 0, label = None,
     figure = pyplot.figure()
     axis = figure.add_subplot(1, 1, 1)
     
-    series_length = len(series) + excess_zero_count
-    
-    if maximum_count:
-        maximum_count_indcises = series <= maximum_count
-        number_of_outliers = series.size - maximum_count_indcises.sum()
-        series = series[maximum_count_indcises]
-    
-    series_max = series.max()
-    
-    if discrete and series_max < maximum_number_of_bins_for_histograms:
-        number_of_bins = int(numpy.ceil(series_max)) + 1
-        bin_range = numpy.array((-0.5, series_max + 0.5))
-    else:
-        if series_max < maximum_number_of_bins_for_histograms:
-            number_of_bins = "auto"
-        else:
-            number_of_bins = maximum_number_of_bins_for_histograms
-        bin_range = numpy.array((series.min(), series_max))
+    series_length = histogram.sum() + number_of_outliers
     
     if colour is None:
-        colour = standard_palette[0]
+        colour = standard_palette()[0]
     
     if x_scale == "log":
-        series += 1
-        bin_range += 1
+        bin_edges += 1
         label += " (shifted one)"
         figure_name += "-log_values"
     
     y_log = y_scale == "log"
     
-    histogram, bin_edges = numpy.histogram(series, bins = number_of_bins,
-        range = bin_range)
-    
-    histogram[0] += excess_zero_count
-    
     width = bin_edges[1] - bin_edges[0]
     bin_centres = bin_edges[:-1] + width / 2
     
@@ -2677,7 +3938,7 @@ def plotHistogram(series, excess_zero_count = 0, label = None,
     
     seaborn.despine()
     
-    if maximum_count:
+    if number_of_outliers:
         axis.text(
             0.98, 0.98, "{} counts omitted".format(number_of_outliers),
             horizontalalignment = "right",
@@ -2688,10 +3949,11 @@ def plotHistogram(series, excess_zero_count = 0, label = None,
     
     return figure, figure_name
 
-def plotCutOffCountHistogram(series, excess_zero_count = 0, cutoff = None,
-    normed = False, scale = "linear", colour = None, name = None):
+def plotCutOffCountHistogram(histogram, cutoff, normed = False,
+    scale = "linear", colour = None, name = None):
     
-    series = series.copy()
+    # The histogram has a bin for each count below the cut-off and a last bin
+    # for counts at or above it.
     
     figure_name = "histogram"
     
@@ -2703,21 +3965,12 @@ def plotCutOffCountHistogram(series, excess_zero_count = 0, cutoff = None,
     figure_name += "-cutoff-{}".format(cutoff)
     
     if not colour:
-        colour = standard_palette[0]
+        colour = standard_palette()[0]
     
     y_log = scale == "log"
     
     k = numpy.arange(cutoff + 1)
-    C = numpy.empty(cutoff + 1)
-    
-    for i in range(cutoff + 1):
-        if k[i] < cutoff:
-            c = (series == k[i]).sum()
-        elif k[i] == cutoff:
-            c = (series >= cutoff).sum()
-        C[i] = c
-    
-    C[0] += excess_zero_count
+    C = numpy.array(histogram, numpy.float64)
     
     if normed:
         C /= C.sum()
@@ -2811,7 +4064,7 @@ def plotLearningCurves(curves, model_type, epoch_offset = 0, epoch_slice = slice
             line_style = "dashed"
             colour_index_offset = 1
         
-        curve_colour = lambda i: standard_palette[len(curves) * i
+        curve_colour = lambda i: standard_palette()[len(curves) * i
             + colour_index_offset]
         
         for curve_name, curve in sorted(curve_set.items()):
@@ -2954,7 +4207,7 @@ def plotSeparateLearningCurves(curves, loss, name = None):
             line_style = "dashed"
             colour_index_offset = 1
         
-        curve_colour = lambda i: standard_palette[len(curves) * i
+        curve_colour = lambda i: standard_palette()[len(curves) * i
             + colour_index_offset]
         
         for curve_name, curve in sorted(curve_set.items()):
@@ -3011,10 +4264,10 @@ def plotAccuracies(accuracies, name = None):
         
         if accuracies_kind == "training":
             line_style = "solid"
-            colour = standard_palette[0]
+            colour = standard_palette()[0]
         elif accuracies_kind == "validation":
             line_style = "dashed"
-            colour = standard_palette[1]
+            colour = standard_palette()[1]
         
         label = "{} set".format(accuracies_kind.capitalize())
         
@@ -3062,10 +4315,10 @@ def plotKLDivergenceEvolution(KL_neurons, scale = "log", name = None):
     epochs = numpy.arange(E) + 1
     
     seaborn.heatmap(
-        DataFrame(KL_neurons.T, columns = epochs),
+        pandas.DataFrame(KL_neurons.T, columns = epochs),
         xticklabels = epoch_label_frequency,
         yticklabels = False,
-        cbar = True, cbar_kws = cbar_dict, cmap = standard_colour_map,
+        cbar = True, cbar_kws = cbar_dict, cmap = standard_colour_map(),
         ax = axis
     )
     
@@ -3284,9 +4537,9 @@ def plotProfileComparison(observed_series, expected_series,
     
     N = observed_series.shape[0]
     
-    observed_colour = standard_palette[0]
+    observed_colour = standard_palette()[0]
     
-    expected_palette = seaborn.light_palette(standard_palette[1], 5)
+    expected_palette = seaborn.light_palette(standard_palette()[1], 5)
     
     expected_colour = expected_palette[-1]
     expected_total_standard_deviations_colour = expected_palette[1]
@@ -3452,7 +4705,7 @@ def plotProfileComparison(observed_series, expected_series,
         axis_lower.set_ylim(y_lower_min, y_cutoff)
         
         # if y_upper_max < 100:
-        #     axis_upper.yaxis.set_major_formatter(CustomTicker())
+        #     axis_upper.yaxis.set_major_formatter(customTicker())
         
     else:
         axis.legend(
@@ -3480,13 +4733,19 @@ def plotProfileComparison(observed_series, expected_series,
         axis.set_ylim(y_min, y_max)
         
         # if y_scale == "log" and y_max < 100:
-        #     axis.yaxis.set_major_formatter(CustomTicker())
+        #     axis.yaxis.set_major_formatter(customTicker())
         
     return figure, figure_name
 
 def plotHeatMap(values, x_name, y_name, z_name = None, z_symbol = None,
-    z_min = None, z_max = None, labels = None, center = None,
-    normalisation = None, normalisation_constants = None, name = None):
+    z_min = None, z_max = None, labels = None, label_sorter = None,
+    pooling = "mean", center = None, normalisation = None,
+    normalisation_constants = None, reference_values = None,
+    comparison = None, feature_clusters = None, name = None):
+    
+    # If a comparison is given, its values comparing `values` with
+    # `reference_values` are plotted instead. If feature clusters are given,
+    # columns are grouped by cluster.
     
     figure_name = figureName("heat_map", name)
     
@@ -3495,17 +4754,34 @@ def plotHeatMap(values, x_name, y_name, z_name = None, z_symbol = None,
     figure = pyplot.figure()
     axis = figure.add_subplot(1, 1, 1)
     
-    if not z_min:
-        z_min = values.min()
+    # Matrices larger than the display resolution are pooled into blocks of
+    # rows and columns instead of being plotted with one cell per value.
     
-    if not z_max:
-        z_max = values.max()
+    aggregate = M > heat_map_resolution[0] or N > heat_map_resolution[1]
+    
+    if not aggregate:
+        
+        if comparison:
+            if scipy.sparse.issparse(values):
+                values = values.toarray()
+            if scipy.sparse.issparse(reference_values):
+                reference_values = reference_values.toarray()
+            values = heat_map_comparisons[comparison](
+                numpy.asarray(values), numpy.asarray(reference_values))
+        
+        if not z_min:
+            z_min = values.min()
+        
+        if not z_max:
+            z_max = values.max()
     
     if z_symbol:
         z_name = "$" + z_symbol + "$"
     
     if normalisation:
-        values = normalisation["function"](values, normalisation_constants)
+        if not aggregate:
+            values = normalisation["function"](values,
+                normalisation_constants)
         if z_symbol:
             z_name = normalisation["label"](z_symbol)
         elif z_name:
@@ -3516,22 +4792,68 @@ def plotHeatMap(values, x_name, y_name, z_name = None, z_symbol = None,
     if z_name:
         cbar_dict["label"] = z_name
     
-    aspect_ratio = M / N
-    square_cells = 1/5 < aspect_ratio and aspect_ratio < 5
-    
     if labels is not None:
-        indices = numpy.argsort(labels)
+        if label_sorter:
+            class_names, class_indices = numpy.unique(labels,
+                return_inverse = True)
+            class_ranks = numpy.argsort(numpy.argsort(
+                [label_sorter(class_name) for class_name in class_names],
+                kind = "mergesort"))
+            indices = numpy.argsort(class_ranks[class_indices],
+                kind = "mergesort")
+        else:
+            indices = numpy.argsort(labels, kind = "mergesort")
         y_name += " sorted by class"
     else:
         indices = numpy.arange(M)
     
+    if feature_clusters is not None:
+        feature_indices = numpy.argsort(feature_clusters, kind = "mergesort")
+        x_name += " sorted by cluster"
+    else:
+        feature_indices = numpy.arange(N)
+    
+    if aggregate:
+        
+        values = aggregateHeatMapValues(
+            values,
+            row_order = indices,
+            number_of_row_groups = min(M, heat_map_resolution[0]),
+            column_order = feature_indices,
+            number_of_column_groups = min(N, heat_map_resolution[1]),
+            pooling = pooling,
+            normalisation = normalisation,
+            normalisation_constants = normalisation_constants,
+            reference_values = reference_values,
+            comparison = comparison
+        )
+        
+        if not z_min:
+            z_min = values.min()
+        
+        if not z_max:
+            z_max = values.max()
+        
+        if values.shape[0] < M:
+            y_name += " ({} of {} groups)".format(pooling, values.shape[0])
+        
+        if values.shape[1] < N:
+            x_name += " ({} of {} groups)".format(pooling, values.shape[1])
+        
+        M, N = values.shape
+        indices = numpy.arange(M)
+        feature_indices = numpy.arange(N)
+    
+    aspect_ratio = M / N
+    square_cells = 1/5 < aspect_ratio and aspect_ratio < 5
+    
     seaborn.set(style = "white")
     
     seaborn.heatmap(
-        values[indices],
+        values[indices][:, feature_indices],
         vmin = z_min, vmax = z_max, center = center, 
         xticklabels = False, yticklabels = False,
-        cbar = True, cbar_kws = cbar_dict, cmap = standard_colour_map,
+        cbar = True, cbar_kws = cbar_dict, cmap = standard_colour_map(),
         square = square_cells, ax = axis
     )
     
@@ -3542,6 +4864,136 @@ def plotHeatMap(values, x_name, y_name, z_name = None, z_symbol = None,
     
     return figure, figure_name
 
+def classFeatureClusters(values, labels, label_sorter = None):
+    
+    # Each feature is assigned to the class with the largest mean value,
+    # with clusters ranked as the classes in heat maps, so features
+    # characteristic of each class are grouped together. This takes a single
+    # pass over the values, also when sparse.
+    
+    class_names, class_indices = numpy.unique(labels, return_inverse = True)
+    
+    if label_sorter:
+        class_ranks = numpy.argsort(numpy.argsort(
+            [label_sorter(class_name) for class_name in class_names],
+            kind = "mergesort"))
+    else:
+        class_ranks = numpy.arange(len(class_names))
+    
+    K = len(class_names)
+    M = len(labels)
+    
+    class_membership = scipy.sparse.csr_matrix(
+        (numpy.ones(M), (class_ranks[class_indices], numpy.arange(M))),
+        shape = (K, M)
+    )
+    
+    class_sums = class_membership @ values
+    
+    if scipy.sparse.issparse(class_sums):
+        class_sums = class_sums.toarray()
+    
+    class_means = numpy.asarray(class_sums) \
+        / numpy.bincount(class_ranks[class_indices], minlength = K)[:, None]
+    
+    return class_means.argmax(axis = 0)
+
+def aggregateHeatMapValues(values, row_order, number_of_row_groups,
+    column_order, number_of_column_groups, pooling = "mean",
+    normalisation = None, normalisation_constants = None,
+    reference_values = None, comparison = None):
+    
+    # Rows and columns are assigned to contiguous groups in the given
+    # orders, and values are pooled within each pair of groups one batch of
+    # rows at a time. For sparse values, only stored values are visited, and
+    # implicit zeros are accounted for by the group sizes. Comparisons with
+    # reference values are also computed one batch at a time.
+    
+    M, N = values.shape
+    R = number_of_row_groups
+    C = number_of_column_groups
+    
+    if pooling not in ["mean", "max"]:
+        raise ValueError("Pooling `{}` not found.".format(pooling))
+    
+    row_groups = numpy.empty(M, numpy.int64)
+    row_groups[row_order] = numpy.arange(M) * R // M
+    
+    column_groups = numpy.empty(N, numpy.int64)
+    column_groups[column_order] = numpy.arange(N) * C // N
+    
+    group_sizes = numpy.outer(numpy.bincount(row_groups, minlength = R),
+        numpy.bincount(column_groups, minlength = C)).ravel()
+    
+    if normalisation:
+        normalise = normalisation["function"]
+        normalisation_preserves_zeros = normalise(
+            numpy.zeros(1), numpy.ones(1))[0] == 0
+    else:
+        normalise = None
+        normalisation_preserves_zeros = True
+    
+    sums = numpy.zeros(R * C)
+    maxima = numpy.full(R * C, -numpy.inf)
+    stored_counts = numpy.zeros(R * C, numpy.int64)
+    
+    if comparison:
+        compare = heat_map_comparisons[comparison]
+    
+    sparse = scipy.sparse.issparse(values) and normalisation_preserves_zeros \
+        and not comparison
+    
+    batch_size = max(1, int(heat_map_batch_elements // N))
+    
+    for i in range(0, M, batch_size):
+        
+        batch = values[i:i + batch_size]
+        
+        if normalise:
+            constants = numpy.asarray(
+                normalisation_constants[i:i + batch_size]).reshape(-1, 1)
+        
+        if sparse:
+            batch = scipy.sparse.coo_matrix(batch)
+            batch_values = batch.data
+            if normalise:
+                batch_values = normalise(batch_values,
+                    constants[batch.row, 0])
+            cells = row_groups[i + batch.row] * C \
+                + column_groups[batch.col]
+            stored_counts += numpy.bincount(cells, minlength = R * C)
+        else:
+            if scipy.sparse.issparse(batch):
+                batch = batch.toarray()
+            batch = numpy.asarray(batch)
+            if comparison:
+                reference_batch = reference_values[i:i + batch_size]
+                if scipy.sparse.issparse(reference_batch):
+                    reference_batch = reference_batch.toarray()
+                batch = compare(batch, numpy.asarray(reference_batch))
+            if normalise:
+                batch = normalise(batch, constants)
+            batch_values = batch.ravel()
+            cells = (row_groups[i:i + batch.shape[0], numpy.newaxis] * C
+                + column_groups).ravel()
+        
+        if pooling == "mean":
+            sums += numpy.bincount(cells, weights = batch_values,
+                minlength = R * C)
+        elif pooling == "max":
+            numpy.maximum.at(maxima, cells, batch_values)
+    
+    if pooling == "mean":
+        pooled_values = sums / group_sizes
+    elif pooling == "max":
+        pooled_values = maxima
+        if sparse:
+            implicit_zeros = stored_counts < group_sizes
+            pooled_values[implicit_zeros] = numpy.maximum(
+                pooled_values[implicit_zeros], 0)
+    
+    return pooled_values.reshape(R, C)
+
 def plotELBOHeatMap(data_frame, x_label, y_label, z_label = None, z_symbol = None,
     z_min = None, z_max = None, name = None):
     
@@ -3570,7 +5022,7 @@ def plotELBOHeatMap(data_frame, x_label, y_label, z_label = None, z_symbol = Non
         data_frame,
         vmin = z_min, vmax = z_max,
         xticklabels = True, yticklabels = True,
-        cbar = True, cbar_kws = cbar_dict, #cmap = standard_colour_map,
+        cbar = True, cbar_kws = cbar_dict, #cmap = standard_colour_map(),
         annot = True, fmt = "-.6g",
         square = False, ax = axis
     )
@@ -3749,22 +5201,27 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
         else:
             y_max = original_y_max
         
-        include_indices = []
-        outlier_indices = []
-    
-        for i in range(M):
-            if values[i, 0] < x_min or values[i, 0] > x_max \
-                or values[i, 1] < y_min or values[i, 1] > y_max:
-                outlier_indices.append(i)
-            else:
-                include_indices.append(i)
+        include_indices = numpy.flatnonzero(
+            (values[:, 0] >= x_min) & (values[:, 0] <= x_max)
+            & (values[:, 1] >= y_min) & (values[:, 1] <= y_max)
+        )
+        number_of_outliers = M - len(include_indices)
     
         values = values[include_indices]
         shuffled_indices = shuffled_indices[include_indices]
         
-        outliers_string = "{} {}s not shown".format(len(outlier_indices),
+        outliers_string = "{} {}s not shown".format(number_of_outliers,
             example_tag)
     
+    # Many examples are binned into a raster shown as an image instead of
+    # being drawn as individual points.
+    
+    aggregate = values.shape[0] > maximum_number_of_examples_for_scatter_plots
+    
+    if aggregate:
+        bin_indices, raster_shape, raster_extent = rasterBins(values,
+            aggregated_scatter_plot_resolution)
+    
     # Figure
     
     figure = pyplot.figure()
@@ -3777,7 +5234,7 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
     axis.set_xlabel(x_label)
     axis.set_ylabel(y_label)
     
-    colour_map = seaborn.dark_palette(standard_palette[0], as_cmap = True)
+    colour_map = seaborn.dark_palette(standard_palette()[0], as_cmap = True)
     
     if colour_coding and (
             "labels" in colour_coding or
@@ -3831,20 +5288,42 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
         labels = labels[shuffled_indices]
         
         if "labels" in colour_coding or "ids" in colour_coding:
-            colours = []
-            classes = set()
-        
-            for i, label in enumerate(labels):
-                colour = class_palette[label]
-                colours.append(colour)
             
-                # Plot one example for each class to add labels
-                if label not in classes:
-                    classes.add(label)
-                    axis.scatter(values[i, 0], values[i, 1], c = colour,
+            if aggregate:
+                
+                present_class_names, class_indices = numpy.unique(labels,
+                    return_inverse = True)
+                
+                # Plot no examples for each class to add labels
+                for label in present_class_names:
+                    axis.scatter([], [], color = class_palette[label],
                         label = label)
+                
+                image = aggregatedImage(
+                    bin_indices, raster_shape,
+                    colours = [class_palette[label]
+                        for label in present_class_names],
+                    class_indices = class_indices.ravel()
+                )
+                axis.imshow(image, extent = raster_extent, origin = "lower",
+                    interpolation = "nearest", aspect = "auto")
+            
+            else:
+                
+                colours = []
+                classes = set()
             
-            axis.scatter(values[:, 0], values[:, 1], c = colours)
+                for i, label in enumerate(labels):
+                    colour = class_palette[label]
+                    colours.append(colour)
+                
+                    # Plot one example for each class to add labels
+                    if label not in classes:
+                        classes.add(label)
+                        axis.scatter(values[i, 0], values[i, 1], c = colour,
+                            label = label)
+                
+                axis.scatter(values[:, 0], values[:, 1], c = colours)
             
             class_handles, class_labels = axis.get_legend_handles_labels()
             
@@ -3875,6 +5354,33 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
                         fontsize = "x-small"
                     )
         
+        elif "class" in colour_coding and aggregate:
+            
+            figure_name += "-" + normaliseString(str(class_name))
+            
+            in_class = labels == class_name
+            
+            for label, layer_indices, colour, z_order in [
+                    ("Remaining", ~in_class, neutral_colour, 0),
+                    (str(class_name), in_class,
+                        class_palette.get(class_name, neutral_colour), 1)
+                ]:
+                axis.scatter([], [], color = colour, label = label)
+                image = aggregatedImage(bin_indices[layer_indices],
+                    raster_shape, colours = [colour])
+                axis.imshow(image, extent = raster_extent, origin = "lower",
+                    interpolation = "nearest", aspect = "auto",
+                    zorder = z_order)
+            
+            handles, labels = axis.get_legend_handles_labels()
+            labels, handles = zip(*sorted(zip(labels, handles),
+                key = lambda t: label_sorter(t[0])))
+            legend = axis.legend(
+                handles, labels, 
+                bbox_to_anchor = (-.1, 1.02, 1.1, 1.02), loc = 3,
+                ncol = 2, mode = "expand", borderaxespad = 0.
+            )
+        
         elif "class" in colour_coding:
             colours = []
             
@@ -3923,8 +5429,16 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
     elif colour_coding == "count_sum":
         
         n = colouring_data_set.count_sum[shuffled_indices].flatten()
-        scatter_plot = axis.scatter(values[:, 0], values[:, 1], c = n,
-            cmap = colour_map)
+        if aggregate:
+            scatter_plot = axis.imshow(
+                aggregatedMeans(bin_indices, raster_shape, n),
+                extent = raster_extent, origin = "lower",
+                interpolation = "nearest", aspect = "auto",
+                cmap = colour_map
+            )
+        else:
+            scatter_plot = axis.scatter(values[:, 0], values[:, 1], c = n,
+                cmap = colour_map)
         colour_bar = figure.colorbar(scatter_plot)
         colour_bar.outline.set_linewidth(0)
         colour_bar.set_label("Total number of {}s per {}".format(
@@ -3949,12 +5463,26 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
             f = f.A
         f = f.squeeze()
         
-        scatter_plot = axis.scatter(values[:, 0], values[:, 1], c = f,
-            cmap = colour_map)
+        if aggregate:
+            scatter_plot = axis.imshow(
+                aggregatedMeans(bin_indices, raster_shape, f),
+                extent = raster_extent, origin = "lower",
+                interpolation = "nearest", aspect = "auto",
+                cmap = colour_map
+            )
+        else:
+            scatter_plot = axis.scatter(values[:, 0], values[:, 1], c = f,
+                cmap = colour_map)
         colour_bar = figure.colorbar(scatter_plot)
         colour_bar.outline.set_linewidth(0)
         colour_bar.set_label(feature_name)
     
+    elif aggregate:
+        image = aggregatedImage(bin_indices, raster_shape,
+            colours = [neutral_colour])
+        axis.imshow(image, extent = raster_extent, origin = "lower",
+            interpolation = "nearest", aspect = "auto")
+    
     else:
         axis.scatter(values[:, 0], values[:, 1], color = neutral_colour)
     
@@ -3996,6 +5524,79 @@ def plotValues(values, colour_coding = None, colouring_data_set = None,
     
     return figure, figure_name
 
+def rasterBins(values, resolution):
+    
+    # Bins with the given resolution along each axis separately, so the
+    # raster spans the same ranges as a scatter plot of the values. Images of
+    # the raster should be shown with automatic aspect ratio.
+    
+    minima = values[:, :2].min(axis = 0)
+    maxima = values[:, :2].max(axis = 0)
+    
+    bin_sizes = (maxima - minima) / resolution
+    bin_sizes[bin_sizes <= 0] = 1
+    
+    number_of_bins = numpy.maximum(
+        numpy.ceil((maxima - minima) / bin_sizes), 1).astype(int)
+    
+    bin_coordinates = numpy.minimum(
+        ((values[:, :2] - minima) / bin_sizes).astype(int),
+        number_of_bins - 1
+    )
+    
+    bin_indices = bin_coordinates[:, 1] * number_of_bins[0] \
+        + bin_coordinates[:, 0]
+    raster_shape = (int(number_of_bins[1]), int(number_of_bins[0]))
+    raster_extent = (
+        minima[0], minima[0] + number_of_bins[0] * bin_sizes[0],
+        minima[1], minima[1] + number_of_bins[1] * bin_sizes[1]
+    )
+    
+    return bin_indices, raster_shape, raster_extent
+
+def aggregatedImage(bin_indices, raster_shape, colours, class_indices = None):
+    
+    # Each bin is coloured by the mean colour of its examples, and its
+    # opacity increases logarithmically with the number of examples.
+    
+    number_of_bins = raster_shape[0] * raster_shape[1]
+    colours = numpy.array([matplotlib.colors.to_rgb(colour)
+        for colour in colours])
+    K = len(colours)
+    
+    if class_indices is None:
+        class_indices = numpy.zeros_like(bin_indices)
+    
+    class_counts = numpy.bincount(bin_indices * K + class_indices,
+        minlength = number_of_bins * K).reshape(number_of_bins, K)
+    counts = class_counts.sum(axis = 1)
+    
+    image = numpy.zeros((number_of_bins, 4))
+    
+    occupied = counts > 0
+    
+    image[occupied, :3] = class_counts[occupied] @ colours \
+        / counts[occupied, numpy.newaxis]
+    
+    if occupied.any():
+        image[occupied, 3] = 0.2 + 0.8 * numpy.log1p(counts[occupied]) \
+            / numpy.log1p(counts.max())
+    
+    return image.reshape(raster_shape + (4,))
+
+def aggregatedMeans(bin_indices, raster_shape, weights):
+    
+    number_of_bins = raster_shape[0] * raster_shape[1]
+    
+    counts = numpy.bincount(bin_indices, minlength = number_of_bins)
+    sums = numpy.bincount(bin_indices, weights = weights,
+        minlength = number_of_bins)
+    
+    means = numpy.ma.masked_where(counts == 0, sums)
+    means /= numpy.maximum(counts, 1)
+    
+    return means.reshape(raster_shape)
+
 def plotProbabilities(posterior_probabilities, prior_probabilities, 
     x_label = None, y_label = None,
     palette = None, uniform = False, name = None):
@@ -4012,7 +5613,7 @@ def plotProbabilities(posterior_probabilities, prior_probabilities,
     axis = figure.add_subplot(1, 1, 1)
     
     if not palette:
-        palette = [standard_palette[0]] * K
+        palette = [standard_palette()[0]] * K
     
     if posterior_probabilities is not None:
         K = len(posterior_probabilities)
@@ -4243,16 +5844,24 @@ def axisLabelForSymbol(symbol, coordinate = None, decomposition_method = None,
     
     return axis_label
 
-class CustomTicker(LogFormatterSciNotation):
-    def __call__(self, x, pos = None):
-        if 0.1 <= x < 1:
-            tick_label = "{:.1f}".format(x)
-        elif 1 <= x < 100:
-            tick_label = "{:.0f}".format(x)
-        else:
-            tick_label =  LogFormatterSciNotation.__call__(self, x, pos = None)
-        print(tick_label)
-        return tick_label
+def customTicker():
+    
+    # The formatter class is defined here, since matplotlib is only imported
+    # when first used.
+    
+    class CustomTicker(matplotlib.ticker.LogFormatterSciNotation):
+        def __call__(self, x, pos = None):
+            if 0.1 <= x < 1:
+                tick_label = "{:.1f}".format(x)
+            elif 1 <= x < 100:
+                tick_label = "{:.0f}".format(x)
+            else:
+                tick_label = matplotlib.ticker.LogFormatterSciNotation\
+                    .__call__(self, x, pos = None)
+            print(tick_label)
+            return tick_label
+    
+    return CustomTicker()
 
 def parseAnalyses(analyses):
     
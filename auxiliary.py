@@ -23,6 +23,7 @@ import shutil
 import time
 
 import re
+import importlib
 
 from functools import reduce
 from operator import mul
@@ -31,9 +32,52 @@ from math import floor
 
 import urllib.request
 
-from tensorboard.backend.event_processing import event_multiplexer
 import numpy
 
+# Modules
+
+class LazyModule(object):
+    
+    # Stand-in for a module, which is only imported when one of its
+    # attributes is first accessed, so heavy dependencies are not loaded by
+    # runs not using them. Submodules not imported by the module itself are
+    # imported when accessed as attributes. A function can be given to be
+    # called once after the module has been imported.
+    
+    def __init__(self, name, initialisation = None):
+        self._name = name
+        self._module = None
+        self._initialisation = initialisation
+    
+    def __getattr__(self, attribute):
+        
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            if self._initialisation:
+                self._initialisation()
+        
+        try:
+            return getattr(self._module, attribute)
+        except AttributeError:
+            pass
+        
+        # Missing attributes, which are not submodules either, raise
+        # `AttributeError` as for modules, so `hasattr` and `getattr` with a
+        # default work.
+        
+        submodule_name = self._name + "." + attribute
+        
+        try:
+            return importlib.import_module(submodule_name)
+        except ModuleNotFoundError as exception:
+            if exception.name != submodule_name:
+                raise
+            raise AttributeError("module '{}' has no attribute '{}'".format(
+                self._name, attribute)) from None
+
+event_multiplexer = LazyModule(
+    "tensorboard.backend.event_processing.event_multiplexer")
+
 # Math
 
 def prod(iterable):
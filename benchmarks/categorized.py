@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+# Benchmark of the `Categorized` distribution against the previous
+# implementation summing lists of per-class tensors.
+# Run from the root directory as `python -m benchmarks.categorized`.
+
+import tensorflow as tf
+import numpy
+
+from tensorflow.contrib.distributions import Categorical, NegativeBinomial
+
+from distributions import Categorized
+from auxiliary import formatDuration
+
+import argparse
+import time
+
+class ListCategorized(Categorized):
+    """Previous implementation of `Categorized` for comparison."""
+    
+    def _mean(self):
+        cat_probs = self._cat_probs(log_probs = False)
+        cat_mean = tf.add_n([k * cat_probs[k] for k in range(self.K)])
+        dist_mean = cat_probs[-1] * (self.dist.mean() + self.K)
+        return cat_mean + dist_mean
+    
+    def _variance(self):
+        cat_probs = self._cat_probs(log_probs = False)
+        cat_2nd_moment = tf.add_n(
+            [k**2 * cat_probs[k] for k in range(self.K)])
+        dist_2nd_moment = cat_probs[-1] * (
+            2 * self.K * self.dist.mean()
+            + self.dist.variance()
+            + tf.square(self.dist.mean())
+            + self.K**2
+        )
+        return cat_2nd_moment + dist_2nd_moment - tf.square(self._mean())
+    
+    def _log_prob(self, x):
+        x = tf.convert_to_tensor(x, name = "x")
+        cat_log_prob = self.cat.log_prob(
+            tf.cast(tf.clip_by_value(x, 0, self.K), tf.int32))
+        return tf.where(x < self.K, cat_log_prob,
+            cat_log_prob + self.dist.log_prob(x - self.K))
+
+implementations = {
+    "list": ListCategorized,
+    "tensorised": Categorized
+}
+
+def main(batch_size = 100, feature_size = 20000, number_of_classes = [1, 5, 10],
+    sparsity = 0.9, number_of_repetitions = 10):
+    
+    random_state = numpy.random.RandomState(42)
+    
+    x_values = random_state.negative_binomial(
+        n = 2, p = 0.3, size = (batch_size, feature_size)).astype(numpy.float32)
+    x_values[random_state.rand(batch_size, feature_size) < sparsity] = 0
+    
+    print("Benchmarking `Categorized` with {} examples and {} features ({:.0f} % zeros).".format(
+        batch_size, feature_size, 100 * (x_values == 0).mean()))
+    print()
+    
+    for K in number_of_classes:
+        
+        logit_values = random_state.randn(
+            batch_size, feature_size, K + 1).astype(numpy.float32)
+        log_r_values = random_state.randn(
+            batch_size, feature_size).astype(numpy.float32)
+        p_values = random_state.rand(
+            batch_size, feature_size).astype(numpy.float32)
+        
+        results = {}
+        
+        for implementation_name, implementation in implementations.items():
+            
+            graph = tf.Graph()
+            
+            with graph.as_default():
+                
+                x = tf.placeholder(tf.float32, [None, feature_size])
+                logits = tf.placeholder(tf.float32, [None, feature_size, K + 1])
+                log_r = tf.placeholder(tf.float32, [None, feature_size])
+                p = tf.placeholder(tf.float32, [None, feature_size])
+                
+                buildCountDistribution = lambda theta: NegativeBinomial(
+                    total_count = tf.exp(theta["log_r"]),
+                    probs = theta["p"]
+                )
+                count_distribution_parameters = [{"log_r": log_r, "p": p}]
+                
+                distribution = implementation(
+                    dist = buildCountDistribution(
+                        *count_distribution_parameters),
+                    cat = Categorical(logits = logits),
+                    dist_class = buildCountDistribution,
+                    dist_parameters = count_distribution_parameters
+                )
+                
+                log_prob = tf.reduce_sum(distribution.log_prob(x))
+                gradients = tf.gradients(log_prob, [logits, log_r, p])
+                
+                fetches = {
+                    "mean": distribution.mean(),
+                    "variance": distribution.variance(),
+                    "log_prob": log_prob,
+                    "gradients": gradients
+                }
+                
+                number_of_operations = len(graph.get_operations())
+            
+            feed_dict = {
+                x: x_values,
+                logits: logit_values,
+                log_r: log_r_values,
+                p: p_values
+            }
+            
+            with tf.Session(graph = graph) as session:
+                
+                # Warm up
+                values = session.run(fetches, feed_dict = feed_dict)
+                
+                durations = {}
+                
+                for fetch_name, fetch in fetches.items():
+                    start_time = time.time()
+                    for r in range(number_of_repetitions):
+                        session.run(fetch, feed_dict = feed_dict)
+                    durations[fetch_name] = \
+                        (time.time() - start_time) / number_of_repetitions
+            
+            results[implementation_name] = {
+                "values": values,
+                "durations": durations,
+                "number of operations": number_of_operations
+            }
+        
+        print("K = {}:".format(K))
+        
+        for implementation_name, result in results.items():
+            print("    {} ({} operations): ".format(
+                implementation_name, result["number of operations"])
+                + ", ".join("{}: {}".format(fetch_name, formatDuration(duration))
+                    for fetch_name, duration in result["durations"].items()))
+        
+        for fetch_name in ["mean", "variance", "log_prob"]:
+            if not numpy.allclose(
+                results["list"]["values"][fetch_name],
+                results["tensorised"]["values"][fetch_name],
+                rtol = 1e-4, atol = 1e-4):
+                print("    Warning: values of {} differ.".format(fetch_name))
+        
+        print()
+
+parser = argparse.ArgumentParser(
+    description = "Benchmark the `Categorized` distribution.",
+    formatter_class = argparse.ArgumentDefaultsHelpFormatter
+)
+parser.add_argument(
+    "--batch-size", "-B",
+    type = int,
+    default = 100,
+    help = "number of examples in a batch"
+)
+parser.add_argument(
+    "--feature-size", "-F",
+    type = int,
+    default = 20000,
+    help = "number of features"
+)
+parser.add_argument(
+    "--number-of-classes", "-k",
+    type = int,
+    nargs = "+",
+    default = [1, 5, 10],
+    help = "numbers of reconstruction classes to benchmark"
+)
+parser.add_argument(
+    "--sparsity", "-s",
+    type = float,
+    default = 0.9,
+    help = "fraction of counts set to zero"
+)
+parser.add_argument(
+    "--number-of-repetitions", "-n",
+    type = int,
+    default = 10,
+    help = "number of timed runs for each computation"
+)
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    main(**vars(arguments))
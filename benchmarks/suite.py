@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#    http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+# Performance benchmark suite on synthetic count data sets.
+# Run from the root directory as `python -m benchmarks.suite`.
+
+import data
+import analysis
+
+from main import parseDistribution
+from auxiliary import (
+    formatDuration, normaliseString, title, subtitle,
+    LazyModule
+)
+
+import numpy
+import scipy.sparse
+
+import os
+import sys
+import subprocess
+import json
+import shutil
+import tempfile
+import argparse
+import itertools
+import contextlib
+import io
+import platform
+from time import time, strftime
+
+# Models are only imported when benchmarked, so the data-only run does not
+# import TensorFlow through this module.
+models = LazyModule("models")
+
+# Synthetic data sets
+
+def syntheticCountDataDictionary(number_of_examples, number_of_features,
+    sparsity = 0.9, number_of_classes = 5, scale = 10, seed = 60):
+    """
+    Generate a sparse count matrix with negative-binomially distributed
+    non-zero counts depending on the class of each example. Positions of the
+    non-zero values are drawn uniformly, so the resulting sparsity is at least
+    `sparsity`.
+    """
+    
+    random_state = numpy.random.RandomState(seed)
+    
+    M = number_of_examples
+    N = number_of_features
+    K = number_of_classes
+    
+    labels = random_state.randint(K, size = M)
+    
+    r = scale * random_state.rand(K, N)
+    p = random_state.rand(K, N)
+    
+    number_of_non_zero_values = int(round((1 - sparsity) * M * N))
+    non_zero_indices = numpy.unique(random_state.randint(
+        M * N, size = number_of_non_zero_values, dtype = numpy.int64))
+    rows, columns = numpy.divmod(non_zero_indices, N)
+    
+    non_zero_values = 1 + random_state.negative_binomial(
+        r[labels[rows], columns], p[labels[rows], columns])
+    
+    values = scipy.sparse.csr_matrix(
+        (non_zero_values.astype(numpy.float32), (rows, columns)),
+        shape = (M, N)
+    )
+    
+    example_names = numpy.array(["example {}".format(i + 1) for i in range(M)])
+    feature_names = numpy.array(["feature {}".format(j + 1) for j in range(N)])
+    
+    data_dictionary = {
+        "values": values,
+        "labels": labels,
+        "example names": example_names,
+        "feature names": feature_names
+    }
+    
+    return data_dictionary
+
+def syntheticDataSetName(number_of_examples, number_of_features, sparsity):
+    
+    name = "benchmark-{}x{}-sparsity_{}".format(
+        number_of_examples, number_of_features, sparsity)
+    
+    if name not in data.data_sets:
+        data.data_sets[name] = {
+            "URLs": {},
+            "loading function": lambda paths: syntheticCountDataDictionary(
+                number_of_examples, number_of_features, sparsity),
+            "example type": "counts"
+        }
+    
+    return name
+
+# Benchmarks
+
+def benchmarkData(name, directory, preprocessing_method_sets = []):
+    
+    results = {}
+    
+    start_time = time()
+    data_set = data.DataSet(name, directory = directory)
+    data_set.load()
+    results["load"] = time() - start_time
+    
+    start_time = time()
+    training_set, validation_set, test_set = data_set.split("random", 0.9)
+    results["split"] = time() - start_time
+    
+    # Each set of preprocessing methods is applied to the loaded values as in
+    # `DataSet.load`, and the preprocessed data set is split again, since the
+    # preprocessed values are split as well. The scikit-learn module used for
+    # preprocessing is imported first, so its import is not timed.
+    
+    if preprocessing_method_sets:
+        data.sklearn.preprocessing
+    
+    for preprocessing_methods in preprocessing_method_sets:
+        
+        variant = "-".join(map(normaliseString, preprocessing_methods))
+        
+        preprocessed_data_set = data.DataSet(name, directory = directory,
+            preprocessing_methods = preprocessing_methods)
+        preprocessed_data_set.update(
+            values = data_set.values,
+            labels = data_set.labels,
+            example_names = data_set.example_names,
+            feature_names = data_set.feature_names
+        )
+        
+        start_time = time()
+        preprocessed_data_set.preprocess()
+        results["preprocess-" + variant] = time() - start_time
+        
+        start_time = time()
+        preprocessed_data_set.split("random", 0.9)
+        results["split-" + variant] = time() - start_time
+    
+    return results, (training_set, validation_set, test_set)
+
+def benchmarkModel(model_type, reconstruction_distribution,
+    number_of_samples, data_sets, directory, batch_size = 100,
+    number_of_epochs = 1):
+    
+    training_set, validation_set, test_set = data_sets
+    
+    number_of_importance_samples, number_of_monte_carlo_samples = \
+        number_of_samples
+    
+    model_arguments = {
+        "feature_size": training_set.number_of_features,
+        "latent_size": 10,
+        "hidden_sizes": [100],
+        "number_of_importance_samples": {
+            "training": number_of_importance_samples,
+            "evaluation": number_of_importance_samples
+        },
+        "number_of_monte_carlo_samples": {
+            "training": number_of_monte_carlo_samples,
+            "evaluation": number_of_monte_carlo_samples
+        },
+        "number_of_latent_clusters": training_set.number_of_classes,
+        "reconstruction_distribution": parseDistribution(
+            reconstruction_distribution),
+        "number_of_reconstruction_classes": 0,
+        "log_directory": os.path.join(directory, "log"),
+        "results_directory": os.path.join(directory, "results")
+    }
+    
+    if model_type == "VAE":
+        model = models.VariationalAutoencoder(
+            analytical_kl_term = True,
+            **model_arguments
+        )
+    elif model_type == "GMVAE":
+        model = models.GaussianMixtureVariationalAutoencoder(
+            prior_probabilities = {"method": "uniform", "values": None},
+            **model_arguments
+        )
+    else:
+        raise ValueError("Model type not found: `{}`.".format(model_type))
+    
+    model.train(
+        training_set, validation_set,
+        number_of_epochs = number_of_epochs,
+        batch_size = batch_size,
+        number_of_plotting_workers = 0,
+        reset_training = True,
+        profile = True
+    )
+    
+    profile_directory = os.path.join(model_arguments["results_directory"],
+        model.name, "profiles")
+    profile_filename = sorted(os.listdir(profile_directory))[-1]
+    with open(os.path.join(profile_directory, profile_filename), "r") \
+        as profile_file:
+        profile = json.load(profile_file)
+    
+    step_statistics = profile["summary"]["steps"]
+    number_of_steps = step_statistics["session_run"]["count"]
+    step_duration = sum(statistics["total"]
+        for statistics in step_statistics.values() if statistics)
+    
+    start_time = time()
+    model.evaluate(test_set, batch_size = batch_size,
+        output_versions = "reconstructed", log_results = False)
+    evaluation_duration = time() - start_time
+    
+    results = {
+        "training steps per second": number_of_steps / step_duration,
+        "evaluation examples per second":
+            test_set.number_of_examples / evaluation_duration
+    }
+    
+    return results
+
+def benchmarkAnalyses(data_sets):
+    
+    _, _, test_set = data_sets
+    
+    x = test_set.values
+    
+    random_state = numpy.random.RandomState(117)
+    x_tilde = x.toarray() * random_state.uniform(0.8, 1.2, size = x.shape)
+    
+    results = {}
+    
+    start_time = time()
+    analysis.computeCountAccuracies(x, x_tilde)
+    results["count accuracies"] = time() - start_time
+    
+    start_time = time()
+    analysis.computeCountAccuracies(x, x_tilde,
+        method = "orders of magnitude")
+    results["count accuracies (orders of magnitude)"] = time() - start_time
+    
+    start_time = time()
+    analysis.decompose(x, method = "PCA", components = 2)
+    results["PCA"] = time() - start_time
+    
+    return results
+
+# Start-up
+
+root_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+startup_modules = ["main", "cross_analysis"]
+
+# Dependencies, which should only be imported by runs using them
+heavy_modules = [
+    "tensorflow", "tensorboard", "sklearn",
+    "matplotlib", "seaborn", "PIL",
+    "pandas", "tables", "bs4", "stemming"
+]
+
+def benchmarkStartup(module_name):
+    """
+    Time importing the module `module_name` in a new Python process, and
+    return the timing together with the heavy dependencies it imported.
+    """
+    
+    code = "; ".join([
+        "import sys",
+        "from time import time",
+        "start_time = time()",
+        "import {}".format(module_name),
+        "print(time() - start_time)",
+        "print(' '.join(sys.modules))"
+    ])
+    
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd = root_directory,
+        universal_newlines = True
+    )
+    
+    duration, imported_modules = output.strip().split("\n")[-2:]
+    imported_modules = set(imported_modules.split())
+    
+    results = {"import": float(duration)}
+    imported_heavy_modules = [
+        module for module in heavy_modules
+        if module in imported_modules
+    ]
+    
+    return results, imported_heavy_modules
+
+# Dependencies, which should not be imported when only handling data
+modelling_modules = ["tensorflow", "tensorboard"]
+
+def benchmarkDataOnlyRun(number_of_examples, number_of_features, sparsity):
+    """
+    Time running `main.py` without modelling on a synthetic data set in a new
+    Python process, and return the timing together with the modelling
+    dependencies it imported.
+    """
+    
+    directory = tempfile.mkdtemp(prefix = "scvae-benchmark-")
+    
+    code = "; ".join([
+        "import sys",
+        "from time import time",
+        "from benchmarks.suite import syntheticDataSetName",
+        "from main import main",
+        "start_time = time()",
+        "main(syntheticDataSetName({}, {}, {}),".format(
+            number_of_examples, number_of_features, sparsity)
+            + " data_directory = {!r},".format(
+                os.path.join(directory, "data"))
+            + " log_directory = {!r},".format(
+                os.path.join(directory, "log"))
+            + " results_directory = {!r},".format(
+                os.path.join(directory, "results"))
+            + " skip_modelling = True, analyse = False)",
+        "print(time() - start_time)",
+        "print(' '.join(sys.modules))"
+    ])
+    
+    try:
+        output = subprocess.check_output(
+            [sys.executable, "-c", code],
+            cwd = root_directory,
+            universal_newlines = True
+        )
+    finally:
+        shutil.rmtree(directory)
+    
+    duration, imported_modules = output.strip().split("\n")[-2:]
+    imported_modules = set(imported_modules.split())
+    
+    results = {"run": float(duration)}
+    imported_modelling_modules = [
+        module for module in modelling_modules
+        if module in imported_modules
+    ]
+    
+    return results, imported_modelling_modules
+
+# Results
+
+higher_is_better_units = ["per second"]
+
+def runSuite(numbers_of_examples, numbers_of_features, sparsities,
+    model_types, reconstruction_distributions, numbers_of_samples,
+    preprocessing_method_sets = [], batch_size = 100, number_of_epochs = 1, startup_budget = 1):
+    
+    results = {}
+    startup_violations = []
+    
+    def addResults(group, subgroup, benchmark_results):
+        for name, value in benchmark_results.items():
+            key = "/".join([group, subgroup, name])
+            if any(unit in name for unit in higher_is_better_units):
+                unit = "1/s"
+                higher_is_better = True
+            else:
+                unit = "s"
+                higher_is_better = False
+            results[key] = {
+                "value": value,
+                "unit": unit,
+                "higher is better": higher_is_better
+            }
+            print("    {}: {}".format(key, formatBenchmarkValue(results[key])))
+    
+    print(subtitle("Start-up"))
+    
+    for module_name in startup_modules:
+        
+        startup_results, imported_heavy_modules = benchmarkStartup(
+            module_name)
+        addResults("start-up", module_name, startup_results)
+        
+        if startup_results["import"] > startup_budget:
+            startup_violations.append("{} imported in more than {}.".format(
+                module_name, formatDuration(startup_budget)))
+        
+        if imported_heavy_modules:
+            startup_violations.append("{} imported {}.".format(
+                module_name, ", ".join(imported_heavy_modules)))
+    
+    data_only_results, imported_modelling_modules = benchmarkDataOnlyRun(
+        min(numbers_of_examples), min(numbers_of_features), max(sparsities))
+    addResults("start-up", "data only", data_only_results)
+    
+    if imported_modelling_modules:
+        startup_violations.append("Data-only run imported {}.".format(
+            ", ".join(imported_modelling_modules)))
+    
+    for startup_violation in startup_violations:
+        print("    OVER BUDGET: {}".format(startup_violation))
+    
+    print()
+    
+    for M, N, sparsity in itertools.product(
+        numbers_of_examples, numbers_of_features, sparsities):
+        
+        name = syntheticDataSetName(M, N, sparsity)
+        
+        print(subtitle(name))
+        
+        directory = tempfile.mkdtemp(prefix = "scvae-benchmark-")
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            data_results, data_sets = benchmarkData(
+                name, os.path.join(directory, "data"),
+                preprocessing_method_sets = preprocessing_method_sets)
+        addResults(name, "data", data_results)
+        
+        for model_type, reconstruction_distribution, number_of_samples \
+            in itertools.product(model_types, reconstruction_distributions,
+                numbers_of_samples):
+            
+            model_name = "{}-{}-samples_{}x{}".format(model_type,
+                reconstruction_distribution, *number_of_samples)
+            
+            with contextlib.redirect_stdout(io.StringIO()):
+                model_results = benchmarkModel(
+                    model_type, reconstruction_distribution,
+                    number_of_samples, data_sets,
+                    directory = os.path.join(directory, model_name),
+                    batch_size = batch_size,
+                    number_of_epochs = number_of_epochs
+                )
+            addResults(name, model_name, model_results)
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            analysis_results = benchmarkAnalyses(data_sets)
+        addResults(name, "analyses", analysis_results)
+        
+        shutil.rmtree(directory)
+        
+        print()
+    
+    return results, startup_violations
+
+def formatBenchmarkValue(result):
+    if result["unit"] == "s":
+        return formatDuration(result["value"])
+    else:
+        return "{:.4g} {}".format(result["value"], result["unit"])
+
+def compareWithBaseline(results, baseline_results, tolerance = 0.1):
+    """
+    Compare results with baseline results and return the keys of the
+    benchmarks that are worse than the baseline by more than the relative
+    `tolerance`.
+    """
+    
+    regressions = []
+    
+    for key, result in sorted(results.items()):
+        
+        if key not in baseline_results:
+            continue
+        
+        value = result["value"]
+        baseline_value = baseline_results[key]["value"]
+        
+        if result["higher is better"]:
+            change = value / baseline_value - 1
+            regression = change < - tolerance
+        else:
+            change = baseline_value / value - 1
+            regression = change < - tolerance
+        
+        print("    {}{}: {} (baseline: {}, {:+.1f} %)".format(
+            "REGRESSION " if regression else "",
+            key,
+            formatBenchmarkValue(result),
+            formatBenchmarkValue(baseline_results[key]),
+            100 * change
+        ))
+        
+        if regression:
+            regressions.append(key)
+    
+    return regressions
+
+def main(numbers_of_examples = [1000, 10000], numbers_of_features = [500, 5000],
+    sparsities = [0.9], model_types = ["VAE", "GMVAE"],
+    reconstruction_distributions = ["poisson", "negative_binomial"],
+    numbers_of_samples = [[1, 1], [5, 10]],
+    preprocessing_method_sets = [["normalise"]], batch_size = 100,
+    number_of_epochs = 1, startup_budget = 1, output_path = None,
+    baseline_path = None, tolerance = 0.1):
+    
+    print(title("Benchmarks"))
+    
+    results, startup_violations = runSuite(
+        numbers_of_examples, numbers_of_features, sparsities,
+        model_types, reconstruction_distributions,
+        [tuple(samples) for samples in numbers_of_samples],
+        preprocessing_method_sets = preprocessing_method_sets,
+        batch_size = batch_size,
+        number_of_epochs = number_of_epochs,
+        startup_budget = startup_budget
+    )
+    
+    if output_path:
+        output = {
+            "timestamp": strftime("%Y-%m-%d %H:%M:%S"),
+            "machine": platform.node(),
+            "processor": platform.processor(),
+            "number of processors": os.cpu_count(),
+            "results": results
+        }
+        with open(output_path, "w") as output_file:
+            json.dump(output, output_file, indent = 4)
+        print("Results saved to {}.".format(output_path))
+        print()
+    
+    regressions = []
+    
+    if baseline_path:
+        
+        with open(baseline_path, "r") as baseline_file:
+            baseline_results = json.load(baseline_file)["results"]
+        
+        print(subtitle("Comparison with baseline"))
+        regressions = compareWithBaseline(results, baseline_results,
+            tolerance)
+        print()
+        
+        if regressions:
+            print("{} regressions beyond {:.0f} % found.".format(
+                len(regressions), 100 * tolerance))
+        else:
+            print("No regressions beyond {:.0f} % found.".format(
+                100 * tolerance))
+    
+    if startup_violations:
+        print("{} start-up budget violations found.".format(
+            len(startup_violations)))
+    
+    if regressions or startup_violations:
+        sys.exit(1)
+
+parser = argparse.ArgumentParser(
+    description = "Benchmark scVAE on synthetic count data sets.",
+    formatter_class = argparse.ArgumentDefaultsHelpFormatter
+)
+parser.add_argument(
+    "--numbers-of-examples", "-m",
+    type = int,
+    nargs = "+",
+    default = [1000, 10000],
+    help = "numbers of examples (cells) in synthetic data sets"
+)
+parser.add_argument(
+    "--numbers-of-features", "-n",
+    type = int,
+    nargs = "+",
+    default = [500, 5000],
+    help = "numbers of features (genes) in synthetic data sets"
+)
+parser.add_argument(
+    "--sparsities", "-s",
+    type = float,
+    nargs = "+",
+    default = [0.9],
+    help = "minimum fractions of zeros in synthetic data sets"
+)
+parser.add_argument(
+    "--model-types",
+    type = str,
+    nargs = "+",
+    default = ["VAE", "GMVAE"],
+    help = "model types to benchmark"
+)
+parser.add_argument(
+    "--reconstruction-distributions", "-r",
+    type = str,
+    nargs = "+",
+    default = ["poisson", "negative_binomial"],
+    help = "reconstruction distributions to benchmark"
+)
+parser.add_argument(
+    "--numbers-of-samples",
+    type = int,
+    nargs = 2,
+    action = "append",
+    metavar = ("IMPORTANCE", "MONTE_CARLO"),
+    help = "numbers of importance and Monte Carlo samples to benchmark (can be repeated; default: 1 1 and 5 10)"
+)
+parser.add_argument(
+    "--preprocessing-method-sets",
+    type = str,
+    nargs = "+",
+    action = "append",
+    help = "sets of methods for preprocessing the data sets to benchmark, each applied in order (can be repeated; default: normalise)"
+)
+parser.add_argument(
+    "--batch-size", "-M",
+    type = int,
+    default = 100,
+    help = "batch size used for training and evaluation"
+)
+parser.add_argument(
+    "--number-of-epochs", "-e",
+    type = int,
+    default = 1,
+    help = "number of epochs to train each model"
+)
+parser.add_argument(
+    "--startup-budget",
+    type = float,
+    default = 1,
+    help = "maximum time in seconds for importing `main.py` and `cross_analysis.py`, which should also not import heavy dependencies"
+)
+parser.add_argument(
+    "--output", "-o",
+    type = str,
+    dest = "output_path",
+    help = "path to JSON file in which to save results (e.g. as a baseline)"
+)
+parser.add_argument(
+    "--baseline", "-b",
+    type = str,
+    dest = "baseline_path",
+    help = "path to JSON file with baseline results to compare with"
+)
+parser.add_argument(
+    "--tolerance", "-t",
+    type = float,
+    default = 0.1,
+    help = "relative slowdown compared to the baseline flagged as a regression"
+)
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    if arguments.numbers_of_samples is None:
+        arguments.numbers_of_samples = [[1, 1], [5, 10]]
+    if arguments.preprocessing_method_sets is None:
+        arguments.preprocessing_method_sets = [["normalise"]]
+    main(**vars(arguments))
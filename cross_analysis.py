@@ -22,14 +22,15 @@ import os
 
 import pickle
 import gzip
-import pandas
+import sqlite3
+import multiprocessing
 
 import re
 
 from itertools import product
 from string import ascii_uppercase
 from math import inf
-from scipy.stats import pearsonr
+from time import time
 
 import argparse
 
@@ -37,7 +38,13 @@ from analysis import (
     formatStatistics, saveFigure,
     plotCorrelations, plotELBOHeatMap
 )
-from auxiliary import formatTime, title, subtitle, prod
+from auxiliary import (
+    formatTime, formatDuration, title, subtitle, prod,
+    LazyModule
+)
+
+scipy = LazyModule("scipy")
+pandas = LazyModule("pandas")
 
 test_metrics_basename = "test-metrics"
 test_prediction_basename = "test-prediction"
@@ -45,6 +52,17 @@ test_prediction_basename = "test-prediction"
 zipped_pickle_extension = ".pkl.gz"
 log_extension = ".log"
 
+results_catalog_filename = "results_catalog.sqlite"
+results_catalog_version = 2
+
+# Test-metrics fields used for comparisons and summaries of models, which
+# include the statistics of reconstructions, so only count accuracies and
+# class statistics are left out
+cross_analysis_fields = [
+    "timestamp", "number of epochs trained", "evaluation",
+    "accuracy", "superset_accuracy", "statistics", "predictions"
+]
+
 def main(log_directory = None, results_directory = None,
     data_set_included_strings = [], 
     data_set_excluded_strings = [], 
@@ -54,7 +72,9 @@ def main(log_directory = None, results_directory = None,
     prediction_excluded_strings = [],
     epoch_cut_off = inf,
     export_options = [],
-    log_summary = False):
+    log_summary = False,
+    rebuild_results_catalog = False,
+    number_of_loading_workers = None):
     
     if log_directory:
         log_directory = os.path.normpath(log_directory) + os.sep
@@ -143,7 +163,10 @@ def main(log_directory = None, results_directory = None,
             data_set_included_strings,
             data_set_excluded_strings,
             model_included_strings,
-            model_excluded_strings
+            model_excluded_strings,
+            fields = cross_analysis_fields,
+            rebuild_catalog = rebuild_results_catalog,
+            number_of_workers = number_of_loading_workers
         )
         
         model_IDs = modelID()
@@ -337,7 +360,7 @@ def main(log_directory = None, results_directory = None,
                 for set_name in correlation_sets:
                     if len(correlation_sets[set_name]["ELBO"]) < 2:
                         continue
-                    correlation_coefficient, _ = pearsonr(
+                    correlation_coefficient, _ = scipy.stats.pearsonr(
                         correlation_sets[set_name]["ELBO"],
                         correlation_sets[set_name]["ARI"]
                     )
@@ -585,80 +608,305 @@ def main(log_directory = None, results_directory = None,
 
 def testMetricsInResultsDirectory(results_directory,
     data_set_included_strings, data_set_excluded_strings,
-    model_included_strings, model_excluded_strings):
+    model_included_strings, model_excluded_strings,
+    fields = None, rebuild_catalog = False, number_of_workers = None):
     
-    test_metrics_filename = test_metrics_basename + zipped_pickle_extension
+    # Only the test-metrics fields in `fields` are loaded, or all of them if
+    # `fields` is `None`. Predictions are stored as the field "predictions".
+    
+    catalog = openResultsCatalog(results_directory, rebuild = rebuild_catalog)
+    
+    refreshResultsCatalog(catalog, results_directory,
+        number_of_workers = number_of_workers)
+    
+    # Matching data sets and models are found using the catalog, so only
+    # the metrics of these are unpickled.
+    
+    conditions = []
+    parameters = []
+    
+    for column, included_strings, excluded_strings in [
+        ("runs.data_set", data_set_included_strings,
+            data_set_excluded_strings),
+        ("runs.model", model_included_strings, model_excluded_strings)]:
+        
+        for search_string in included_strings:
+            conditions.append("instr({}, ?) > 0".format(column))
+            parameters.append(search_string)
+        
+        for search_string in excluded_strings:
+            conditions.append("instr({}, ?) = 0".format(column))
+            parameters.append(search_string)
+    
+    if fields is not None:
+        conditions.append("run_fields.field IN ({})".format(
+            ", ".join("?" * len(fields))))
+        parameters.extend(fields)
+    
+    query = "SELECT runs.data_set, runs.model, run_fields.field, " \
+        + "run_fields.value FROM runs " \
+        + "JOIN run_fields ON run_fields.path = runs.path"
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    query += " ORDER BY runs.data_set, runs.model"
     
     test_metrics_set = {}
     
+    for data_set, model, field, value in catalog.execute(query, parameters):
+        
+        if not data_set in test_metrics_set:
+            test_metrics_set[data_set] = {}
+        
+        if not model in test_metrics_set[data_set]:
+            test_metrics_set[data_set][model] = {}
+        
+        test_metrics_set[data_set][model][field] = pickle.loads(value)
+    
+    catalog.close()
+    
+    return test_metrics_set
+
+def openResultsCatalog(results_directory, rebuild = False):
+    
+    catalog_path = os.path.join(results_directory, results_catalog_filename)
+    
+    if rebuild and os.path.exists(catalog_path):
+        os.remove(catalog_path)
+    
+    catalog = sqlite3.connect(catalog_path)
+    
+    # Catalogs with an older layout are rebuilt
+    
+    catalog_version = catalog.execute("PRAGMA user_version").fetchone()[0]
+    
+    if catalog_version != results_catalog_version:
+        catalog.executescript("""
+            DROP TABLE IF EXISTS run_fields;
+            DROP TABLE IF EXISTS runs;
+            PRAGMA user_version = {};
+        """.format(results_catalog_version))
+    
+    catalog.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            path TEXT PRIMARY KEY,
+            data_set TEXT NOT NULL,
+            model TEXT NOT NULL,
+            timestamp REAL,
+            number_of_epochs_trained INTEGER,
+            lower_bound REAL,
+            accuracy REAL,
+            superset_accuracy REAL,
+            files TEXT NOT NULL,
+            modification_time REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_data_set_and_model
+            ON runs (data_set, model, timestamp);
+        CREATE TABLE IF NOT EXISTS run_fields (
+            path TEXT NOT NULL,
+            field TEXT NOT NULL,
+            value BLOB NOT NULL,
+            PRIMARY KEY (path, field)
+        );
+    """)
+    
+    return catalog
+
+def refreshResultsCatalog(catalog, results_directory, number_of_workers = None):
+    
+    # Runs are only loaded again, if their metrics or prediction files have
+    # been added, removed, or modified since they were last catalogued.
+    # The results directory is walked first, and the runs to load are then
+    # loaded concurrently by a pool of processes.
+    
+    print("Refreshing results catalog.")
+    refreshing_time_start = time()
+    
+    test_metrics_filename = test_metrics_basename + zipped_pickle_extension
+    
+    catalogued_runs = {
+        path: (files, modification_time)
+        for path, files, modification_time in catalog.execute(
+            "SELECT path, files, modification_time FROM runs")
+    }
+    
+    found_paths = set()
+    runs_to_load = []
+    
     for path, _, filenames in os.walk(results_directory):
         
+        if test_metrics_filename not in filenames:
+            continue
+        
         data_set_model = path.replace(results_directory, "")
-        data_set_model_parts = data_set_model.split(os.sep)
-        data_set = os.sep.join(data_set_model_parts[:3])
-        model = os.sep.join(data_set_model_parts[3:])
         
-        # Verify data set match
+        found_paths.add(data_set_model)
         
-        data_set_match = matchString(
-            data_set,
-            data_set_included_strings,
-            data_set_excluded_strings
+        run_filenames = sorted(
+            filename for filename in filenames
+            if filename == test_metrics_filename
+            or filename.startswith(test_prediction_basename)
+            and filename.endswith(zipped_pickle_extension)
+        )
+        files = "\n".join(run_filenames)
+        modification_time = max(
+            os.path.getmtime(os.path.join(path, filename))
+            for filename in run_filenames
         )
         
-        if not data_set_match:
+        if catalogued_runs.get(data_set_model) == (files,
+            modification_time):
             continue
         
-        # Verify model match
+        runs_to_load.append(
+            (path, data_set_model, run_filenames, files, modification_time))
+    
+    removed_paths = set(catalogued_runs) - found_paths
+    
+    for path in removed_paths:
+        catalog.execute("DELETE FROM runs WHERE path = ?", (path,))
+        catalog.execute("DELETE FROM run_fields WHERE path = ?", (path,))
+    
+    walking_duration = time() - refreshing_time_start
+    print("    Results directory walked: {} runs found, {} to load ({})."\
+        .format(len(found_paths), len(runs_to_load),
+            formatDuration(walking_duration)))
+    
+    if runs_to_load:
         
-        model_match = matchString(
-            model,
-            model_included_strings,
-            model_excluded_strings
-        )
+        loading_time_start = time()
         
-        if not model_match:
-            continue
+        if number_of_workers is None:
+            number_of_workers = multiprocessing.cpu_count()
         
-        # Verify metrics found
+        number_of_workers = max(1, min(number_of_workers, len(runs_to_load)))
         
-        if test_metrics_filename in filenames:
-            
-            if not data_set in test_metrics_set:
-                test_metrics_set[data_set] = {}
-            
-            test_metrics_path = os.path.join(path, test_metrics_filename)
+        number_of_runs_between_progress = max(1, len(runs_to_load) // 10)
+        
+        with multiprocessing.Pool(number_of_workers) as pool:
             
-            with gzip.open(test_metrics_path, "r") as test_metrics_file:
-                test_metrics_data = pickle.load(test_metrics_file)
+            for i, (run, (run_values, field_values)) in enumerate(zip(
+                runs_to_load,
+                pool.imap(_loadRunForCatalog,
+                    [(run[0], run[2]) for run in runs_to_load],
+                    chunksize = 4)
+                ), start = 1):
+                
+                path, data_set_model, _, files, modification_time = run
+                
+                data_set_model_parts = data_set_model.split(os.sep)
+                data_set = os.sep.join(data_set_model_parts[:3])
+                model = os.sep.join(data_set_model_parts[3:])
+                
+                catalog.execute(
+                    "INSERT OR REPLACE INTO runs VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (data_set_model, data_set, model) + run_values
+                        + (files, modification_time)
+                )
+                catalog.execute("DELETE FROM run_fields WHERE path = ?",
+                    (data_set_model,))
+                catalog.executemany(
+                    "INSERT INTO run_fields VALUES (?, ?, ?)",
+                    [
+                        (data_set_model, field, value)
+                        for field, value in field_values.items()
+                    ]
+                )
+                
+                if i % number_of_runs_between_progress == 0 \
+                    or i == len(runs_to_load):
+                    print("    {} of {} runs loaded ({}).".format(
+                        i, len(runs_to_load),
+                        formatDuration(time() - loading_time_start)))
+        
+        loading_duration = time() - loading_time_start
+        print("    Runs loaded using {} processes ({}).".format(
+            number_of_workers, formatDuration(loading_duration)))
+    
+    catalog.commit()
+    
+    refreshing_duration = time() - refreshing_time_start
+    print("Results catalog refreshed: {} of {} runs updated and {} removed "
+        "({}).".format(len(runs_to_load), len(found_paths),
+            len(removed_paths), formatDuration(refreshing_duration)))
+    
+    print()
+
+def _loadRunForCatalog(arguments):
+    
+    # Scalar metrics for the catalog and each field pickled separately, so
+    # they can be loaded on their own
+    
+    path, filenames = arguments
+    
+    test_metrics = loadTestMetrics(path, filenames)
+    
+    evaluation = test_metrics.get("evaluation") or {}
+    
+    if "lower_bound" in evaluation:
+        lower_bound = float(evaluation["lower_bound"][-1])
+    else:
+        lower_bound = None
+    
+    accuracies = {}
+    
+    for accuracy in ["accuracy", "superset_accuracy"]:
+        if test_metrics.get(accuracy):
+            accuracies[accuracy] = float(test_metrics[accuracy][-1])
+        else:
+            accuracies[accuracy] = None
+    
+    run_values = (
+        test_metrics.get("timestamp"),
+        test_metrics.get("number of epochs trained"),
+        lower_bound,
+        accuracies["accuracy"],
+        accuracies["superset_accuracy"]
+    )
+    
+    field_values = {
+        field: pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        for field, value in test_metrics.items()
+    }
+    
+    return run_values, field_values
+
+def loadTestMetrics(path, filenames):
+    
+    test_metrics_filename = test_metrics_basename + zipped_pickle_extension
+    
+    test_metrics_path = os.path.join(path, test_metrics_filename)
+    
+    with gzip.open(test_metrics_path, "r") as test_metrics_file:
+        test_metrics_data = pickle.load(test_metrics_file)
+    
+    predictions = {}
+    
+    for filename in filenames:
+        if filename.startswith(test_prediction_basename) \
+            and filename.endswith(zipped_pickle_extension):
             
-            predictions = {}
+            prediction_name = filename\
+                .replace(zipped_pickle_extension, "")\
+                .replace(test_prediction_basename, "")\
+                .replace("-", "")
             
-            for filename in filenames:
-                if filename.startswith(test_prediction_basename) \
-                    and filename.endswith(zipped_pickle_extension):
-                    
-                    prediction_name = filename\
-                        .replace(zipped_pickle_extension, "")\
-                        .replace(test_prediction_basename, "")\
-                        .replace("-", "")
-                    
-                    test_prediction_path = os.path.join(path, filename)
-                    
-                    with gzip.open(test_prediction_path, "r") as \
-                        test_prediction_file:
-                        
-                        test_prediction_data = pickle.load(
-                            test_prediction_file)
-                    
-                    predictions[prediction_name] = test_prediction_data
+            test_prediction_path = os.path.join(path, filename)
             
-            if predictions:
-                test_metrics_data["predictions"] = predictions
+            with gzip.open(test_prediction_path, "r") as \
+                test_prediction_file:
+                
+                test_prediction_data = pickle.load(
+                    test_prediction_file)
             
-            test_metrics_set[data_set][model] = test_metrics_data
+            predictions[prediction_name] = test_prediction_data
     
-    return test_metrics_set
+    if predictions:
+        test_metrics_data["predictions"] = predictions
+    
+    return test_metrics_data
 
 def matchString(string, included_strings, excluded_strings):
     
@@ -980,6 +1228,18 @@ parser.add_argument(
     help = "do not log summary"
 )
 parser.set_defaults(log_summary = False)
+parser.add_argument(
+    "--rebuild-results-catalog",
+    action = "store_true",
+    help = "rebuild the catalog of runs in the results directory instead of only refreshing changed runs"
+)
+parser.set_defaults(rebuild_results_catalog = False)
+parser.add_argument(
+    "--number-of-loading-workers",
+    type = int,
+    default = None,
+    help = "number of processes loading new or changed runs into the results catalog (default: one per CPU core)"
+)
 parser.add_argument(
     "--export-options",
     type = str,
@@ -24,30 +24,33 @@ import struct
 import random
 
 import re
-from bs4 import BeautifulSoup
-
-import pandas
-import tables
 import json
+import colorsys
 
 import numpy
 import scipy.sparse
 import scipy.io
-import sklearn.preprocessing
-import stemming.porter2 as stemming
 
 from functools import reduce
 
-import seaborn
-
 from time import time
 
 from auxiliary import (
     formatDuration,
     normaliseString, properString, isfloat,
-    downloadFile, copyFile
+    downloadFile, copyFile,
+    LazyModule
 )
 
+# Modules only needed for some data sets or preprocessing methods are imported
+# when first used.
+
+bs4 = LazyModule("bs4")
+pandas = LazyModule("pandas")
+tables = LazyModule("tables")
+sklearn = LazyModule("sklearn")
+stemming = LazyModule("stemming.porter2")
+
 preprocess_suffix = "preprocessed"
 original_suffix = "original"
 preprocessed_extension = ".sparse.h5"
@@ -588,6 +591,14 @@ data_sets = {
     }
 }
 
+# Colours of the Set3 palette of ColorBrewer as RGB values, given here, so
+# plotting modules are not imported when setting up data sets
+set3_palette = [
+    (141, 211, 199), (255, 255, 179), (190, 186, 218), (251, 128, 114),
+    (128, 177, 211), (253, 180, 98), (179, 222, 105), (252, 205, 229),
+    (217, 217, 217), (188, 128, 189), (204, 235, 197), (255, 237, 111)
+]
+
 DIMM_SC_class_mapper = {
     "CD14+ monocytes": ["CD14+ Monocytes"],
     "CD19+ B cells": [
@@ -1526,12 +1537,12 @@ class DataSet(object):
         )
         if self.total_standard_deviations is not None:
             self.update(
-                total_standard_deviations = \
-                    self.total_standard_deviations[filter_indices])
+                total_standard_deviations = filterExampleRows(
+                    self.total_standard_deviations, filter_indices))
         if self.explained_standard_deviations is not None:
             self.update(
-                explained_standard_deviations = \
-                    self.explained_standard_deviations[filter_indices])
+                explained_standard_deviations = filterExampleRows(
+                    self.explained_standard_deviations, filter_indices))
         if self.preprocessed_values is not None:
             self.update(
                 preprocessed_values = self.preprocessed_values[filter_indices])
@@ -1555,6 +1566,19 @@ class DataSet(object):
         self.number_of_features = None
         self.number_of_classes = None
 
+def filterExampleRows(rows, filter_indices):
+    
+    # Rows kept only for some examples are stored in dictionaries keyed by
+    # example index.
+    if isinstance(rows, dict):
+        return {
+            new_index: rows[old_index]
+            for new_index, old_index in enumerate(filter_indices)
+            if old_index in rows
+        }
+    else:
+        return rows[filter_indices]
+
 class SparseRowMatrix(scipy.sparse.csr_matrix):
     def __init__(self, arg1, shape = None, dtype = None, copy = False):
         super(SparseRowMatrix, self).__init__(arg1, shape = shape,
@@ -1582,13 +1606,22 @@ class SparseRowMatrix(scipy.sparse.csr_matrix):
         return self_mean
     
     def std(self, axis = None, ddof = 0):
-        return numpy.sqrt(self.var(axis))
+        return numpy.sqrt(self.var(axis, ddof))
     
     def var(self, axis = None, ddof = 0):
         
-        self_squared = self.power(2)
-        self_squared_mean = self_squared.mean(axis)
-        self_squared = None
+        if axis is None:
+            # Sum the squared stored values in chunks instead of squaring
+            # the whole matrix into a copy.
+            self_squared_sum = 0.0
+            for i in range(0, self.data.size, 2**20):
+                data = self.data[i:i + 2**20].astype(numpy.float64)
+                self_squared_sum += numpy.dot(data, data)
+            self_squared_mean = self_squared_sum / self.size
+        else:
+            self_squared = self.power(2)
+            self_squared_mean = self_squared.mean(axis)
+            self_squared = None
         
         self_mean_squared = numpy.square(self.mean(axis))
         
@@ -1822,16 +1855,22 @@ def dataSetClassPalette(title):
     if "class palette" in data_sets[title]:
         class_palette = data_sets[title]["class palette"]
     elif "MNIST" in title:
-        index_palette = seaborn.hls_palette(10)
-        class_palette = {i: index_palette[i] for i in range(10)}
+        # Evenly spaced hues as `seaborn.hls_palette(10)`
+        class_palette = {
+            i: colorsys.hls_to_rgb((0.01 + i / 10) % 1, 0.6, 0.65)
+            for i in range(10)
+        }
     elif "DIMM-SC" in title:
         classes = [
             properString(c, DIMM_SC_class_mapper, normalise = False)
             for c in data_sets["DIMM-SC (10x, all)"]["URLs"]["all"].keys()
         ]
-        N = len(classes)
-        brewer_palette = seaborn.color_palette("Set3", N)
-        class_palette = {c: brewer_palette[i] for i, c in enumerate(classes)}
+        # Set3 colours repeated as `seaborn.color_palette("Set3", N)`
+        class_palette = {
+            c: tuple(
+                value / 255 for value in set3_palette[i % len(set3_palette)])
+            for i, c in enumerate(classes)
+        }
     else:
         class_palette = None
     return class_palette
@@ -2090,6 +2129,63 @@ def mapFeatures(values, feature_IDs, feature_mapping):
     
     return aggregated_values, feature_names
 
+def alignFeatures(data_set, feature_names):
+    """
+    Reorder the features of a data set to match the given feature names,
+    for instance those a model was trained on. Features missing in the data
+    set are set to zero, and features not in the given names are dropped.
+    """
+    
+    feature_index = {
+        feature_name: index
+        for index, feature_name in enumerate(data_set.feature_names)
+    }
+    
+    source_indices = []
+    target_indices = []
+    
+    for target_index, feature_name in enumerate(feature_names):
+        if feature_name in feature_index:
+            source_indices.append(feature_index[feature_name])
+            target_indices.append(target_index)
+    
+    N_missing_features = len(feature_names) - len(target_indices)
+    
+    if N_missing_features > 0:
+        print("{} feature{} not found in {} -- using zeros.".format(
+            N_missing_features, "s" if N_missing_features > 1 else "",
+            data_set.name))
+    
+    # Selection matrix mapping features of the data set to the given ones
+    selection = scipy.sparse.csr_matrix(
+        (numpy.ones(len(target_indices)), (source_indices, target_indices)),
+        shape = (data_set.number_of_features, len(feature_names))
+    )
+    
+    def align(values):
+        if values is None:
+            return None
+        return SparseRowMatrix(
+            scipy.sparse.csr_matrix(values).dot(selection).astype(
+                values.dtype))
+    
+    aligned_data_set = DataSet(
+        data_set.name,
+        values = align(data_set.values),
+        preprocessed_values = align(data_set.preprocessed_values),
+        binarised_values = align(data_set.binarised_values),
+        labels = data_set.labels,
+        example_names = data_set.example_names,
+        feature_names = numpy.array(feature_names),
+        preprocessing_methods = data_set.preprocessing_methods,
+        noisy_preprocessing_methods = data_set.noisy_preprocessing_methods,
+        kind = data_set.kind,
+        version = data_set.version,
+        directory = os.path.dirname(data_set.directory)
+    )
+    
+    return aligned_data_set
+
 def selectFeatures(values_dictionary, feature_names, feature_selection = None,
     feature_parameter = None, preprocessPath = None):
     
@@ -2376,6 +2472,95 @@ def preprocessingFunctionForDataSet(title, preprocessing_methods = [],
     
     return preprocessing_function
 
+def preprocessingStepsForDataSet(title, preprocessing_methods = [],
+    noisy = False):
+    
+    # Preprocessing methods not depending on the values of the data set as
+    # steps with explicit parameters (see `preprocessingFunctionForDataSet`),
+    # or `None` if any of the methods does.
+    
+    steps = []
+    
+    maximum_value = data_sets[title].get("maximum value")
+    
+    for preprocessing_method in preprocessing_methods:
+        
+        if preprocessing_method in ["gini", "idf"]:
+            return None
+        
+        elif preprocessing_method == "normalise":
+            if maximum_value is None:
+                return None
+            steps.append({"method": "scale", "scales": 1 / maximum_value})
+            maximum_value = 1
+        
+        elif preprocessing_method == "binarise":
+            normalisation = maximum_value or 1
+            if noisy:
+                steps.append({
+                    "method": "sample",
+                    "normalisation": normalisation
+                })
+            else:
+                steps.append({
+                    "method": "binarise",
+                    "threshold": 0.5 * normalisation
+                })
+    
+    return steps
+
+def inferencePreprocessingForDataSet(data_set, binarised_targets = False):
+    
+    # Preprocessing of inputs and targets of models trained on the data set
+    # as steps with explicit parameters, so it can be applied to new values
+    # without the data set (see `inference.py`). Weights and column
+    # normalisations depend on the full data set, so these are recovered as
+    # feature scales from the values and preprocessed values of the data set.
+    # This is not possible if the values are also binarised, in which case
+    # `None` is returned. Targets of `None` are the preprocessed inputs
+    # themselves, since noisy preprocessing is sampled once for both.
+    
+    if data_set.noisy_preprocessing_methods:
+        input_steps = preprocessingStepsForDataSet(data_set.title,
+            data_set.noisy_preprocessing_methods, noisy = True)
+        if input_steps is None:
+            return None
+        return {"inputs": input_steps, "targets": None}
+    
+    if data_set.has_preprocessed_values:
+        
+        input_steps = preprocessingStepsForDataSet(data_set.title,
+            data_set.preprocessing_methods)
+        
+        if input_steps is None:
+            
+            if "binarise" in data_set.preprocessing_methods:
+                return None
+            
+            value_sums = numpy.asarray(
+                data_set.values.sum(axis = 0), numpy.float64).reshape(-1)
+            preprocessed_value_sums = numpy.asarray(
+                data_set.preprocessed_values.sum(axis = 0),
+                numpy.float64).reshape(-1)
+            
+            scales = numpy.ones_like(value_sums)
+            non_zero = value_sums != 0
+            scales[non_zero] = \
+                preprocessed_value_sums[non_zero] / value_sums[non_zero]
+            
+            input_steps = [{"method": "scale", "scales": scales.tolist()}]
+    
+    else:
+        input_steps = []
+    
+    if binarised_targets:
+        target_steps = preprocessingStepsForDataSet(data_set.title,
+            ["binarise"])
+    else:
+        target_steps = []
+    
+    return {"inputs": input_steps, "targets": target_steps}
+
 def splitDataSet(data_dictionary, method = "default", fraction = 0.9):
     
     print("Splitting data set.")
@@ -3212,7 +3397,7 @@ def loadReutersDataSet(paths):
         for article_filename in article_filenames:
             
             with tarball.extractfile(article_filename) as article_html:
-                soup = BeautifulSoup(article_html, 'html.parser')
+                soup = bs4.BeautifulSoup(article_html, 'html.parser')
             
             for article in soup.find_all("reuters"):
                 
@@ -69,6 +69,8 @@ class Categorized(distribution.Distribution):
   def __init__(self,
                cat,
                dist,
+               dist_class=None,
+               dist_parameters=None,
                validate_args=False,
                allow_nan_stats=True,
                name="Categorized"):
@@ -87,6 +89,12 @@ class Categorized(distribution.Distribution):
           of `distributions`.
       dist: A `Distribution` instance.
         The instance must have `batch_shape` matching the `Categorical`.
+      dist_class: Python callable building `dist` from `dist_parameters`
+        (optional). If given, the count distribution is only evaluated for
+        values in the tail by building it from the gathered parameters.
+      dist_parameters: Python list of arguments for `dist_class`, which are
+        tensors or dictionaries of tensors. Floating-point tensors must
+        broadcast to the batch shape.
       validate_args: Python `bool`, default `False`. If `True`, raise a runtime
         error if batch or event ranks are inconsistent between cat and any of
         the distributions. This is only checked if the ranks cannot be
@@ -158,7 +166,10 @@ class Categorized(distribution.Distribution):
 
       self._cat = cat
       self._dist = dist
+      self._dist_class = dist_class
+      self._dist_parameters = dist_parameters
       self._K = self._static_cat_event_size - 1
+      self._counts = np.arange(self._K, dtype=np.float64)
       self._static_event_shape = static_event_shape
       self._static_batch_shape = static_batch_shape
 
@@ -205,46 +216,64 @@ class Categorized(distribution.Distribution):
 
   def _mean(self):
     with ops.control_dependencies(self._assertions):
-      # List of batch tensors for categorical probabilities, pi_k.  
-      cat_probs = self._cat_probs(log_probs = False)
-      # Individual contributions to categorical mean: k * pi_k
-      cat_means = [k * cat_probs[k] for k in range(self.K)]
-      # E_cat[x] = \sum^{K-1}_k k * pi_k
-      cat_mean = math_ops.add_n(cat_means)
+      # Categorical mean, E_cat[x] = \sum^{K-1}_k k * pi_k, and probability
+      # of the count distribution, pi_K
+      cat_mean, dist_prob = self._cat_moments(orders = [1])
 
       # Scaled count distribution mean shifted by K: pi_K * (E_dist[x] + K) 
-      dist_mean = cat_probs[-1] * (self._dist.mean() + self.K)
+      dist_mean = dist_prob * (self._dist.mean() + self.K)
 
       return cat_mean + dist_mean
 
   def _variance(self):
     with ops.control_dependencies(self._assertions):
-      # List of batch tensors for categorical probabilities, pi_k.  
-      cat_probs = self._cat_probs(log_probs = False)
-      # Individual contributions to categorical 2nd moment: k^2 * pi_k
-      cat_2nd_moments = [k**2 * cat_probs[k] for k in range(self.K)]
-      # E_cat[x] = \sum^{K-1}_k k^2 * pi_k
-      cat_2nd_moment = math_ops.add_n(cat_2nd_moments)
+      # Categorical 1st and 2nd moments, \sum^{K-1}_k k^n * pi_k, and
+      # probability of the count distribution, pi_K
+      cat_mean, cat_2nd_moment, dist_prob = self._cat_moments(orders = [1, 2])
+
+      dist_mean = self._dist.mean()
+
+      # Mean: E[x] = E_cat[x] + pi_K * (E_dist[x] + K)
+      mean = cat_mean + dist_prob * (dist_mean + self.K)
 
       # Scaled count distribution 2nd moment shifted by K: 
       #    pi_K * (2*K*E_dist[x] + V_dist[x] + E_dist[x]^2 + K^2) 
-      dist_2nd_moment = cat_probs[-1] * \
+      dist_2nd_moment = dist_prob * \
         (
-          2 * self.K * self._dist.mean() +\
+          2 * self.K * dist_mean +\
           self._dist.variance() +\
-          math_ops.square(self._dist.mean()) +\
+          math_ops.square(dist_mean) +\
           self.K**2
         )
 
-      # Variance: V[x] = E 
-      return (cat_2nd_moment + dist_2nd_moment) - math_ops.square(self._mean())
+      # Variance: V[x] = E[x^2] - E[x]^2
+      return (cat_2nd_moment + dist_2nd_moment) - math_ops.square(mean)
 
   def _log_prob(self, x):
     with ops.control_dependencies(self._assertions):
       x = ops.convert_to_tensor(x, name="x")
       cat_log_prob = self._cat.log_prob(math_ops.cast(clip_ops.clip_by_value(x, 0, self.K), dtypes.int32))
-      return where(x < self.K, cat_log_prob, 
-        cat_log_prob + self._dist.log_prob(x - self.K))
+
+      if self._static_event_shape.ndims != 0 or self._dist_class is None:
+        return where(x < self.K, cat_log_prob, 
+          cat_log_prob + self._dist.log_prob(x - self.K))
+
+      # Evaluate the count distribution only for the tail, x >= K, and
+      # scatter the results back into the full batch shape
+      tail_indices = array_ops.where(x >= self.K)
+      tail_dist = self._dist_class(*[
+        _gatherParameters(parameter, tail_indices, x)
+        for parameter in self._dist_parameters
+      ])
+      tail_log_prob = tail_dist.log_prob(
+        array_ops.gather_nd(x, tail_indices) - self.K)
+      dist_log_prob = array_ops.scatter_nd(
+        tail_indices,
+        tail_log_prob,
+        math_ops.cast(array_ops.shape(x), dtypes.int64)
+      )
+
+      return cat_log_prob + dist_log_prob
 
   def _prob(self, x):
     return math_ops.exp(self._log_prob(x))
@@ -417,3 +446,43 @@ class Categorized(distribution.Distribution):
       axis=-1
     )
     return cat_probs
+
+  def _cat_moments(self, orders):
+    r"""Get batchwise categorical raw moments, \sum^{K-1}_k k^n * pi_k, for
+    each order n in `orders` followed by the probability pi_K.
+
+    All moments are computed with a single matrix multiplication of the
+    categorical probabilities with the precomputed count powers.
+    """
+    cat_probs = nn_ops.softmax(self.cat.logits)
+    count_powers = ops.convert_to_tensor(
+      np.stack([self._counts ** n for n in orders], axis=-1),
+      dtype=cat_probs.dtype
+    )
+    cat_moments = math_ops.tensordot(
+      cat_probs[..., :self.K], count_powers, axes=1)
+    cat_moments = array_ops.unstack(cat_moments, num=len(orders), axis=-1)
+    return cat_moments + [cat_probs[..., self.K]]
+
+
+def _gatherParameters(parameters, indices, x):
+  """Gather the batch members of `parameters` at `indices` (as returned by
+  `where` for a tensor, `x`, of the full batch shape) into a flat batch shape.
+
+  Floating-point tensors are broadcast to the shape of `x` before gathering,
+  and dictionaries, lists, and tuples of them are gathered recursively. Other
+  values are kept as they are.
+  """
+  if isinstance(parameters, dict):
+    return {
+      name: _gatherParameters(value, indices, x)
+      for name, value in parameters.items()
+    }
+  elif isinstance(parameters, (list, tuple)):
+    return type(parameters)(
+      _gatherParameters(value, indices, x) for value in parameters)
+  elif isinstance(parameters, ops.Tensor) and parameters.dtype.is_floating:
+    return array_ops.gather_nd(
+      parameters + array_ops.zeros_like(x, dtype=parameters.dtype), indices)
+  else:
+    return parameters
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+# Only what is needed to run an exported inference graph is imported here,
+# so no model or data set modules are loaded.
+
+import os
+import json
+
+import numpy
+import scipy.sparse
+import scipy.io
+
+import tensorflow as tf
+
+from multiprocessing.pool import ThreadPool
+from time import time
+
+import argparse
+
+from auxiliary import formatDuration
+
+inference_graph_filename = "inference_graph.pb"
+inference_signature_filename = "inference_signature.json"
+
+input_extensions = [".npz", ".npy", ".mtx", ".mtx.gz"]
+
+preprocessing_step_methods = ["scale", "binarise", "sample"]
+
+def main(inference_graph_directory, input_paths, output_directory = None,
+    output_roles = None, batch_size = 1000, number_of_threads = 0,
+    transpose = False):
+    
+    # Setup
+    
+    loading_time_start = time()
+    
+    graph, signature = loadInferenceGraph(inference_graph_directory)
+    
+    if output_roles:
+        for output_role in output_roles:
+            if output_role not in signature["outputs"]:
+                raise ValueError("Output `{}` not found in inference graph."
+                    .format(output_role))
+    else:
+        output_roles = list(signature["outputs"].keys())
+    
+    if output_directory is None:
+        output_directory = inference_graph_directory
+    
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    
+    configuration = tf.ConfigProto(
+        intra_op_parallelism_threads = number_of_threads,
+        inter_op_parallelism_threads = number_of_threads
+    )
+    
+    loading_duration = time() - loading_time_start
+    print("Inference graph for {} loaded ({}).".format(
+        signature["model parameter set"], formatDuration(loading_duration)))
+    
+    # Inference
+    
+    with tf.Session(graph = graph, config = configuration) as session:
+        
+        for input_path in input_paths:
+            
+            print()
+            
+            inference_time_start = time()
+            
+            values = loadValues(input_path, transpose)
+            
+            output_paths = infer(
+                session, signature, values,
+                output_roles = output_roles,
+                output_directory = output_directory,
+                output_name = baseName(input_path),
+                batch_size = batch_size
+            )
+            
+            inference_duration = time() - inference_time_start
+            print("{} examples from {} processed ({}).".format(
+                values.shape[0], input_path,
+                formatDuration(inference_duration)))
+            
+            for output_role, output_path in output_paths.items():
+                print("    {}: {}".format(output_role.capitalize(),
+                    output_path))
+
+def loadInferenceGraph(directory):
+    
+    with open(os.path.join(directory, inference_signature_filename), "r") \
+        as signature_file:
+        signature = json.load(signature_file)
+    
+    graph_def = tf.GraphDef()
+    
+    with open(os.path.join(directory, inference_graph_filename), "rb") \
+        as graph_file:
+        graph_def.ParseFromString(graph_file.read())
+    
+    graph = tf.Graph()
+    
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name = "")
+    
+    return graph, signature
+
+def loadValues(path, transpose = False):
+    
+    if path.endswith(".npz"):
+        values = scipy.sparse.load_npz(path)
+    elif path.endswith(".npy"):
+        values = numpy.load(path, mmap_mode = "r")
+    elif path.endswith(".mtx") or path.endswith(".mtx.gz"):
+        values = scipy.io.mmread(path)
+    else:
+        raise ValueError("Input `{}` not in a supported format: {}.".format(
+            path, ", ".join(input_extensions)))
+    
+    if transpose:
+        values = values.T
+    
+    if scipy.sparse.issparse(values):
+        values = values.tocsr()
+    
+    return values
+
+def baseName(path):
+    base_name = os.path.basename(path)
+    for extension in input_extensions:
+        if base_name.endswith(extension):
+            base_name = base_name[:-len(extension)]
+            break
+    return base_name
+
+def infer(session, signature, values, output_roles, output_directory,
+    output_name, batch_size = 1000):
+    
+    M, F = values.shape
+    
+    if F != signature["feature size"]:
+        raise ValueError("Input has {} features, but model expects {}."
+            .format(F, signature["feature size"]))
+    
+    # Values are preprocessed as for training the model, with targets of
+    # `None` being the preprocessed inputs themselves.
+    
+    preprocessing = signature.get("preprocessing") or {}
+    
+    input_preprocessing_steps = preprocessing.get("inputs", [])
+    target_preprocessing_steps = preprocessing.get("targets", [])
+    
+    for step in input_preprocessing_steps \
+        + (target_preprocessing_steps or []):
+        if step["method"] not in preprocessing_step_methods:
+            raise ValueError("Preprocessing step `{}` not supported."
+                .format(step["method"]))
+    
+    graph = session.graph
+    
+    inputs = {
+        role: graph.get_tensor_by_name(name)
+        for role, name in signature["inputs"].items()
+    }
+    fetches = {
+        role: graph.get_tensor_by_name(signature["outputs"][role])
+        for role in output_roles
+    }
+    
+    ## Count sums
+    
+    if "n" in inputs or "n_feature" in inputs:
+        
+        count_sum = numpy.asarray(values.sum(axis = 1),
+            numpy.float32).reshape(-1, 1)
+        
+        count_sum_maximum = signature.get("count sum maximum")
+        
+        if not count_sum_maximum:
+            count_sum_maximum = count_sum.max()
+        
+        normalised_count_sum = count_sum / count_sum_maximum
+    
+    ## Outputs
+    
+    outputs = {}
+    output_paths = {}
+    
+    for role, tensor in fetches.items():
+        output_path = os.path.join(output_directory,
+            "{}-{}.npy".format(output_name, role.replace(" ", "_")))
+        outputs[role] = numpy.lib.format.open_memmap(output_path,
+            mode = "w+", dtype = numpy.float32,
+            shape = (M, tensor.shape[-1].value))
+        output_paths[role] = output_path
+    
+    ## Batches
+    
+    # Batches are sliced and densified in a separate thread while the
+    # previous batch is run through the graph.
+    
+    def prepareBatch(i):
+        
+        indices = numpy.arange(i, min(i + batch_size, M))
+        
+        values_batch = values[indices]
+        
+        if scipy.sparse.issparse(values_batch):
+            values_batch = values_batch.toarray()
+        
+        values_batch = numpy.asarray(values_batch, numpy.float32)
+        
+        x_batch = preprocess(values_batch, input_preprocessing_steps)
+        
+        if target_preprocessing_steps is None:
+            t_batch = x_batch
+        else:
+            t_batch = preprocess(values_batch, target_preprocessing_steps)
+        
+        feed_dict_batch = {}
+        
+        for role, tensor in inputs.items():
+            if role == "x":
+                feed_dict_batch[tensor] = x_batch
+            elif role == "t":
+                feed_dict_batch[tensor] = t_batch
+            elif role == "n":
+                feed_dict_batch[tensor] = count_sum[indices]
+            elif role == "n_feature":
+                feed_dict_batch[tensor] = normalised_count_sum[indices]
+        
+        return indices, feed_dict_batch
+    
+    with ThreadPool(1) as pool:
+        
+        for indices, feed_dict_batch in pool.imap(
+            prepareBatch, range(0, M, batch_size)):
+            
+            results = session.run(fetches, feed_dict = feed_dict_batch)
+            
+            for role, result in results.items():
+                outputs[role][indices] = result
+    
+    for output in outputs.values():
+        output.flush()
+    
+    return output_paths
+
+def preprocess(values, steps):
+    
+    # Steps as recorded by `data.inferencePreprocessingForDataSet`.
+    
+    for step in steps:
+        
+        if step["method"] == "scale":
+            values = values * numpy.asarray(step["scales"], numpy.float32)
+        
+        elif step["method"] == "binarise":
+            values = numpy.asarray(values > step["threshold"], numpy.float32)
+        
+        elif step["method"] == "sample":
+            values = numpy.random.binomial(
+                1, values / step["normalisation"]).astype(numpy.float32)
+    
+    return values
+
+parser = argparse.ArgumentParser(
+    description="Run an exported scVAE inference graph on new data.",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+parser.add_argument(
+    "--inference-graph-directory", "-g",
+    type = str,
+    required = True,
+    help = "directory with an exported inference graph and its signature"
+)
+parser.add_argument(
+    dest = "input_paths",
+    metavar = "input",
+    type = str,
+    nargs = "+",
+    help = "sparse matrix (.npz), NumPy array (.npy), or Matrix Market file (.mtx or .mtx.gz) with examples as rows and the modelled features as columns"
+)
+parser.add_argument(
+    "--output-directory", "-o",
+    type = str,
+    default = None,
+    help = "directory where outputs are saved as NumPy arrays (default: inference graph directory)"
+)
+parser.add_argument(
+    "--output-roles", "-O",
+    type = str,
+    nargs = "+",
+    default = None,
+    help = "outputs to compute, e.g., z and reconstruction (default: all)"
+)
+parser.add_argument(
+    "--batch-size", "-B",
+    type = int,
+    default = 1000,
+    help = "number of examples run through the graph at a time"
+)
+parser.add_argument(
+    "--number-of-threads", "-T",
+    type = int,
+    default = 0,
+    help = "number of threads used by TensorFlow (0: one per core)"
+)
+parser.add_argument(
+    "--transpose",
+    action = "store_true",
+    help = "transpose inputs with features as rows and examples as columns"
+)
+parser.set_defaults(transpose = False)
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    main(**vars(arguments))
@@ -21,27 +21,28 @@
 import data
 import analysis
 
-from models import (
-    VariationalAutoencoder,
-    GaussianMixtureVariationalAutoencoder
-)
-
-from distributions import distributions, latent_distributions
-
-from miscellaneous.prediction import predict
+from miscellaneous.prediction import predict, predictionMethodUsesCentroids
 
 from auxiliary import (
     title, subtitle, heading,
     normaliseString, enumerateListOfStrings,
     betterModelExists, modelStoppedEarly,
-    removeEmptyDirectories
+    removeEmptyDirectories, loadCentroids,
+    LazyModule
 )
 
 import os
+import sys
 import argparse
 import itertools
 import random
 
+# The models and distributions are implemented using TensorFlow, so these
+# are only imported when modelling.
+
+models = LazyModule("models")
+distributions = LazyModule("distributions")
+
 def main(input_file_or_name, data_directory = "data",
     log_directory = "log", results_directory = "results",
     temporary_log_directory = None,
@@ -66,13 +67,24 @@ def main(input_file_or_name, data_directory = "data",
     dropout_keep_probabilities = [],
     count_sum = True,
     number_of_epochs = 200, plotting_interval_during_training = None, 
+    number_of_plotting_workers_during_training = 0,
+    profile_training = False, profiling_trace_steps = None,
     batch_size = 100, learning_rate = 1e-4,
+    number_of_training_workers = 1, synchronisation_interval = 1,
+    intra_op_parallelism_threads = 0, inter_op_parallelism_threads = 0,
     prediction_method = None,
     decomposition_methods = ["PCA"], highlight_feature_indices = [],
     reset_training = False, skip_modelling = False,
     analyse = True, evaluation_set_name = "test", analyse_data = False,
+    stream_reconstructions = False,
+    embed_only = False, embedding_input = None,
+    export_inference_graph = False,
     analyses = ["default"], analysis_level = "normal", fast_analysis = False,
-    export_options = []):
+    number_of_figure_workers = None,
+    export_options = [], data_sets = None):
+    
+    # Returns whether the run completed, which is not the case if modelling
+    # is cancelled or training fails.
     
     # Setup
     
@@ -83,15 +95,14 @@ def main(input_file_or_name, data_directory = "data",
         analyses = ["simple"]
         analysis_level = "limited"
     
-    ## Distributions
-    
-    reconstruction_distribution = parseDistribution(
-        reconstruction_distribution)
-    latent_distribution = parseDistribution(latent_distribution)
-    
-    ## Model configuration validation
+    ## Distributions and model configuration validation
     
     if not skip_modelling:
+        
+        reconstruction_distribution = parseDistribution(
+            reconstruction_distribution)
+        latent_distribution = parseDistribution(latent_distribution)
+        
         model_valid, model_errors = validateModelParameters(
             model_type, latent_distribution,
             reconstruction_distribution, number_of_reconstruction_classes,
@@ -109,13 +120,13 @@ def main(input_file_or_name, data_directory = "data",
                 skip_modelling = True
             else:
                 print("Modelling cancelled.")
-                return
+                return False
     
     ## Binarisation
     
     binarise_values = False
     
-    if reconstruction_distribution == "bernoulli":
+    if normaliseString(reconstruction_distribution) == "bernoulli":
         if noisy_preprocessing_methods:
             if noisy_preprocessing_methods[-1] != "binarise":
                 noisy_preprocessing_methods.append("binarise")
@@ -135,28 +146,41 @@ def main(input_file_or_name, data_directory = "data",
     
     print(title("Data"))
     
-    data_set = data.DataSet(
-        input_file_or_name,
-        directory = data_directory,
-        map_features = map_features,
-        feature_selection = feature_selection,
-        feature_parameter = feature_parameter,
-        example_filter = example_filter,
-        preprocessing_methods = preprocessing_methods,
-        binarise_values = binarise_values,
-        noisy_preprocessing_methods = noisy_preprocessing_methods
-    )
-    
-    if full_data_set_needed:
-        data_set.load()
+    # Data sets already loaded and split, e.g., by a sweep, can be given, in
+    # which case the data set arguments should match them.
     
-    training_set, validation_set, test_set = data_set.split(
-        splitting_method, splitting_fraction)
+    if data_sets:
+        data_set, training_set, validation_set, test_set = data_sets
+        print("Using data sets loaded and split in advance: {}.".format(
+            data_set.title))
+    else:
+        data_set = data.DataSet(
+            input_file_or_name,
+            directory = data_directory,
+            map_features = map_features,
+            feature_selection = feature_selection,
+            feature_parameter = feature_parameter,
+            example_filter = example_filter,
+            preprocessing_methods = preprocessing_methods,
+            binarise_values = binarise_values,
+            noisy_preprocessing_methods = noisy_preprocessing_methods
+        )
+        
+        if full_data_set_needed:
+            data_set.load()
+        
+        training_set, validation_set, test_set = data_set.split(
+            splitting_method, splitting_fraction)
     
     all_data_sets = [data_set, training_set, validation_set, test_set]
     
     ## Setup of log and results directories
     
+    # Decompositions are cached by content, so the cache is shared between
+    # data sets and models.
+    decomposition_cache_directory = os.path.join(results_directory,
+        "decomposition_cache")
+    
     log_directory = data.directory(log_directory, data_set,
         splitting_method, splitting_fraction)
     data_results_directory = data.directory(results_directory, data_set,
@@ -177,7 +201,9 @@ def main(input_file_or_name, data_directory = "data",
             all_data_sets,
             decomposition_methods, highlight_feature_indices,
             analyses, analysis_level,
-            export_options, data_results_directory
+            export_options, data_results_directory,
+            decomposition_cache_directory,
+            number_of_figure_workers
         )
         print()
     
@@ -190,7 +216,7 @@ def main(input_file_or_name, data_directory = "data",
     
     if skip_modelling:
         print("Modelling skipped.")
-        return
+        return True
     
     print(title("Modelling"))
     
@@ -232,7 +258,7 @@ def main(input_file_or_name, data_directory = "data",
     print(subtitle("Model setup"))
     
     if model_type == "VAE":
-        model = VariationalAutoencoder(
+        model = models.VariationalAutoencoder(
             feature_size = feature_size,
             latent_size = latent_size,
             hidden_sizes = hidden_sizes,
@@ -250,6 +276,8 @@ def main(input_file_or_name, data_directory = "data",
             dropout_keep_probabilities = dropout_keep_probabilities,
             count_sum = count_sum,
             number_of_warm_up_epochs = number_of_warm_up_epochs,
+            intra_op_parallelism_threads = intra_op_parallelism_threads,
+            inter_op_parallelism_threads = inter_op_parallelism_threads,
             log_directory = log_directory,
             results_directory = results_directory
         )
@@ -276,7 +304,7 @@ def main(input_file_or_name, data_directory = "data",
             "values": prior_probabilities_values
         }
         
-        model = GaussianMixtureVariationalAutoencoder(
+        model = models.GaussianMixtureVariationalAutoencoder(
             feature_size = feature_size,
             latent_size = latent_size,
             hidden_sizes = hidden_sizes,
@@ -292,6 +320,8 @@ def main(input_file_or_name, data_directory = "data",
             dropout_keep_probabilities = dropout_keep_probabilities,
             count_sum = count_sum,
             number_of_warm_up_epochs = number_of_warm_up_epochs,
+            intra_op_parallelism_threads = intra_op_parallelism_threads,
+            inter_op_parallelism_threads = inter_op_parallelism_threads,
             log_directory = log_directory,
             results_directory= results_directory
         )
@@ -305,6 +335,63 @@ def main(input_file_or_name, data_directory = "data",
     print(model.parameters)
     print()
     
+    ## Embedding
+    
+    if embed_only:
+        
+        print(subtitle("Embedding"))
+        
+        if embedding_input:
+            embedding_set = data.DataSet(
+                embedding_input,
+                directory = data_directory,
+                map_features = map_features,
+                preprocessing_methods = preprocessing_methods,
+                noisy_preprocessing_methods = noisy_preprocessing_methods
+            )
+            embedding_set.load()
+            embedding_set = data.alignFeatures(embedding_set,
+                training_set.feature_names)
+        else:
+            for data_subset in all_data_sets:
+                if data_subset.kind == evaluation_set_name:
+                    embedding_set = data_subset
+        
+        embeddings_directory = os.path.join(results_directory, model.name,
+            "embeddings", embedding_set.name)
+        
+        model_parameter_set_names = ["end of epoch"]
+        
+        for model_parameter_set_name in model_parameter_set_names:
+            
+            print(heading("{} embedding".format(
+                model_parameter_set_name.capitalize())))
+            
+            latent_embedding_sets = model.encode(
+                embedding_set,
+                use_best_model = model_parameter_set_name == "best model",
+                use_early_stopping_model =
+                    model_parameter_set_name == "early stopping",
+                output_directory = os.path.join(embeddings_directory,
+                    model_parameter_set_name.replace(" ", "_"))
+            )
+            
+            print()
+            
+            if latent_embedding_sets is None:
+                return False
+            
+            # Other parameter sets can only be checked for a trained model.
+            if model_parameter_set_name == "end of epoch":
+                if betterModelExists(model):
+                    model_parameter_set_names.append("best model")
+                if modelStoppedEarly(model):
+                    model_parameter_set_names.append("early stopping")
+        
+        print("Embeddings saved in {}.".format(embeddings_directory))
+        
+        return True
+    
     ## Training
     
     print(subtitle("Model training"))
@@ -316,6 +403,11 @@ def main(input_file_or_name, data_directory = "data",
         batch_size = batch_size,
         learning_rate = learning_rate,
         plotting_interval = plotting_interval_during_training,
+        number_of_plotting_workers = number_of_plotting_workers_during_training,
+        profile = profile_training,
+        profiling_trace_steps = profiling_trace_steps,
+        number_of_training_workers = number_of_training_workers,
+        synchronisation_interval = synchronisation_interval,
         reset_training = reset_training,
         temporary_log_directory = temporary_log_directory
     )
@@ -326,7 +418,7 @@ def main(input_file_or_name, data_directory = "data",
     
     if not status["completed"]:
         print(status["message"])
-        return
+        return False
     
     status_filename = "status"
     if "epochs trained" in status:
@@ -344,6 +436,44 @@ def main(input_file_or_name, data_directory = "data",
     
     print()
     
+    ## Inference graph export
+    
+    if export_inference_graph and "VAE" in model.type:
+        
+        print(subtitle("Inference graph export"))
+        
+        model_parameter_set_names = ["end of epoch"]
+        
+        if betterModelExists(model):
+            model_parameter_set_names.append("best model")
+        
+        if modelStoppedEarly(model):
+            model_parameter_set_names.append("early stopping")
+        
+        count_sum_maximum = float(training_set.count_sum.max())
+        
+        inference_preprocessing = data.inferencePreprocessingForDataSet(
+            training_set,
+            binarised_targets =
+                normaliseString(reconstruction_distribution) == "bernoulli"
+        )
+        
+        if inference_preprocessing is None:
+            print("Cannot export inference graph, since preprocessing of",
+                "values depending on the data set cannot be recovered when",
+                "the values are also binarised.")
+        else:
+            for model_parameter_set_name in model_parameter_set_names:
+                model.exportInferenceGraph(
+                    use_best_model = model_parameter_set_name == "best model",
+                    use_early_stopping_model =
+                        model_parameter_set_name == "early stopping",
+                    count_sum_maximum = count_sum_maximum,
+                    preprocessing = inference_preprocessing
+                )
+        
+        print()
+    
     # Evaluation, prediction, and analysis
     
     ## Setup
@@ -414,6 +544,40 @@ def main(input_file_or_name, data_directory = "data",
     
     ## Results evaluation, prediction, and analysis
     
+    metric_accumulators = {}
+    
+    for model_parameter_set_name in model_parameter_set_names:
+        if analyse and "VAE" in model.type \
+            and "metrics" in analysis.parseAnalyses(analyses):
+            metric_accumulators[model_parameter_set_name] = \
+                analysis.resultsMetricAccumulators(analysis_level)
+        else:
+            metric_accumulators[model_parameter_set_name] = {}
+    
+    # Variational auto-encoders evaluate all model parameter sets in one
+    # pass over the evaluation set. Their reconstructions are then written
+    # to temporary memory-mapped files in the log directory, so peak memory
+    # use does not grow with the number of parameter sets.
+    
+    if "VAE" in model.type:
+        
+        print(subtitle("Evaluation"))
+        
+        evaluation_sets = model.evaluate(
+            evaluation_set = evaluation_set,
+            evaluation_subset_indices = evaluation_subset_indices,
+            batch_size = batch_size,
+            predict_labels = predict_labels_using_model,
+            stream_reconstructions = stream_reconstructions,
+            metric_accumulators = {
+                name: list(accumulators.values())
+                for name, accumulators in metric_accumulators.items()
+            },
+            model_parameter_set_names = model_parameter_set_names
+        )
+        
+        print()
+    
     for model_parameter_set_name in model_parameter_set_names:
         
         if model_parameter_set_name == "best model":
@@ -426,26 +590,25 @@ def main(input_file_or_name, data_directory = "data",
         else:
             use_early_stopping_model = False
         
+        model_metric_accumulators = metric_accumulators[
+            model_parameter_set_name]
+        
+        if "VAE" in model.type:
+            transformed_evaluation_set, reconstructed_evaluation_set,\
+                latent_evaluation_sets = evaluation_sets[
+                    model_parameter_set_name]
+        
         model_parameter_set_name = model_parameter_set_name.capitalize()
         print(subtitle(model_parameter_set_name))
         
-        # Evaluation
-        
         model_parameter_set_name = model_parameter_set_name.replace(" ", "-")
         
-        print(heading("{} evaluation".format(model_parameter_set_name)))
+        # Evaluation
         
-        if "VAE" in model.type:
-            transformed_evaluation_set, reconstructed_evaluation_set,\
-                latent_evaluation_sets = model.evaluate(
-                    evaluation_set = evaluation_set,
-                    evaluation_subset_indices = evaluation_subset_indices,
-                    batch_size = batch_size,
-                    predict_labels = predict_labels_using_model,
-                    use_best_model = use_best_model,
-                    use_early_stopping_model = use_early_stopping_model
-                )
-        else:
+        if "VAE" not in model.type:
+            
+            print(heading("{} evaluation".format(model_parameter_set_name)))
+            
             transformed_evaluation_set, reconstructed_evaluation_set = \
                 model.evaluate(
                     evaluation_set = evaluation_set,
@@ -455,8 +618,8 @@ def main(input_file_or_name, data_directory = "data",
                     use_early_stopping_model = use_early_stopping_model
                 )
             latent_evaluation_sets = None
-        
-        print()
+            
+            print()
         
         # Prediction
         
@@ -465,22 +628,36 @@ def main(input_file_or_name, data_directory = "data",
             
             print(heading("{} prediction".format(model_parameter_set_name)))
             
-            latent_training_sets = model.evaluate(
-                evaluation_set = training_set,
-                batch_size = batch_size,
+            latent_training_sets = model.encode(
+                training_set,
                 use_best_model = use_best_model,
-                use_early_stopping_model = use_early_stopping_model,
-                output_versions = "latent",
-                log_results = False
+                use_early_stopping_model = use_early_stopping_model
             )
             
             print()
             
+            # Clustering is initialised using the prior centroids of GMVAE
+            # models for prediction methods using centroids
+            
+            prediction_centroids = None
+            
+            if "GM" in model.type \
+                and predictionMethodUsesCentroids(prediction_method):
+                centroids = loadCentroids(
+                    model,
+                    data_set_kinds = "evaluation",
+                    early_stopping = use_early_stopping_model,
+                    best_model = use_best_model
+                )
+                if centroids and centroids["prior"]:
+                    prediction_centroids = centroids["prior"]["means"]
+            
             cluster_ids, predicted_labels, predicted_superset_labels = predict(
                 latent_training_sets["z"],
                 latent_evaluation_sets["z"],
                 prediction_method,
-                number_of_classes
+                number_of_classes,
+                centroids = prediction_centroids
             )
             
             transformed_evaluation_set.updatePredictions(
@@ -522,14 +699,19 @@ def main(input_file_or_name, data_directory = "data",
                 best_model = use_best_model,
                 early_stopping = use_early_stopping_model,
                 analyses = analyses, analysis_level = analysis_level,
+                metric_accumulators = model_metric_accumulators,
                 export_options = export_options,
-                results_directory = results_directory
+                results_directory = results_directory,
+                cache_directory = decomposition_cache_directory,
+                number_of_figure_workers = number_of_figure_workers
             )
+    
+    return True
 
 def parseDistribution(distribution):
     distribution = normaliseString(distribution)
-    distribution_names = list(distributions.keys())
-    distribution_names += list(latent_distributions.keys())
+    distribution_names = list(distributions.distributions.keys())
+    distribution_names += list(distributions.latent_distributions.keys())
     for distribution_name in distribution_names:
         if normaliseString(distribution_name) == distribution:
             return distribution_name
@@ -825,6 +1007,25 @@ parser.add_argument(
     nargs = "?",
     help = "number of training epochs between each intermediate plot starting at the first"
 )
+parser.add_argument(
+    "--number-of-plotting-workers-during-training",
+    type = int,
+    default = 0,
+    help = "number of background processes plotting intermediate results (0 to plot in the training process)"
+)
+parser.add_argument(
+    "--profile-training",
+    action = "store_true",
+    help = "record durations of training stages and save them as a profile in the results directory"
+)
+parser.set_defaults(profile_training = False)
+parser.add_argument(
+    "--profiling-trace-steps",
+    type = int,
+    nargs = 2,
+    metavar = ("START", "STOP"),
+    help = "capture Chrome traces of TensorFlow operations for global steps in this range when profiling training"
+)
 parser.add_argument(
     "--batch-size", "-M",
     type = int,
@@ -837,6 +1038,30 @@ parser.add_argument(
     default = 1e-4,
     help = "learning rate when training"
 )
+parser.add_argument(
+    "--number-of-training-workers",
+    type = int,
+    default = 1,
+    help = "number of processes training replicas of the model on separate parts of each epoch (1 to train in the main process only)"
+)
+parser.add_argument(
+    "--synchronisation-interval",
+    type = int,
+    default = 1,
+    help = "number of training steps between averaging the model parameters of the replicas when training in several processes"
+)
+parser.add_argument(
+    "--intra-op-parallelism-threads",
+    type = int,
+    default = 0,
+    help = "number of threads used by TensorFlow within each operation (0: chosen by TensorFlow)"
+)
+parser.add_argument(
+    "--inter-op-parallelism-threads",
+    type = int,
+    default = 0,
+    help = "number of threads used by TensorFlow to run independent operations (0: chosen by TensorFlow)"
+)
 parser.add_argument(
     "--number-of-warm-up-epochs", "-w",
     type = int,
@@ -886,7 +1111,7 @@ parser.add_argument(
     type = str,
     nargs = "?",
     default = None,
-    help = "method for predicting labels"
+    help = "method for predicting labels: k-means, mini-batch k-means, or parallel k-means (the latter two initialised using the prior centroids of GMVAE models)"
 )
 parser.add_argument(
     "--decomposition-methods",
@@ -938,6 +1163,30 @@ parser.add_argument(
     default = "test",
     help = "name of the subset to evaluate and analyse: training, validation, or test (default)"
 )
+parser.add_argument(
+    "--stream-reconstructions",
+    action = "store_true",
+    help = "write reconstructions to a temporary memory-mapped file in the log directory while evaluating instead of keeping them in memory"
+)
+parser.set_defaults(stream_reconstructions = False)
+parser.add_argument(
+    "--embed-only",
+    action = "store_true",
+    help = "only encode data with the trained model and save the latent means as embeddings in the results directory"
+)
+parser.set_defaults(embed_only = False)
+parser.add_argument(
+    "--export-inference-graph",
+    action = "store_true",
+    help = "export pruned and constant-folded inference graphs of the trained model to its log directory for use with `inference.py`"
+)
+parser.set_defaults(export_inference_graph = False)
+parser.add_argument(
+    "--embedding-input",
+    type = str,
+    default = None,
+    help = "data set name or file to encode when only embedding, with its features aligned to the modelled data set (default: the evaluation set)"
+)
 parser.add_argument(
     "--analyse-data",
     action = "store_true",
@@ -969,6 +1218,12 @@ parser.add_argument(
     help = "perform fast analysis (equivalent to: `--analyses simple --analysis-level limited`)"
 )
 parser.set_defaults(fast_analysis = False)
+parser.add_argument(
+    "--number-of-figure-workers",
+    type = int,
+    default = None,
+    help = "number of processes plotting figures for analyses of data and results (default: one per CPU core; 1 to plot in the main process)"
+)
 parser.add_argument(
     "--export-options",
     type = str,
@@ -979,4 +1234,5 @@ parser.add_argument(
 
 if __name__ == '__main__':
     arguments = parser.parse_args()
-    main(**vars(arguments))
+    if not main(**vars(arguments)):
+        sys.exit(1)
@@ -0,0 +1,212 @@
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+import numpy
+import scipy.sparse
+
+from multiprocessing.pool import ThreadPool
+
+from sklearn.base import BaseEstimator, ClusterMixin
+from sklearn.utils import check_array, check_random_state, gen_batches
+from sklearn.utils.validation import check_is_fitted
+
+class ParallelKMeans(BaseEstimator, ClusterMixin):
+    
+    # k-means clustering using Lloyd's algorithm. In each iteration, examples
+    # are assigned to their nearest centroids, and the examples in each
+    # cluster are summed, for blocks of examples in parallel threads, so the
+    # distances between all examples and centroids are never held at once.
+    # Centroids are initialised using k-means++ on a random subsample or
+    # given as an array.
+    
+    def __init__(self, n_clusters = 8, init = "k-means++", max_iter = 300,
+                 tol = 1e-4, init_size = 10000, block_size = 10000,
+                 n_jobs = None, random_state = None):
+        self.n_clusters = n_clusters
+        self.init = init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.init_size = init_size
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+    
+    def fit(self, X, y = None):
+        
+        X = check_array(X, accept_sparse = ["csr"],
+            dtype = [numpy.float64, numpy.float32])
+        
+        random_state = check_random_state(self.random_state)
+        
+        if isinstance(self.init, str) and self.init == "k-means++":
+            centroids = self._kMeansPlusPlus(X, random_state)
+        else:
+            centroids = numpy.array(self.init, numpy.float64)
+            if centroids.shape != (self.n_clusters, X.shape[1]):
+                raise ValueError("Initial centroids have shape {}, but {} "
+                    .format(centroids.shape, (self.n_clusters, X.shape[1]))
+                    + "was expected.")
+        
+        tolerance = self.tol * _meanVariance(X)
+        
+        with ThreadPool(self.n_jobs) as pool:
+            
+            for i in range(self.max_iter):
+                
+                cluster_sums, cluster_sizes, _ = self._assign(X, centroids,
+                    pool, accumulate = True)[1:]
+                
+                # Empty clusters keep their centroids
+                non_empty = cluster_sizes > 0
+                new_centroids = centroids.copy()
+                new_centroids[non_empty] = cluster_sums[non_empty] \
+                    / cluster_sizes[non_empty, numpy.newaxis]
+                
+                centroid_shift = numpy.square(new_centroids - centroids).sum()
+                centroids = new_centroids
+                
+                if centroid_shift <= tolerance:
+                    break
+            
+            labels, _, _, inertia = self._assign(X, centroids, pool)
+        
+        self.cluster_centers_ = centroids
+        self.labels_ = labels
+        self.inertia_ = inertia
+        self.n_iter_ = i + 1
+        
+        return self
+    
+    def fit_predict(self, X, y = None):
+        return self.fit(X).labels_
+    
+    def predict(self, X):
+        check_is_fitted(self, "cluster_centers_")
+        
+        X = check_array(X, accept_sparse = ["csr"])
+        
+        with ThreadPool(self.n_jobs) as pool:
+            labels = self._assign(X, self.cluster_centers_, pool)[0]
+        
+        return labels
+    
+    def _assign(self, X, centroids, pool, accumulate = False):
+        
+        n_samples = X.shape[0]
+        n_clusters = centroids.shape[0]
+        
+        labels = numpy.empty(n_samples, numpy.int64)
+        centroid_squared_norms = numpy.square(centroids).sum(axis = 1)
+        
+        def assignBlock(batch):
+            
+            X_batch = X[batch]
+            
+            # Squared distances up to the squared norms of the examples
+            distances = centroid_squared_norms - 2 * X_batch @ centroids.T
+            distances = numpy.asarray(distances)
+            
+            batch_labels = distances.argmin(axis = 1)
+            labels[batch] = batch_labels
+            
+            batch_inertia = distances[
+                numpy.arange(len(batch_labels)), batch_labels].sum() \
+                + _squaredNorms(X_batch).sum()
+            
+            if not accumulate:
+                return None, None, batch_inertia
+            
+            memberships = scipy.sparse.csr_matrix(
+                (
+                    numpy.ones(len(batch_labels)),
+                    (batch_labels, numpy.arange(len(batch_labels)))
+                ),
+                shape = (n_clusters, len(batch_labels))
+            )
+            batch_sums = memberships @ X_batch
+            
+            if scipy.sparse.issparse(batch_sums):
+                batch_sums = batch_sums.toarray()
+            
+            batch_sizes = numpy.bincount(batch_labels,
+                minlength = n_clusters)
+            
+            return batch_sums, batch_sizes, batch_inertia
+        
+        block_results = pool.map(assignBlock,
+            gen_batches(n_samples, self.block_size))
+        
+        inertia = sum(result[2] for result in block_results)
+        
+        if accumulate:
+            cluster_sums = sum(result[0] for result in block_results)
+            cluster_sizes = sum(result[1] for result in block_results)
+        else:
+            cluster_sums = None
+            cluster_sizes = None
+        
+        return labels, cluster_sums, cluster_sizes, inertia
+    
+    def _kMeansPlusPlus(self, X, random_state):
+        
+        n_samples = X.shape[0]
+        
+        if n_samples > self.init_size:
+            indices = random_state.choice(n_samples, self.init_size,
+                replace = False)
+            X = X[indices]
+        
+        if scipy.sparse.issparse(X):
+            X = X.toarray()
+        
+        n_samples = X.shape[0]
+        
+        centroids = numpy.empty((self.n_clusters, X.shape[1]))
+        centroids[0] = X[random_state.randint(n_samples)]
+        
+        squared_distances = numpy.square(X - centroids[0]).sum(axis = 1)
+        
+        for k in range(1, self.n_clusters):
+            
+            total = squared_distances.sum()
+            
+            if total > 0:
+                index = random_state.choice(n_samples,
+                    p = squared_distances / total)
+            else:
+                index = random_state.randint(n_samples)
+            
+            centroids[k] = X[index]
+            squared_distances = numpy.minimum(squared_distances,
+                numpy.square(X - centroids[k]).sum(axis = 1))
+        
+        return centroids
+
+def _squaredNorms(X):
+    if scipy.sparse.issparse(X):
+        return numpy.asarray(X.multiply(X).sum(axis = 1)).ravel()
+    else:
+        return numpy.square(X).sum(axis = 1)
+
+def _meanVariance(X):
+    if scipy.sparse.issparse(X):
+        means = numpy.asarray(X.mean(axis = 0)).ravel()
+        squared_means = numpy.asarray(X.multiply(X).mean(axis = 0)).ravel()
+        return (squared_means - numpy.square(means)).mean()
+    else:
+        return X.var(axis = 0).mean()
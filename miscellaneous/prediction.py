@@ -17,22 +17,41 @@
 # ======================================================================== #
 
 import numpy
-import scipy.stats
-from sklearn.cluster import KMeans
 
 from time import time
 
-from auxiliary import properString, formatDuration
+from auxiliary import properString, formatDuration, LazyModule
+
+sklearn = LazyModule("sklearn")
+parallel_k_means = LazyModule("miscellaneous.parallel_k_means")
 
 prediction_method_names = {
     "k-means": ["k_means", "kmeans"],
+    "mini-batch k-means": ["mini_batch_k_means", "minibatch_k_means",
+        "mini_batch_kmeans", "minibatch_kmeans"],
+    "parallel k-means": ["parallel_k_means", "parallel_kmeans", "lloyd"],
     "model": ["model"],
     "test": ["test"],
     "copy": ["copy"]
 }
 
+# Prediction methods which can be initialised using given centroids
+centroid_initialised_prediction_methods = [
+    "mini-batch k-means", "parallel k-means"
+]
+
+mini_batch_size_for_k_means = 10000
+
+def predictionMethodUsesCentroids(prediction_method):
+    return properString(prediction_method, prediction_method_names) \
+        in centroid_initialised_prediction_methods
+
 def predict(training_set, evaluation_set, prediction_method = "copy",
-    number_of_classes = 1):
+    number_of_classes = 1, centroids = None):
+    
+    # For mini-batch and parallel k-means, `centroids` can be given as initial
+    # centroids, e.g., the means of the Gaussian-mixture prior of a GMVAE
+    # model, with a row for each class.
     
     prediction_method = properString(prediction_method,
         prediction_method_names)
@@ -85,17 +104,48 @@ def predict(training_set, evaluation_set, prediction_method = "copy",
         predicted_superset_labels = evaluation_set.superset_labels
     
     elif prediction_method == "test":
-        model = KMeans(n_clusters = number_of_classes, random_state = 0)
+        model = sklearn.cluster.KMeans(n_clusters = number_of_classes,
+            random_state = 0)
         model.fit(evaluation_set.values)
         cluster_ids = model.labels_
         predicted_labels = None
         predicted_superset_labels = None
     
-    elif prediction_method == "k-means":
+    elif prediction_method in ["k-means", "mini-batch k-means",
+        "parallel k-means"]:
         
-        model = KMeans(n_clusters = number_of_classes, random_state = 0)
+        if prediction_method in centroid_initialised_prediction_methods \
+            and centroids is not None \
+            and numpy.shape(centroids)[0] == number_of_classes:
+            initialisation = {"init": numpy.asarray(centroids), "n_init": 1}
+            initialisation_name = "given centroids"
+        else:
+            initialisation = {}
+            initialisation_name = "k-means++"
+        
+        if prediction_method == "k-means":
+            model = sklearn.cluster.KMeans(n_clusters = number_of_classes,
+                random_state = 0, **initialisation)
+        elif prediction_method == "mini-batch k-means":
+            model = sklearn.cluster.MiniBatchKMeans(
+                n_clusters = number_of_classes,
+                batch_size = mini_batch_size_for_k_means, random_state = 0,
+                **initialisation)
+        elif prediction_method == "parallel k-means":
+            model = parallel_k_means.ParallelKMeans(
+                n_clusters = number_of_classes,
+                init = initialisation.get("init", "k-means++"),
+                random_state = 0)
+        
+        fitting_time_start = time()
         model.fit(training_set.values)
+        fitting_duration = time() - fitting_time_start
+        
+        assignment_time_start = time()
         cluster_ids = model.predict(evaluation_set.values)
+        assignment_duration = time() - assignment_time_start
+        
+        mapping_time_start = time()
         
         if evaluation_set.has_labels:
             predicted_label_ids = mapClusterIDsToLabelIDs(
@@ -118,6 +168,17 @@ def predict(training_set, evaluation_set, prediction_method = "copy",
                     predicted_superset_label_ids)
         else:
             predicted_superset_labels = None
+        
+        mapping_duration = time() - mapping_time_start
+        
+        print("    Clustering fitted on {} examples from {} ({}).".format(
+            training_set.number_of_examples, initialisation_name,
+            formatDuration(fitting_duration)))
+        print("    Clusters assigned for {} examples ({}).".format(
+            evaluation_set.number_of_examples,
+            formatDuration(assignment_duration)))
+        print("    Clusters mapped to labels ({}).".format(
+            formatDuration(mapping_duration)))
     
     else:
         raise ValueError("Prediction method not found: `{}`.".format(
@@ -130,14 +191,35 @@ def predict(training_set, evaluation_set, prediction_method = "copy",
     return cluster_ids, predicted_labels, predicted_superset_labels
 
 def mapClusterIDsToLabelIDs(label_ids, cluster_ids, excluded_class_ids = []):
-    unique_cluster_ids = numpy.unique(cluster_ids).tolist()
-    predicted_label_ids = numpy.zeros_like(cluster_ids)
-    for unique_cluster_id in unique_cluster_ids:
-        idx = cluster_ids == unique_cluster_id
-        lab = label_ids[idx]
-        for excluded_class_id in excluded_class_ids:
-            lab = lab[lab != excluded_class_id]
-        if len(lab) == 0:
-            continue
-        predicted_label_ids[idx] = scipy.stats.mode(lab)[0]
+    
+    # Each cluster is mapped to its most frequent label (the smallest one in
+    # case of ties) found from a contingency table of clusters and labels.
+    # Clusters only with excluded labels are mapped to 0.
+    
+    label_ids = numpy.asarray(label_ids)
+    cluster_ids = numpy.asarray(cluster_ids)
+    
+    unique_cluster_ids, cluster_indices = numpy.unique(cluster_ids,
+        return_inverse = True)
+    unique_label_ids, label_indices = numpy.unique(label_ids,
+        return_inverse = True)
+    
+    included = ~numpy.isin(label_ids, excluded_class_ids)
+    
+    C = len(unique_cluster_ids)
+    L = len(unique_label_ids)
+    
+    contingency_table = numpy.bincount(
+        cluster_indices[included] * L + label_indices[included],
+        minlength = C * L
+    ).reshape(C, L)
+    
+    cluster_label_ids = numpy.zeros(C, cluster_ids.dtype)
+    
+    clusters_with_labels = contingency_table.sum(axis = 1) > 0
+    cluster_label_ids[clusters_with_labels] = unique_label_ids[
+        contingency_table[clusters_with_labels].argmax(axis = 1)]
+    
+    predicted_label_ids = cluster_label_ids[cluster_indices]
+    
     return predicted_label_ids
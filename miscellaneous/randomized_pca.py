@@ -0,0 +1,146 @@
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+import numpy
+import scipy.linalg
+import scipy.sparse
+
+from multiprocessing.pool import ThreadPool
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import check_array, check_random_state, gen_batches
+from sklearn.utils.extmath import svd_flip
+from sklearn.utils.validation import check_is_fitted
+
+class RandomizedPCA(BaseEstimator, TransformerMixin):
+    
+    # PCA using a randomised range finder on sparse or dense values. The
+    # values are never centred or densified: centring is applied implicitly
+    # to every product with the values, and these products are computed for
+    # blocks of rows in parallel threads.
+    
+    def __init__(self, n_components = 2, n_oversamples = 10, n_iter = 7,
+                 block_size = 10000, n_jobs = None, random_state = None):
+        self.n_components = n_components
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+    
+    def fit(self, X, y = None):
+        self._fit(X)
+        return self
+    
+    def fit_transform(self, X, y = None):
+        # Projecting the values again, instead of using the approximate
+        # singular vectors, keeps this consistent with transform.
+        self._fit(X)
+        return self.transform(X)
+    
+    def transform(self, X):
+        check_is_fitted(self, ["mean_", "components_"], all_or_any = all)
+        
+        X = check_array(X, accept_sparse = ["csr"])
+        
+        with ThreadPool(self.n_jobs) as pool:
+            X_transformed = self._centredProduct(X, self.components_.T, pool)
+        
+        return X_transformed
+    
+    def _fit(self, X):
+        
+        X = check_array(X, accept_sparse = ["csr"],
+            dtype = [numpy.float64, numpy.float32])
+        n_samples, n_features = X.shape
+        
+        n_components = self.n_components
+        n_random = min(n_components + self.n_oversamples, n_samples,
+            n_features)
+        
+        random_state = check_random_state(self.random_state)
+        
+        self.mean_ = numpy.asarray(X.mean(axis = 0)).ravel()
+        
+        with ThreadPool(self.n_jobs) as pool:
+            
+            # Range of the centred values
+            Q = random_state.normal(size = (n_features, n_random))
+            Q = self._centredProduct(X, Q, pool)
+            
+            # Power iterations, normalised using LU decompositions
+            for i in range(self.n_iter):
+                Q, _ = scipy.linalg.lu(Q, permute_l = True)
+                Q = self._centredTransposedProduct(X, Q, pool)
+                Q, _ = scipy.linalg.lu(Q, permute_l = True)
+                Q = self._centredProduct(X, Q, pool)
+            
+            Q, _ = scipy.linalg.qr(Q, mode = "economic")
+            
+            # Centred values projected onto their approximate range
+            B = self._centredTransposedProduct(X, Q, pool).T
+        
+        U_B, S, V = scipy.linalg.svd(B, full_matrices = False)
+        U_B, V = svd_flip(U_B, V, u_based_decision = False)
+        
+        if scipy.sparse.issparse(X):
+            squared_sums = numpy.asarray(X.multiply(X).sum(axis = 0)).ravel()
+        else:
+            squared_sums = numpy.square(X).sum(axis = 0)
+        
+        total_variance = (squared_sums - n_samples * self.mean_ ** 2).sum() \
+            / (n_samples - 1)
+        
+        self.n_components_ = n_components
+        self.components_ = V[:n_components]
+        self.singular_values_ = S[:n_components]
+        self.explained_variance_ = S[:n_components] ** 2 / (n_samples - 1)
+        self.explained_variance_ratio_ = self.explained_variance_ \
+            / total_variance
+    
+    def _centredProduct(self, X, A, pool):
+        
+        # (X - 1 mean^T) A = X A - 1 (mean^T A)
+        
+        n_samples = X.shape[0]
+        mean_product = self.mean_ @ A
+        product = numpy.empty((n_samples, A.shape[1]))
+        
+        def multiply(batch):
+            product[batch] = X[batch] @ A - mean_product
+        
+        pool.map(multiply, gen_batches(n_samples, self.block_size))
+        
+        return product
+    
+    def _centredTransposedProduct(self, X, A, pool):
+        
+        # (X - 1 mean^T)^T A = X^T A - mean (1^T A)
+        
+        n_samples = X.shape[0]
+        
+        def multiply(batch):
+            return X[batch].T @ A[batch]
+        
+        block_products = pool.map(multiply,
+            gen_batches(n_samples, self.block_size))
+        
+        product = numpy.asarray(sum(block_products)) \
+            - numpy.outer(self.mean_, A.sum(axis = 0))
+        
+        return product
@@ -28,6 +28,15 @@ from tensorflow.contrib.layers import (
 from tensorflow.python.ops.nn import relu
 
 import os, shutil
+import json
+import tempfile
+import multiprocessing
+from time import time, strftime
+
+from auxiliary import formatDuration
+
+from tensorflow.python.client import timeline
+from tensorflow.tools.graph_transforms import TransformGraph
 
 ## N(mu=0,sigma=sqrt(2/n_in)) weight and 0-bias initialiser.
 # weights_init = variance_scaling_initializer(factor=2.0, mode ='FAN_IN', 
@@ -258,6 +267,26 @@ def correctModelCheckpointPath(model_checkpoint_path, parent_directory):
     )
     return correct_model_checkpoint_path
 
+def modelParameterSetName(use_early_stopping_model = False,
+    use_best_model = False):
+    if use_early_stopping_model:
+        return "early stopping"
+    elif use_best_model:
+        return "best model"
+    else:
+        return "end of epoch"
+
+def modelParameterSetLogDirectory(model, model_parameter_set_name):
+    if model_parameter_set_name == "early stopping":
+        return model.early_stopping_log_directory
+    elif model_parameter_set_name == "best model":
+        return model.best_model_log_directory
+    elif model_parameter_set_name == "end of epoch":
+        return model.log_directory
+    else:
+        raise ValueError("Model parameter set `{}` not found.".format(
+            model_parameter_set_name))
+
 def copyModelDirectory(model_checkpoint, main_destination_directory):
     
     checkpoint_path_prefix = model_checkpoint.model_checkpoint_path
@@ -326,3 +355,559 @@ def removeOldCheckpoints(directory):
                 and not checkpoint.model_checkpoint_path in file_path
             if is_old_checkpoint_file:
                 os.remove(file_path)
+
+# Profiling
+
+class TrainingProfiler(object):
+    """
+    Record durations of the stages of training steps and epochs.
+    
+    Durations of step stages (gathering, densifying, feeding, and running
+    batches) are summed for each training step, while those of epoch stages
+    (evaluation, writing summaries, checkpointing, and plotting) are summed
+    for each epoch. If a range of global steps to trace is given, `runOptions`
+    and `runMetadata` provide arguments for `Session.run` to capture a Chrome
+    trace of the TensorFlow operations for those steps.
+    """
+    
+    step_stages = ["gather", "densify", "feed", "session_run"]
+    epoch_stages = ["evaluation", "summaries", "checkpointing", "plotting"]
+    
+    def __init__(self, enabled = False, trace_steps = None):
+        
+        self.enabled = enabled
+        
+        if trace_steps:
+            self.trace_steps = range(*trace_steps)
+        else:
+            self.trace_steps = range(0)
+        
+        self.steps = {stage: [] for stage in self.step_stages}
+        self.epochs = {stage: [] for stage in self.epoch_stages}
+        self.traces = {}
+        
+        self._current = {
+            stage: 0 for stage in self.step_stages + self.epoch_stages}
+        self._stage = None
+        self._stage_time_start = None
+    
+    def start(self, stage):
+        if self.enabled:
+            self.stop()
+            self._stage = stage
+            self._stage_time_start = time()
+    
+    def stop(self):
+        if self.enabled and self._stage:
+            self._current[self._stage] += time() - self._stage_time_start
+            self._stage = None
+    
+    def endStep(self):
+        if self.enabled:
+            self.stop()
+            for stage in self.step_stages:
+                self.steps[stage].append(self._current[stage])
+                self._current[stage] = 0
+    
+    def endEpoch(self):
+        if self.enabled:
+            self.stop()
+            for stage in self.epoch_stages:
+                self.epochs[stage].append(self._current[stage])
+                self._current[stage] = 0
+    
+    def tracing(self, step):
+        return self.enabled and step in self.trace_steps
+    
+    def runOptions(self, step):
+        if self.tracing(step):
+            return tf.RunOptions(trace_level = tf.RunOptions.FULL_TRACE)
+    
+    def runMetadata(self, step):
+        if self.tracing(step):
+            run_metadata = tf.RunMetadata()
+            self.traces[step] = run_metadata
+            return run_metadata
+    
+    def summary(self):
+        
+        def statistics(durations):
+            durations = numpy.array(durations)
+            if durations.size == 0:
+                return None
+            return {
+                "count": int(durations.size),
+                "total": float(durations.sum()),
+                "mean": float(durations.mean()),
+                "median": float(numpy.median(durations)),
+                "maximum": float(durations.max())
+            }
+        
+        summary = {
+            "steps": {
+                stage: statistics(durations)
+                for stage, durations in self.steps.items()
+            },
+            "epochs": {
+                stage: statistics(durations)
+                for stage, durations in self.epochs.items()
+            }
+        }
+        
+        return summary
+    
+    def save(self, directory, name = "training", details = {}):
+        
+        if not self.enabled:
+            return
+        
+        self.stop()
+        
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        timestamp = strftime("%Y%m%d-%H%M%S")
+        
+        profile = {
+            "name": name,
+            "timestamp": timestamp,
+            "details": details,
+            "summary": self.summary(),
+            "epochs": self.epochs
+        }
+        
+        profile_path = os.path.join(directory,
+            "{}-{}.json".format(name, timestamp))
+        
+        with open(profile_path, "w") as profile_file:
+            json.dump(profile, profile_file, indent = 4)
+        
+        for step, run_metadata in self.traces.items():
+            trace = timeline.Timeline(run_metadata.step_stats)
+            trace_path = os.path.join(directory,
+                "{}-{}-trace-step_{}.json".format(name, timestamp, step))
+            with open(trace_path, "w") as trace_file:
+                trace_file.write(trace.generate_chrome_trace_format())
+        
+        return profile_path
+
+def formatProfileSummary(summary):
+    
+    stage_width = max(map(len,
+        TrainingProfiler.step_stages + TrainingProfiler.epoch_stages))
+    
+    rows = []
+    
+    for kind in ["steps", "epochs"]:
+        for stage, statistics in summary[kind].items():
+            if not statistics:
+                continue
+            rows.append("    {:{}}  {:>10}  ({} per {})".format(
+                stage, stage_width,
+                "{:.4g} s".format(statistics["total"]),
+                "{:.3g} ms".format(1000 * statistics["mean"]),
+                kind[:-1]
+            ))
+    
+    return "\n".join(rows)
+
+class DataParallelTrainer(object):
+    """
+    Train replicas of a model synchronously in local worker processes.
+    
+    For each epoch, the shuffled training examples are split into disjoint
+    shards, the first for the training process itself and one for each of the
+    `number_of_workers - 1` worker processes. Each process trains its own
+    replica of the model on its shard using `trainingStep`, and every
+    `synchronisation_interval` steps the variables of the replicas (model
+    parameters, optimiser slots, and batch-normalisation statistics, but not
+    the global step) are averaged, weighted by the numbers of steps taken, and
+    sent back to all replicas over pipes. The variables are also averaged at
+    the end of each epoch, so evaluation, summaries, and checkpoints in the
+    training process use the averaged model.
+    
+    At each synchronisation, the global step of the training process is
+    advanced by the steps taken by all replicas, and at the end of an epoch
+    it is set to the number of steps of an epoch of single-process training,
+    so step numbers match those of training in one process.
+    
+    The workers are forked before any TensorFlow session is created, so they
+    inherit the graph and the training data. Unless set, the threads used
+    within operations are divided evenly between the processes. Used as a
+    context manager, the workers are stopped on leaving the context, also on
+    errors.
+    """
+    
+    def __init__(self, graph, trainingStep, global_step, number_of_workers = 2,
+        synchronisation_interval = 1, session_configuration = None):
+        
+        self.number_of_workers = number_of_workers
+        self.synchronisation_interval = synchronisation_interval
+        
+        self.session_configuration = tf.ConfigProto()
+        
+        if session_configuration:
+            self.session_configuration.CopyFrom(session_configuration)
+        
+        if not self.session_configuration.intra_op_parallelism_threads:
+            self.session_configuration.intra_op_parallelism_threads = max(1,
+                multiprocessing.cpu_count() // number_of_workers)
+        
+        with graph.as_default():
+            
+            self.variables = [
+                variable for variable in tf.global_variables()
+                if variable is not global_step
+            ]
+            
+            self.placeholders = [
+                tf.placeholder(variable.dtype.base_dtype, variable.shape)
+                for variable in self.variables
+            ]
+            self.assignment = tf.group(*[
+                tf.assign(variable, placeholder)
+                for variable, placeholder
+                in zip(self.variables, self.placeholders)
+            ])
+            
+            self.global_step = global_step
+            self.global_step_value = tf.placeholder(
+                global_step.dtype.base_dtype, [])
+            self.global_step_assignment = tf.assign(
+                global_step, self.global_step_value)
+            
+            self.initialisation = tf.global_variables_initializer()
+        
+        context = multiprocessing.get_context("fork")
+        
+        self.connections = []
+        self.processes = []
+        
+        for i in range(number_of_workers - 1):
+            
+            connection, worker_connection = context.Pipe()
+            
+            process = context.Process(
+                target = self._work,
+                args = (worker_connection, connection, graph, trainingStep),
+                daemon = True
+            )
+            process.start()
+            
+            worker_connection.close()
+            
+            self.connections.append(connection)
+            self.processes.append(process)
+        
+        self.number_of_synchronisations = 0
+        self.steps_since_synchronisation = 0
+        
+        self.epoch_start_step = 0
+        self.number_of_epoch_steps = 0
+        self.epoch_steps = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception_details):
+        self.close()
+    
+    def startEpoch(self, session, shuffled_indices, batch_size,
+        warm_up_weight):
+        # Send shards and the current variables to the workers and return the
+        # shard for the training process, which is the largest.
+        
+        shards = numpy.array_split(shuffled_indices, self.number_of_workers)
+        
+        number_of_steps = int(numpy.ceil(len(shards[0]) / batch_size))
+        number_of_rounds = int(numpy.ceil(
+            number_of_steps / self.synchronisation_interval))
+        
+        values, self.epoch_start_step = session.run(
+            [self.variables, self.global_step])
+        self.number_of_epoch_steps = int(numpy.ceil(
+            len(shuffled_indices) / batch_size))
+        self.epoch_steps = 0
+        
+        for connection, shard in zip(self.connections, shards[1:]):
+            connection.send({
+                "shard": shard,
+                "batch size": batch_size,
+                "warm-up weight": warm_up_weight,
+                "number of rounds": number_of_rounds,
+                "values": values
+            })
+        
+        self.steps_since_synchronisation = 0
+        
+        return shards[0]
+    
+    def step(self, session):
+        
+        self.steps_since_synchronisation += 1
+        
+        if self.steps_since_synchronisation \
+            == self.synchronisation_interval:
+            self.synchronise(session)
+    
+    def endEpoch(self, session):
+        
+        if self.steps_since_synchronisation:
+            self.synchronise(session)
+        
+        self._setGlobalStep(session,
+            self.epoch_start_step + self.number_of_epoch_steps)
+    
+    def synchronise(self, session):
+        
+        value_sets = [session.run(self.variables)]
+        weights = [self.steps_since_synchronisation]
+        
+        for connection in self.connections:
+            try:
+                number_of_steps, values = connection.recv()
+            except EOFError:
+                raise RuntimeError(
+                    "Training worker stopped unexpectedly.") from None
+            value_sets.append(values)
+            weights.append(number_of_steps)
+        
+        total_weight = sum(weights)
+        
+        averaged_values = [
+            numpy.asarray(
+                sum(weight * values[j] for weight, values
+                    in zip(weights, value_sets)) / total_weight,
+                dtype = value_sets[0][j].dtype
+            )
+            for j in range(len(self.variables))
+        ]
+        
+        for connection in self.connections:
+            connection.send(averaged_values)
+        
+        self._assign(session, averaged_values)
+        
+        # The shards together have more batches than the full training set
+        # when their sizes are not multiples of the batch size, so the global
+        # step is kept within the epoch.
+        self.epoch_steps += total_weight
+        self._setGlobalStep(session, self.epoch_start_step
+            + min(self.epoch_steps, self.number_of_epoch_steps))
+        
+        self.number_of_synchronisations += 1
+        self.steps_since_synchronisation = 0
+    
+    def close(self, timeout = 10):
+        
+        # Workers stop when their pipes are closed, also in the middle of an
+        # epoch. Workers not stopping in time are terminated.
+        
+        for connection in self.connections:
+            connection.close()
+        
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        
+        self.connections = []
+        self.processes = []
+    
+    def _assign(self, session, values):
+        session.run(self.assignment, feed_dict = dict(
+            zip(self.placeholders, values)))
+    
+    def _setGlobalStep(self, session, step):
+        session.run(self.global_step_assignment,
+            feed_dict = {self.global_step_value: step})
+    
+    def _work(self, connection, training_connection, graph, trainingStep):
+        
+        # Only the training process keeps its ends of the pipes, so workers
+        # notice if it stops.
+        for other_connection in self.connections + [training_connection]:
+            other_connection.close()
+        
+        with tf.Session(graph = graph, config = self.session_configuration) \
+            as session:
+            
+            session.run(self.initialisation)
+            
+            try:
+                while True:
+                    self._trainEpoch(session, connection, trainingStep)
+            except (EOFError, BrokenPipeError):
+                pass
+        
+        connection.close()
+    
+    def _trainEpoch(self, session, connection, trainingStep):
+        
+        epoch = connection.recv()
+        
+        self._assign(session, epoch["values"])
+        
+        shard = epoch["shard"]
+        batch_size = epoch["batch size"]
+        
+        batches = [
+            shard[i:(i + batch_size)]
+            for i in range(0, len(shard), batch_size)
+        ]
+        
+        for r in range(epoch["number of rounds"]):
+            
+            round_batches = batches[
+                r * self.synchronisation_interval:
+                (r + 1) * self.synchronisation_interval
+            ]
+            
+            for batch_indices in round_batches:
+                trainingStep(session, batch_indices, epoch["warm-up weight"])
+            
+            connection.send((len(round_batches), session.run(self.variables)))
+            self._assign(session, connection.recv())
+
+def outputArray(shape, directory = None, name = "output",
+    temporary = False):
+    
+    if not directory:
+        return numpy.empty(shape, numpy.float32)
+    
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    
+    if temporary:
+        file_descriptor, path = tempfile.mkstemp(prefix = name + "-",
+            suffix = ".npy", dir = directory)
+        os.close(file_descriptor)
+    else:
+        path = os.path.join(directory, name + ".npy")
+    
+    # Batches written to the memory-mapped file are paged out to disk by
+    # the operating system, so only recently written rows stay resident.
+    array = numpy.lib.format.open_memmap(path, mode = "w+",
+        dtype = numpy.float32, shape = shape)
+    
+    # A temporary file is removed from the directory at once, and its disk
+    # space is freed when the array is no longer used, also if an error
+    # occurs before then.
+    if temporary:
+        os.remove(path)
+    
+    return array
+
+def finaliseOutputArray(array):
+    
+    if not isinstance(array, numpy.memmap):
+        return array
+    
+    array.flush()
+    path = array.filename
+    
+    # Temporary files have already been removed, so they are used as is.
+    if not os.path.exists(path):
+        return array
+    
+    del array
+    
+    # Reopen copy-on-write, so analyses can read the outputs without
+    # changing them on disk.
+    array = numpy.load(path, mmap_mode = "c")
+    
+    return array
+
+inference_graph_filename = "inference_graph.pb"
+inference_signature_filename = "inference_signature.json"
+
+def freezeInferenceGraph(model, model_parameter_set_name, inputs, outputs,
+    constants = {}, metadata = {}, output_directory = None):
+    
+    # Only the part of the model graph computing the outputs from the inputs
+    # is kept. Variables are replaced by their trained values, and
+    # placeholders with fixed values during inference by constants, so the
+    # graph can be constant-folded and run without building the model.
+    
+    log_directory = modelParameterSetLogDirectory(model,
+        model_parameter_set_name)
+    
+    checkpoint = tf.train.get_checkpoint_state(log_directory)
+    
+    if not checkpoint:
+        print("Cannot export inference graph when model has not been trained.")
+        return None
+    
+    if output_directory is None:
+        output_directory = os.path.join(log_directory, "inference")
+    
+    print("Exporting inference graph for {}.".format(
+        model_parameter_set_name))
+    export_time_start = time()
+    
+    output_node_names = [tensor.op.name for tensor in outputs.values()]
+    
+    with tf.Session(graph = model.graph,
+        config = model.session_configuration) as session:
+        model_checkpoint_path = correctModelCheckpointPath(
+            checkpoint.model_checkpoint_path,
+            log_directory
+        )
+        model.saver.restore(session, model_checkpoint_path)
+        epoch = int(os.path.split(model_checkpoint_path)[-1].split('-')[-1])
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            session, model.graph.as_graph_def(), output_node_names)
+    
+    node_names = set(node.name for node in graph_def.node)
+    
+    with tf.Graph().as_default() as graph:
+        input_map = {
+            tensor.name: tf.constant(value, dtype = tensor.dtype,
+                name = "inference_constants/" + tensor.op.name)
+            for tensor, value in constants.items()
+            if tensor.op.name in node_names
+        }
+        tf.import_graph_def(graph_def, input_map = input_map, name = "")
+        graph_def = tf.graph_util.extract_sub_graph(graph.as_graph_def(),
+            output_node_names)
+    
+    node_names = set(node.name for node in graph_def.node)
+    
+    inputs = {
+        role: tensor for role, tensor in inputs.items()
+        if tensor.op.name in node_names
+    }
+    
+    graph_def = TransformGraph(
+        graph_def,
+        [tensor.op.name for tensor in inputs.values()],
+        output_node_names,
+        ["fold_constants(ignore_errors=true)", "sort_by_execution_order"]
+    )
+    
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    
+    tf.train.write_graph(graph_def, output_directory,
+        inference_graph_filename, as_text = False)
+    
+    signature = {
+        "inputs": {role: tensor.name for role, tensor in inputs.items()},
+        "outputs": {role: tensor.name for role, tensor in outputs.items()},
+        "model parameter set": model_parameter_set_name,
+        "epoch": epoch
+    }
+    signature.update(metadata)
+    
+    signature_path = os.path.join(output_directory,
+        inference_signature_filename)
+    
+    with open(signature_path, "w") as signature_file:
+        json.dump(signature, signature_file, indent = 4)
+    
+    export_duration = time() - export_time_start
+    print("Inference graph exported to {} ({}).".format(output_directory,
+        formatDuration(export_duration)))
+    
+    return output_directory
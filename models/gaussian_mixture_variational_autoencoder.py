@@ -24,7 +24,11 @@ from models.auxiliary import (
     log_reduce_exp, reduce_logmeanexp,
     correctModelCheckpointPath,
     trainingString, dataString,
-    copyModelDirectory, removeOldCheckpoints
+    copyModelDirectory, removeOldCheckpoints,
+    TrainingProfiler, DataParallelTrainer, formatProfileSummary,
+    outputArray, finaliseOutputArray,
+    modelParameterSetName, modelParameterSetLogDirectory,
+    freezeInferenceGraph
 )
 
 from tensorflow.python.ops.nn import relu, softmax
@@ -38,15 +42,17 @@ from distributions import distributions, latent_distributions, Categorized
 
 import numpy
 from numpy import inf
-import scipy.sparse
 
 import copy
 import os, shutil
+import contextlib
 from time import time
 from auxiliary import formatDuration, normaliseString
 
 from data import DataSet
-from analysis import analyseIntermediateResults, accuracy
+from analysis import (
+    analyseIntermediateResults, IntermediateResultsAnalyser, accuracy
+)
 from miscellaneous.prediction import mapClusterIDsToLabelIDs
 from auxiliary import loadLearningCurves
 
@@ -64,6 +70,7 @@ class GaussianMixtureVariationalAutoencoder(object):
         dropout_keep_probabilities = [],
         count_sum = True,
         number_of_warm_up_epochs = 0, epsilon = 1e-6,
+        intra_op_parallelism_threads = 0, inter_op_parallelism_threads = 0,
         log_directory = "log",
         results_directory = "results"):
         
@@ -161,6 +168,13 @@ class GaussianMixtureVariationalAutoencoder(object):
         self.base_log_directory = log_directory
         self.base_results_directory = results_directory
         
+        # Numbers of threads used within and between operations by sessions
+        # (0: chosen by TensorFlow)
+        self.session_configuration = tf.ConfigProto(
+            intra_op_parallelism_threads = intra_op_parallelism_threads,
+            inter_op_parallelism_threads = inter_op_parallelism_threads
+        )
+        
         # Early stopping
         self.early_stopping_rounds = 10
         self.stopped_early = None
@@ -635,19 +649,12 @@ class GaussianMixtureVariationalAutoencoder(object):
             
             if "constrained" in self.reconstruction_distribution_name or \
                 "multinomial" in self.reconstruction_distribution_name:
-                p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta,
-                    self.replicated_n
-                )
-            elif "multinomial" in self.reconstruction_distribution_name:
-                p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta,
-                    self.replicated_n
-                )
+                x_distribution_parameters = [x_theta, self.replicated_n]
             else:
-                p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta
-                )
+                x_distribution_parameters = [x_theta]
+            
+            p_x_given_z = self.reconstruction_distribution["class"](
+                *x_distribution_parameters)
             
             if self.k_max:
                 x_logits = dense_layer(
@@ -667,7 +674,9 @@ class GaussianMixtureVariationalAutoencoder(object):
                 
                 p_x_given_z = Categorized(
                     dist = p_x_given_z,
-                    cat = Categorical(logits = x_logits)
+                    cat = Categorical(logits = x_logits),
+                    dist_class = self.reconstruction_distribution["class"],
+                    dist_parameters = x_distribution_parameters
                 )
             
             return p_x_given_z
@@ -1060,8 +1069,10 @@ class GaussianMixtureVariationalAutoencoder(object):
     
     def train(self, training_set, validation_set,
         number_of_epochs = 100, batch_size = 100, learning_rate = 1e-3,
-        plotting_interval = None, reset_training = False,
-        temporary_log_directory = None):
+        plotting_interval = None, number_of_plotting_workers = 0,
+        reset_training = False, temporary_log_directory = None,
+        profile = False, profiling_trace_steps = None,
+        number_of_training_workers = 1, synchronisation_interval = 1):
         
         if reset_training and os.path.exists(self.log_directory):
             shutil.rmtree(self.log_directory)
@@ -1191,6 +1202,10 @@ class GaussianMixtureVariationalAutoencoder(object):
         ### Preprocessing function at every epoch
         noisy_preprocess = training_set.noisy_preprocess
         
+        if noisy_preprocess and number_of_training_workers > 1:
+            raise ValueError("Values cannot be noisily preprocessed for "
+                "each epoch when training in parallel.")
+        
         ### Input and output
         if not noisy_preprocess:
             
@@ -1254,8 +1269,10 @@ class GaussianMixtureVariationalAutoencoder(object):
             preparing_data_duration)))
         print()
         
-        ## Display intervals during every epoch
-        steps_per_epoch = numpy.ceil(M_train / batch_size)
+        ## Display intervals during every epoch (of the training process
+        ## itself, when training in parallel)
+        steps_per_epoch = numpy.ceil(
+            numpy.ceil(M_train / number_of_training_workers) / batch_size)
         output_at_step = numpy.round(numpy.linspace(0, steps_per_epoch, 11))
         
         ## Learning curves
@@ -1275,7 +1292,117 @@ class GaussianMixtureVariationalAutoencoder(object):
             }
         }
         
-        with tf.Session(graph = self.graph) as session:
+        ## Background processes (stopped when leaving the session, also
+        ## on errors)
+        background_processes = contextlib.ExitStack()
+        
+        ## Intermediate results (plotted in background processes forked
+        ## before the session is created)
+        if number_of_plotting_workers:
+            intermediate_results_analyser = \
+                background_processes.enter_context(
+                    IntermediateResultsAnalyser(
+                        data_set = validation_set,
+                        number_of_workers = number_of_plotting_workers
+                    )
+                )
+            plotIntermediateResults = intermediate_results_analyser.analyse
+        else:
+            plotIntermediateResults = analyseIntermediateResults
+        
+        ## Profiling
+        profiler = TrainingProfiler(
+            enabled = profile,
+            trace_steps = profiling_trace_steps
+        )
+        
+        def saveTrainingProfile(training_duration, message = None):
+            
+            details = {
+                "model": self.name,
+                "epochs": [epoch_start, number_of_epochs],
+                "batch size": batch_size,
+                "learning rate": learning_rate,
+                "training time": training_duration
+            }
+            
+            if message:
+                details["message"] = message
+            
+            profile_path = profiler.save(
+                directory = os.path.join(self.base_results_directory,
+                    self.name, "profiles"),
+                details = details
+            )
+            print("Training profile saved to {}:".format(profile_path))
+            print(formatProfileSummary(profiler.summary()))
+            print()
+        
+        ## Training step (also run by workers when training in parallel)
+        
+        def trainingStep(session, batch_indices, warm_up_weight, step = None):
+            
+            profiler.start("gather")
+            x_batch = x_train[batch_indices]
+            t_batch = t_train[batch_indices]
+            
+            profiler.start("densify")
+            x_batch = x_batch.toarray()
+            t_batch = t_batch.toarray()
+            
+            profiler.start("feed")
+            feed_dict_batch = {
+                self.x: x_batch,
+                self.t: t_batch,
+                self.is_training: True,
+                self.learning_rate: learning_rate, 
+                self.warm_up_weight: warm_up_weight,
+                self.S_iw:
+                    self.number_of_importance_samples["training"],
+                self.S_mc:
+                    self.number_of_monte_carlo_samples["training"]
+            }
+            
+            if self.count_sum:
+                feed_dict_batch[self.n] = n_train[batch_indices]
+
+            if self.count_sum_feature:
+                feed_dict_batch[self.n_feature] = \
+                    n_feature_train[batch_indices]
+            
+            # Run the stochastic batch training operation
+            profiler.start("session_run")
+            _, batch_loss = session.run(
+                [self.train_op, self.ELBO],
+                feed_dict = feed_dict_batch,
+                options = profiler.runOptions(step),
+                run_metadata = profiler.runMetadata(step)
+            )
+            profiler.endStep()
+            
+            return batch_loss
+        
+        ## Data-parallel training (replicas trained in worker processes
+        ## forked before the session is created)
+        if number_of_training_workers > 1:
+            data_parallel_trainer = background_processes.enter_context(
+                DataParallelTrainer(
+                    graph = self.graph,
+                    trainingStep = trainingStep,
+                    global_step = self.global_step,
+                    number_of_workers = number_of_training_workers,
+                    synchronisation_interval = synchronisation_interval,
+                    session_configuration = self.session_configuration
+                )
+            )
+            session_configuration = \
+                data_parallel_trainer.session_configuration
+        else:
+            data_parallel_trainer = None
+            session_configuration = self.session_configuration
+        
+        with background_processes, tf.Session(graph = self.graph,
+            config = session_configuration) as session:
             
             parameter_summary_writer = tf.summary.FileWriter(
                 log_directory)
@@ -1373,51 +1500,34 @@ class GaussianMixtureVariationalAutoencoder(object):
                 
                 shuffled_indices = numpy.random.permutation(M_train)
                 
-                for i in range(0, M_train, batch_size):
+                if data_parallel_trainer:
+                    shuffled_indices = data_parallel_trainer.startEpoch(
+                        session, shuffled_indices, batch_size, warm_up_weight)
+                
+                for i in range(0, len(shuffled_indices), batch_size):
                     
                     # Internal setup
                     
                     step_time_start = time()
                     
+                    profiler.start("session_run")
                     step = session.run(self.global_step)
                     
-                    # Prepare batch
+                    # Prepare batch and run the stochastic batch training
+                    # operation
                     
                     batch_indices = shuffled_indices[i:(i + batch_size)]
+                    batch_loss = trainingStep(session, batch_indices,
+                        warm_up_weight, step)
                     
-                    x_batch = x_train[batch_indices].toarray()
-                    t_batch = t_train[batch_indices].toarray()
-                    
-                    feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
-                        self.is_training: True,
-                        self.learning_rate: learning_rate, 
-                        self.warm_up_weight: warm_up_weight,
-                        self.S_iw:
-                            self.number_of_importance_samples["training"],
-                        self.S_mc:
-                            self.number_of_monte_carlo_samples["training"]
-                    }
-                    
-                    if self.count_sum:
-                        feed_dict_batch[self.n] = n_train[batch_indices]
-
-                    if self.count_sum_feature:
-                        feed_dict_batch[self.n_feature] = \
-                            n_feature_train[batch_indices]
-                    
-                    # Run the stochastic batch training operation
-                    _, batch_loss = session.run(
-                        [self.train_op, self.ELBO],
-                        feed_dict = feed_dict_batch
-                    )
+                    if data_parallel_trainer:
+                        data_parallel_trainer.step(session)
                     
                     # Compute step duration
                     step_duration = time() - step_time_start
                     
                     # Print evaluation and output summaries
-                    if (step + 1 - steps_per_epoch * epoch) in output_at_step:
+                    if (i // batch_size + 1) in output_at_step:
                         
                         print('Step {:d} ({}): {:.5g}.'.format(
                             int(step + 1), formatDuration(step_duration),
@@ -1430,8 +1540,16 @@ class GaussianMixtureVariationalAutoencoder(object):
                                 time() - training_time_start)
                             status["last epoch time"] = formatDuration(
                                 time() - epoch_time_start)
+                            if profile:
+                                saveTrainingProfile(
+                                    time() - training_time_start,
+                                    message = status["message"]
+                                )
                             return status
                 
+                if data_parallel_trainer:
+                    data_parallel_trainer.endEpoch(session)
+                
                 print()
                 
                 epoch_duration = time() - epoch_time_start
@@ -1444,6 +1562,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                     print('    Warm-up weight: {:.2g}'.format(warm_up_weight))
 
                 # Export parameter summaries
+                profiler.start("summaries")
                 parameter_summary_string = session.run(
                     self.parameter_summary,
                     feed_dict = {self.warm_up_weight: warm_up_weight}
@@ -1453,6 +1572,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                 parameter_summary_writer.flush()
                 
                 # Evaluation
+                profiler.start("evaluation")
                 print('    Evaluating model.')
                 
                 ## Training
@@ -1558,6 +1678,7 @@ class GaussianMixtureVariationalAutoencoder(object):
 
                 evaluating_duration = time() - evaluating_time_start
                 
+                profiler.start("summaries")
                 summary = tf.Summary()
                 summary.value.add(tag="losses/lower_bound",
                     simple_value = ELBO_train)
@@ -1580,6 +1701,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                 training_summary_writer.add_summary(summary,
                     global_step = epoch + 1)
                 training_summary_writer.flush()
+                profiler.start("evaluation")
                 
                 evaluation_string = "    Training set ({}): ".format(
                     formatDuration(evaluating_duration))
@@ -1716,6 +1838,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                     accuracy_superset_valid = None
                     accuracy_display = accuracy_valid
 
+                profiler.start("summaries")
                 summary = tf.Summary()
                 summary.value.add(tag="losses/lower_bound",
                     simple_value = ELBO_valid)
@@ -1765,6 +1888,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                 validation_summary_writer.add_summary(summary,
                     global_step = epoch + 1)
                 validation_summary_writer.flush()
+                profiler.start("evaluation")
                 
                 evaluating_duration = time() - evaluating_time_start
                 
@@ -1786,6 +1910,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                 print(evaluation_string)
                 
                 # Early stopping
+                profiler.start("checkpointing")
                 if not self.stopped_early:
                     
                     if ELBO_valid < ELBO_valid_early_stopping:
@@ -1858,6 +1983,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                 print()
                 
                 # Plot latent validation values
+                profiler.start("plotting")
                 if plotting_interval is None:
                     under_10 = epoch < 10
                     under_100 = epoch < 100 and (epoch + 1) % 10 == 0
@@ -1898,7 +2024,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                         }
                     else:
                         centroids = None
-                    analyseIntermediateResults(
+                    plotIntermediateResults(
                         learning_curves, epoch_start, epoch,
                         z_mean_valid, validation_set, centroids,
                         self.name, self.type,
@@ -1906,7 +2032,7 @@ class GaussianMixtureVariationalAutoencoder(object):
                     )
                     print()
                 else:
-                    analyseIntermediateResults(
+                    plotIntermediateResults(
                         learning_curves, epoch_start,
                         model_name = self.name,
                         model_type = self.type,
@@ -1914,6 +2040,8 @@ class GaussianMixtureVariationalAutoencoder(object):
                     )
                     print()
                 
+                profiler.endEpoch()
+                
                 # Update variables for previous iteration
                 ELBO_valid_prev = ELBO_valid
             
@@ -1922,6 +2050,10 @@ class GaussianMixtureVariationalAutoencoder(object):
             print("Model trained for {} epochs ({}).".format(
                 number_of_epochs, formatDuration(training_duration)))
             
+            if profile:
+                print()
+                saveTrainingProfile(training_duration)
+            
             # Clean up
             
             removeOldCheckpoints(log_directory)
@@ -1951,7 +2083,27 @@ class GaussianMixtureVariationalAutoencoder(object):
     def evaluate(self, evaluation_set, evaluation_subset_indices = set(),
         batch_size = 100, predict_labels = True,
         use_early_stopping_model = False, use_best_model = False,
-        output_versions = "all", log_results = True):
+        output_versions = "all", log_results = True,
+        stream_reconstructions = False, metric_accumulators = [],
+        model_parameter_set_names = None):
+        
+        # Several model parameter sets can be evaluated in one pass over the
+        # evaluation set by naming them. Each batch is then prepared once
+        # and run through a session for each parameter set. Output sets and
+        # metric accumulators are then dictionaries keyed by parameter set.
+        # Reconstructions for more than one parameter set are always
+        # streamed, so they are not held in memory at the same time.
+        
+        if model_parameter_set_names is None:
+            multiple_model_parameter_sets = False
+            model_parameter_set_names = [modelParameterSetName(
+                use_early_stopping_model, use_best_model)]
+            metric_accumulators = {
+                model_parameter_set_names[0]: metric_accumulators}
+        else:
+            multiple_model_parameter_sets = True
+            if not metric_accumulators:
+                metric_accumulators = {}
         
         # Setup
         
@@ -2051,84 +2203,153 @@ class GaussianMixtureVariationalAutoencoder(object):
             else:
                 excluded_superset_class_ids = []
         
-        ## Other
-        
-        if use_early_stopping_model:
-            log_directory = self.early_stopping_log_directory
-        elif use_best_model:
-            log_directory = self.best_model_log_directory
-        else:
-            log_directory = self.log_directory
-            
-        checkpoint = tf.train.get_checkpoint_state(log_directory)
-        
-        if log_results:
-            eval_summary_directory = os.path.join(log_directory, "evaluation")
-            if os.path.exists(eval_summary_directory):
-                shutil.rmtree(eval_summary_directory)
-        
         # Evaluation
         
-        with tf.Session(graph = self.graph) as session:
-            
-            if log_results:
-                eval_summary_writer = tf.summary.FileWriter(
-                    eval_summary_directory)
+        evaluations = {}
+        
+        with contextlib.ExitStack() as sessions:
             
-            if checkpoint:
+            for model_parameter_set_name in model_parameter_set_names:
+                
+                log_directory = modelParameterSetLogDirectory(self,
+                    model_parameter_set_name)
+                
+                checkpoint = tf.train.get_checkpoint_state(log_directory)
+                
+                if not checkpoint:
+                    print("Cannot evaluate model when it has not been trained.")
+                    if multiple_model_parameter_sets:
+                        return {
+                            name: [None] * len(output_versions)
+                            for name in model_parameter_set_names
+                        }
+                    else:
+                        return [None] * len(output_versions)
+                
+                session = sessions.enter_context(
+                    tf.Session(graph = self.graph,
+                        config = self.session_configuration))
+                
                 model_checkpoint_path = correctModelCheckpointPath(
                     checkpoint.model_checkpoint_path,
                     log_directory
                 )
                 self.saver.restore(session, model_checkpoint_path)
-                epoch = int(os.path.split(model_checkpoint_path)[-1]
-                    .split('-')[-1])
-            else:
-                print("Cannot evaluate model when it has not been trained.")
-                return [None] * len(output_versions)
+                
+                evaluation = {
+                    "session": session,
+                    "log directory": log_directory,
+                    "epoch": int(os.path.split(model_checkpoint_path)[-1]
+                        .split('-')[-1]),
+                    "metric accumulators": metric_accumulators.get(
+                        model_parameter_set_name, []),
+                    "ELBO": 0,
+                    "KL_z": 0,
+                    "KL_y": 0,
+                    "ENRE": 0,
+                    "q_y_logits": numpy.zeros((M_eval, self.K))
+                }
+                
+                if log_results:
+                    evaluation.update({
+                        "q_y_probabilities": numpy.zeros(self.K),
+                        "q_z_means": numpy.zeros((self.K, self.latent_size)),
+                        "q_z_variances": numpy.zeros(
+                            (self.K, self.latent_size)),
+                        "p_y_probabilities": numpy.zeros(self.K),
+                        "p_z_means": numpy.zeros((self.K, self.latent_size)),
+                        "p_z_variances": numpy.zeros(
+                            (self.K, self.latent_size))
+                    })
+                
+                if "reconstructed" in output_versions:
+                    if stream_reconstructions \
+                        or len(model_parameter_set_names) > 1:
+                        reconstruction_directory = os.path.join(
+                            log_directory, "reconstructions")
+                    else:
+                        reconstruction_directory = None
+                    evaluation["p_x_mean"] = outputArray((M_eval, F_eval),
+                        reconstruction_directory, evaluation_set.kind,
+                        temporary = True)
+                    evaluation["p_x_stddev"] = {}
+                    evaluation["stddev_of_p_x_given_z_mean"] = {}
+                
+                if "latent" in output_versions:
+                    evaluation["z_mean"] = numpy.zeros(
+                        (M_eval, self.latent_size), numpy.float32)
+                    evaluation["y_mean"] = numpy.zeros((M_eval, self.K),
+                        numpy.float32)
+                
+                evaluations[model_parameter_set_name] = evaluation
             
             data_string = dataString(evaluation_set,
                 self.reconstruction_distribution_name)
             print('Evaluating trained model on {}.'.format(data_string))
             evaluating_time_start = time()
             
-            ELBO_eval = 0
-            KL_z_eval = 0
-            KL_y_eval = 0
-            ENRE_eval = 0
+            # Only fetch what the requested outputs need, so the remaining
+            # parts of the graph are not run. Losses need the decoder, so
+            # they are only computed when logged or when reconstructions are
+            # computed anyway.
             
-            if log_results:
-                q_y_probabilities = numpy.zeros(self.K)
-                q_z_means = numpy.zeros((self.K, self.latent_size))
-                q_z_variances = numpy.zeros((self.K, self.latent_size))
-                p_y_probabilities = numpy.zeros(self.K)
-                p_z_means = numpy.zeros((self.K, self.latent_size))
-                p_z_variances = numpy.zeros((self.K, self.latent_size))
+            compute_losses = log_results \
+                or "reconstructed" in output_versions \
+                or any(metric_accumulators.values())
+            
+            fetches = {
+                "q_y_logits": self.q_y_logits
+            }
+            
+            if compute_losses:
+                fetches["ELBO"] = self.ELBO
+                fetches["ENRE"] = self.ENRE
+                fetches["KL_z"] = self.KL_z
+                fetches["KL_y"] = self.KL_y
+            
+            cluster_statistics_fetches = {
+                "q_y_probabilities": self.q_y_probabilities,
+                "q_z_means": self.q_z_means,
+                "q_z_variances": self.q_z_variances,
+                "p_y_probabilities": self.p_y_probabilities,
+                "p_z_means": self.p_z_means,
+                "p_z_variances": self.p_z_variances
+            }
             
-            q_y_logits = numpy.zeros((M_eval, self.K))
+            if log_results:
+                fetches.update(cluster_statistics_fetches)
             
-            if "reconstructed" in output_versions:
-                p_x_mean_eval = numpy.zeros((M_eval, F_eval), numpy.float32)
-                p_x_stddev_eval = scipy.sparse.lil_matrix((M_eval, F_eval),
-                    dtype = numpy.float32)
-                stddev_of_p_x_given_z_mean_eval = scipy.sparse.lil_matrix(
-                    (M_eval, F_eval), dtype = numpy.float32)
+            if "reconstructed" in output_versions \
+                or any(metric_accumulators.values()):
+                fetches["p_x_mean"] = self.p_x_mean
             
             if "latent" in output_versions:
-                z_mean_eval = numpy.zeros((M_eval, self.latent_size),
-                    numpy.float32)
-                y_mean_eval = numpy.zeros((M_eval, self.K), numpy.float32)
+                fetches["y_mean"] = self.y_mean
+                fetches["z_mean"] = self.z_mean
+            
+            standard_deviation_fetches = {
+                "p_x_stddev": self.p_x_stddev,
+                "stddev_of_p_x_given_z_mean": self.stddev_of_p_x_given_z_mean
+            }
+            
+            sorted_evaluation_subset_indices = numpy.array(
+                sorted(evaluation_subset_indices), numpy.int64)
             
             for i in range(0, M_eval, batch_size):
                 
                 indices = numpy.arange(i, min(i + batch_size, M_eval))
                 
-                subset_indices = numpy.array(list(
-                    evaluation_subset_indices.intersection(indices)))
+                subset_indices = sorted_evaluation_subset_indices[
+                    numpy.searchsorted(sorted_evaluation_subset_indices, i):
+                    numpy.searchsorted(sorted_evaluation_subset_indices,
+                        i + batch_size)
+                ]
+                
+                t_batch = t_eval[indices].toarray()
                 
                 feed_dict_batch = {
                     self.x: x_eval[indices].toarray(),
-                    self.t: t_eval[indices].toarray(),
+                    self.t: t_batch,
                     self.is_training: False,
                     self.warm_up_weight: 1.0,
                     self.S_iw:
@@ -2142,178 +2363,239 @@ class GaussianMixtureVariationalAutoencoder(object):
                 if self.count_sum_feature:
                     feed_dict_batch[self.n_feature] = n_feature_eval[indices]
 
-                (ELBO_i, ENRE_i, KL_z_i, KL_y_i,
-                    q_y_probabilities_i, q_z_means_i, q_z_variances_i,
-                    p_y_probabilities_i, p_z_means_i, p_z_variances_i,
-                    q_y_logits_i, p_x_mean_i,
-                    p_x_stddev_i, stddev_of_p_x_given_z_mean_i,
-                    y_mean_i, z_mean_i) = session.run(
-                        [
-                            self.ELBO, self.ENRE, self.KL_z, self.KL_y,
-                            self.q_y_probabilities, self.q_z_means, 
-                            self.q_z_variances, self.p_y_probabilities, 
-                            self.p_z_means, self.p_z_variances,
-                            self.q_y_logits, self.p_x_mean,
-                            self.p_x_stddev, self.stddev_of_p_x_given_z_mean,
-                            self.y_mean, self.z_mean
-                        ],
-                        feed_dict = feed_dict_batch
-                    )
-                
-                ELBO_eval += ELBO_i
-                KL_z_eval += KL_z_i
-                KL_y_eval += KL_y_i
-                ENRE_eval += ENRE_i
-                
-                if log_results:
-                    q_y_probabilities += numpy.array(q_y_probabilities_i)
-                    q_z_means += numpy.array(q_z_means_i)
-                    q_z_variances += numpy.array(q_z_variances_i)
-                    p_y_probabilities += numpy.array(p_y_probabilities_i)
-                    p_z_means += numpy.array(p_z_means_i)
-                    p_z_variances += numpy.array(p_z_variances_i)
+                batch_fetches = fetches.copy()
                 
-                q_y_logits[indices] = q_y_logits_i
+                # Standard deviations are only kept for subset examples.
+                if "reconstructed" in output_versions \
+                    and subset_indices.size > 0:
+                    batch_fetches.update(standard_deviation_fetches)
                 
-                if "reconstructed" in output_versions:
-                    p_x_mean_eval[indices] = p_x_mean_i 
-                
-                    if subset_indices.size > 0:
-                        p_x_stddev_eval[subset_indices] = \
-                            p_x_stddev_i[subset_indices - i]
-                        stddev_of_p_x_given_z_mean_eval[subset_indices] = \
-                            stddev_of_p_x_given_z_mean_i[subset_indices - i]
+                if evaluation_set.has_labels:
+                    labels_batch = evaluation_set.labels[indices]
+                else:
+                    labels_batch = None
                 
-                if "latent" in output_versions:
-                    y_mean_eval[indices] = y_mean_i 
-                    z_mean_eval[indices] = z_mean_i 
+                for evaluation in evaluations.values():
+                    
+                    results_i = evaluation["session"].run(batch_fetches,
+                        feed_dict = feed_dict_batch)
+                    
+                    if compute_losses:
+                        evaluation["ELBO"] += results_i["ELBO"]
+                        evaluation["KL_z"] += results_i["KL_z"]
+                        evaluation["KL_y"] += results_i["KL_y"]
+                        evaluation["ENRE"] += results_i["ENRE"]
+                    
+                    if log_results:
+                        for statistic in cluster_statistics_fetches:
+                            evaluation[statistic] += numpy.array(
+                                results_i[statistic])
+                    
+                    evaluation["q_y_logits"][indices] = \
+                        results_i["q_y_logits"]
+                    
+                    for metric_accumulator in \
+                        evaluation["metric accumulators"]:
+                        metric_accumulator.update(t_batch,
+                            results_i["p_x_mean"], labels_batch)
+                    
+                    if "reconstructed" in output_versions:
+                        evaluation["p_x_mean"][indices] = results_i["p_x_mean"]
+                        
+                        for j in subset_indices:
+                            evaluation["p_x_stddev"][j] = \
+                                results_i["p_x_stddev"][j - i]
+                            evaluation["stddev_of_p_x_given_z_mean"][j] = \
+                                results_i["stddev_of_p_x_given_z_mean"][j - i]
+                    
+                    if "latent" in output_versions:
+                        evaluation["y_mean"][indices] = results_i["y_mean"]
+                        evaluation["z_mean"][indices] = results_i["z_mean"]
             
-            ELBO_eval /= M_eval / batch_size
-            KL_z_eval /= M_eval / batch_size
-            KL_y_eval /= M_eval / batch_size
-            ENRE_eval /= M_eval / batch_size
+            evaluating_duration = time() - evaluating_time_start
             
-            if log_results:
-                q_y_probabilities /= M_eval / batch_size
-                q_z_means /= M_eval / batch_size
-                q_z_variances /= M_eval / batch_size
-                p_y_probabilities /= M_eval / batch_size
-                p_z_means /= M_eval / batch_size
-                p_z_variances /= M_eval / batch_size
-            
-            evaluation_cluster_ids = q_y_logits.argmax(axis = 1)
-            
-            if evaluation_set.has_labels:
-                predicted_evaluation_label_ids = mapClusterIDsToLabelIDs(
-                    evaluation_label_ids,
-                    evaluation_cluster_ids,
-                    excluded_class_ids
-                )
-                accuracy_eval = accuracy(
-                    evaluation_label_ids,
-                    predicted_evaluation_label_ids,
-                    excluded_class_ids
-                )
-            else:
-                accuracy_eval = None
-            
-            if evaluation_set.label_superset:
-                predicted_evaluation_superset_label_ids = \
-                    mapClusterIDsToLabelIDs(
-                    evaluation_superset_label_ids,
-                    evaluation_cluster_ids,
-                    excluded_superset_class_ids
-                )
-                accuracy_superset_eval = accuracy(
-                    evaluation_superset_label_ids,
-                    predicted_evaluation_superset_label_ids,
-                    excluded_superset_class_ids
-                )
-                accuracy_display = accuracy_superset_eval
-            else:
-                accuracy_superset_eval = None
-                accuracy_display = accuracy_eval
+            output_sets_for_model_parameter_sets = {}
             
-            if log_results:
+            for model_parameter_set_name, evaluation \
+                in evaluations.items():
                 
-                summary = tf.Summary()
-                summary.value.add(tag="losses/lower_bound",
-                    simple_value = ELBO_eval)
-                summary.value.add(tag="losses/reconstruction_error",
-                    simple_value = ENRE_eval)
-                summary.value.add(tag="losses/kl_divergence_z",
-                    simple_value = KL_z_eval)
-                summary.value.add(tag="losses/kl_divergence_y",
-                    simple_value = KL_y_eval)
-                summary.value.add(tag="accuracy", simple_value = accuracy_eval)
-                if accuracy_superset_eval:
-                    summary.value.add(tag="superset_accuracy",
-                        simple_value = accuracy_superset_eval)
-    
-                for k in range(self.K):
-                    summary.value.add(
-                        tag="prior/cluster_{}/probability".format(k),
-                        simple_value = p_y_probabilities[k]
+                ELBO_eval = evaluation["ELBO"] / (M_eval / batch_size)
+                KL_z_eval = evaluation["KL_z"] / (M_eval / batch_size)
+                KL_y_eval = evaluation["KL_y"] / (M_eval / batch_size)
+                ENRE_eval = evaluation["ENRE"] / (M_eval / batch_size)
+                
+                if log_results:
+                    q_y_probabilities = evaluation["q_y_probabilities"] \
+                        / (M_eval / batch_size)
+                    q_z_means = evaluation["q_z_means"] / (M_eval / batch_size)
+                    q_z_variances = evaluation["q_z_variances"] \
+                        / (M_eval / batch_size)
+                    p_y_probabilities = evaluation["p_y_probabilities"] \
+                        / (M_eval / batch_size)
+                    p_z_means = evaluation["p_z_means"] / (M_eval / batch_size)
+                    p_z_variances = evaluation["p_z_variances"] \
+                        / (M_eval / batch_size)
+                
+                evaluation_cluster_ids = \
+                    evaluation["q_y_logits"].argmax(axis = 1)
+                
+                if evaluation_set.has_labels:
+                    predicted_evaluation_label_ids = mapClusterIDsToLabelIDs(
+                        evaluation_label_ids,
+                        evaluation_cluster_ids,
+                        excluded_class_ids
                     )
-                    summary.value.add(
-                        tag="posterior/cluster_{}/probability".format(k),
-                        simple_value = q_y_probabilities[k]
+                    accuracy_eval = accuracy(
+                        evaluation_label_ids,
+                        predicted_evaluation_label_ids,
+                        excluded_class_ids
                     )
-                    for l in range(self.latent_size):
-                        summary.value.add(
-                            tag="prior/cluster_{}/mean/dimension_{}".format(
-                                k, l),
-                            simple_value = p_z_means[k][l]
-                        )
+                else:
+                    accuracy_eval = None
+                
+                if evaluation_set.label_superset:
+                    predicted_evaluation_superset_label_ids = \
+                        mapClusterIDsToLabelIDs(
+                        evaluation_superset_label_ids,
+                        evaluation_cluster_ids,
+                        excluded_superset_class_ids
+                    )
+                    accuracy_superset_eval = accuracy(
+                        evaluation_superset_label_ids,
+                        predicted_evaluation_superset_label_ids,
+                        excluded_superset_class_ids
+                    )
+                    accuracy_display = accuracy_superset_eval
+                else:
+                    accuracy_superset_eval = None
+                    accuracy_display = accuracy_eval
+                
+                if log_results:
+                    
+                    eval_summary_directory = os.path.join(
+                        evaluation["log directory"], "evaluation")
+                    if os.path.exists(eval_summary_directory):
+                        shutil.rmtree(eval_summary_directory)
+                    
+                    eval_summary_writer = tf.summary.FileWriter(
+                        eval_summary_directory)
+                    
+                    summary = tf.Summary()
+                    summary.value.add(tag="losses/lower_bound",
+                        simple_value = ELBO_eval)
+                    summary.value.add(tag="losses/reconstruction_error",
+                        simple_value = ENRE_eval)
+                    summary.value.add(tag="losses/kl_divergence_z",
+                        simple_value = KL_z_eval)
+                    summary.value.add(tag="losses/kl_divergence_y",
+                        simple_value = KL_y_eval)
+                    summary.value.add(tag="accuracy",
+                        simple_value = accuracy_eval)
+                    if accuracy_superset_eval:
+                        summary.value.add(tag="superset_accuracy",
+                            simple_value = accuracy_superset_eval)
+        
+                    for k in range(self.K):
                         summary.value.add(
-                            tag="posterior/cluster_{}/mean/dimension_{}"
-                                .format(k, l),
-                            simple_value = q_z_means[k, l]
+                            tag="prior/cluster_{}/probability".format(k),
+                            simple_value = p_y_probabilities[k]
                         )
                         summary.value.add(
-                            tag="prior/cluster_{}/variance/dimension_{}"\
-                                .format(k, l),
-                            simple_value = p_z_variances[k][l]
+                            tag="posterior/cluster_{}/probability".format(k),
+                            simple_value = q_y_probabilities[k]
                         )
-                        summary.value.add(
-                            tag="posterior/cluster_{}/variance/dimension_{}"\
-                                .format(k, l),
-                            simple_value = q_z_variances[k, l]
+                        for l in range(self.latent_size):
+                            summary.value.add(
+                                tag="prior/cluster_{}/mean/dimension_{}"\
+                                    .format(k, l),
+                                simple_value = p_z_means[k][l]
+                            )
+                            summary.value.add(
+                                tag="posterior/cluster_{}/mean/dimension_{}"\
+                                    .format(k, l),
+                                simple_value = q_z_means[k, l]
+                            )
+                            summary.value.add(
+                                tag="prior/cluster_{}/variance/dimension_{}"\
+                                    .format(k, l),
+                                simple_value = p_z_variances[k][l]
+                            )
+                            summary.value.add(
+                                tag="posterior/cluster_{}/variance/"\
+                                    "dimension_{}".format(k, l),
+                                simple_value = q_z_variances[k, l]
+                            )
+        
+                    eval_summary_writer.add_summary(summary,
+                        global_step = evaluation["epoch"] + 1)
+                    eval_summary_writer.close()
+                
+                if multiple_model_parameter_sets:
+                    evaluation_set_string = "{} set with {}".format(
+                        evaluation_set.kind.capitalize(),
+                        model_parameter_set_name)
+                else:
+                    evaluation_set_string = "{} set".format(
+                        evaluation_set.kind.capitalize())
+                
+                evaluation_string = "    {} ({})".format(
+                    evaluation_set_string,
+                    formatDuration(evaluating_duration))
+                evaluation_metrics = []
+                if compute_losses:
+                    evaluation_metrics.extend([
+                        "ELBO: {:.5g}".format(ELBO_eval),
+                        "ENRE: {:.5g}".format(ENRE_eval),
+                        "KL_z: {:.5g}".format(KL_z_eval),
+                        "KL_y: {:.5g}".format(KL_y_eval)
+                    ])
+                if accuracy_display:
+                    evaluation_metrics.append(
+                        "Acc: {:.5g}".format(accuracy_display)
+                    )
+                if evaluation_metrics:
+                    evaluation_string += ": " + ", ".join(evaluation_metrics)
+                evaluation_string += "."
+                
+                print(evaluation_string)
+                
+                ## Data sets
+                
+                output_sets = [None] * len(output_versions)
+                
+                if "transformed" in output_versions:
+                    if evaluation_set_transformed:
+                        transformed_evaluation_set = DataSet(
+                            evaluation_set.name,
+                            values = t_eval,
+                            preprocessed_values = None,
+                            labels = evaluation_set.labels,
+                            example_names = evaluation_set.example_names,
+                            feature_names = evaluation_set.feature_names,
+                            feature_selection =
+                                evaluation_set.feature_selection,
+                            example_filter = evaluation_set.example_filter,
+                            preprocessing_methods =
+                                evaluation_set.preprocessing_methods,
+                            kind = evaluation_set.kind,
+                            version = "transformed"
                         )
-    
-                eval_summary_writer.add_summary(summary,
-                    global_step = epoch + 1)
-                eval_summary_writer.flush()
-            
-            evaluating_duration = time() - evaluating_time_start
-            
-            evaluation_string = "    {} set ({}): ".format(
-                evaluation_set.kind.capitalize(),
-                formatDuration(evaluating_duration))
-            evaluation_metrics = [
-                "ELBO: {:.5g}".format(ELBO_eval),
-                "ENRE: {:.5g}".format(ENRE_eval),
-                "KL_z: {:.5g}".format(KL_z_eval),
-                "KL_y: {:.5g}".format(KL_y_eval)
-            ]
-            if accuracy_display:
-                evaluation_metrics.append(
-                    "Acc: {:.5g}".format(accuracy_display)
-                )
-            evaluation_string += ", ".join(evaluation_metrics)
-            evaluation_string += "."
-            
-            print(evaluation_string)
-            
-            ## Data sets
-            
-            output_sets = [None] * len(output_versions)
-            
-            if "transformed" in output_versions:
-                if evaluation_set_transformed:
-                    transformed_evaluation_set = DataSet(
+                    elif multiple_model_parameter_sets and predict_labels:
+                        # Each parameter set gets its own predictions.
+                        transformed_evaluation_set = copy.copy(evaluation_set)
+                    else:
+                        transformed_evaluation_set = evaluation_set
+                    
+                    index = output_versions.index("transformed")
+                    output_sets[index] = transformed_evaluation_set
+                
+                if "reconstructed" in output_versions:
+                    reconstructed_evaluation_set = DataSet(
                         evaluation_set.name,
-                        values = t_eval,
+                        values = finaliseOutputArray(evaluation["p_x_mean"]),
+                        total_standard_deviations = evaluation["p_x_stddev"],
+                        explained_standard_deviations =
+                            evaluation["stddev_of_p_x_given_z_mean"],
                         preprocessed_values = None,
                         labels = evaluation_set.labels,
                         example_names = evaluation_set.example_names,
@@ -2323,105 +2605,257 @@ class GaussianMixtureVariationalAutoencoder(object):
                         preprocessing_methods =
                             evaluation_set.preprocessing_methods,
                         kind = evaluation_set.kind,
-                        version = "transformed"
+                        version = "reconstructed"
                     )
-                else:
-                    transformed_evaluation_set = evaluation_set
-                
-                index = output_versions.index("transformed")
-                output_sets[index] = transformed_evaluation_set
-            
-            if "reconstructed" in output_versions:
-                reconstructed_evaluation_set = DataSet(
-                    evaluation_set.name,
-                    values = p_x_mean_eval,
-                    total_standard_deviations = p_x_stddev_eval,
-                    explained_standard_deviations = \
-                        stddev_of_p_x_given_z_mean_eval,
-                    preprocessed_values = None,
-                    labels = evaluation_set.labels,
-                    example_names = evaluation_set.example_names,
-                    feature_names = evaluation_set.feature_names,
-                    feature_selection = evaluation_set.feature_selection,
-                    example_filter = evaluation_set.example_filter,
-                    preprocessing_methods = evaluation_set.preprocessing_methods,
-                    kind = evaluation_set.kind,
-                    version = "reconstructed"
-                )
-                index = output_versions.index("reconstructed")
-                output_sets[index] = reconstructed_evaluation_set
-            
-            if "latent" in output_versions:
-                z_evaluation_set = DataSet(
-                    evaluation_set.name,
-                    values = z_mean_eval,
-                    preprocessed_values = None,
-                    labels = evaluation_set.labels,
-                    example_names = evaluation_set.example_names,
-                    feature_names = numpy.array(["z variable {}".format(
-                        i + 1) for i in range(self.latent_size)]),
-                    feature_selection = evaluation_set.feature_selection,
-                    example_filter = evaluation_set.example_filter,
-                    preprocessing_methods = evaluation_set.preprocessing_methods,
-                    kind = evaluation_set.kind,
-                    version = "z"
-                )
-            
-                y_evaluation_set = DataSet(
-                    evaluation_set.name,
-                    values = y_mean_eval,
-                    preprocessed_values = None,
-                    labels = evaluation_set.labels,
-                    example_names = evaluation_set.example_names,
-                    feature_names = numpy.array(["y variable {}".format(
-                        i + 1) for i in range(self.K)]),
-                    feature_selection = evaluation_set.feature_selection,
-                    example_filter = evaluation_set.example_filter,
-                    preprocessing_methods = evaluation_set.preprocessing_methods,
-                    kind = evaluation_set.kind,
-                    version = "y"
-                )
-            
-                latent_evaluation_sets = {
-                    "z": z_evaluation_set,
-                    "y": y_evaluation_set
-                }
+                    index = output_versions.index("reconstructed")
+                    output_sets[index] = reconstructed_evaluation_set
                 
-                index = output_versions.index("latent")
-                output_sets[index] = latent_evaluation_sets
-            
-            if predict_labels:
-                if evaluation_set.has_labels:
-                    predicted_evaluation_labels = class_ids_to_class_names(
-                        predicted_evaluation_label_ids)
-                else:
-                    predicted_evaluation_labels = None
+                if "latent" in output_versions:
+                    z_evaluation_set = DataSet(
+                        evaluation_set.name,
+                        values = evaluation["z_mean"],
+                        preprocessed_values = None,
+                        labels = evaluation_set.labels,
+                        example_names = evaluation_set.example_names,
+                        feature_names = numpy.array(["z variable {}".format(
+                            i + 1) for i in range(self.latent_size)]),
+                        feature_selection = evaluation_set.feature_selection,
+                        example_filter = evaluation_set.example_filter,
+                        preprocessing_methods =
+                            evaluation_set.preprocessing_methods,
+                        kind = evaluation_set.kind,
+                        version = "z"
+                    )
                 
-                if evaluation_set.has_superset_labels:
-                    predicted_evaluation_superset_labels = \
-                        superset_class_ids_to_superset_class_names(
-                            predicted_evaluation_superset_label_ids)
-                else:
-                    predicted_evaluation_superset_labels = None
+                    y_evaluation_set = DataSet(
+                        evaluation_set.name,
+                        values = evaluation["y_mean"],
+                        preprocessed_values = None,
+                        labels = evaluation_set.labels,
+                        example_names = evaluation_set.example_names,
+                        feature_names = numpy.array(["y variable {}".format(
+                            i + 1) for i in range(self.K)]),
+                        feature_selection = evaluation_set.feature_selection,
+                        example_filter = evaluation_set.example_filter,
+                        preprocessing_methods =
+                            evaluation_set.preprocessing_methods,
+                        kind = evaluation_set.kind,
+                        version = "y"
+                    )
+                
+                    latent_evaluation_sets = {
+                        "z": z_evaluation_set,
+                        "y": y_evaluation_set
+                    }
+                    
+                    index = output_versions.index("latent")
+                    output_sets[index] = latent_evaluation_sets
                 
-                for output_set in output_sets:
-                    if isinstance(output_set, dict):
-                        for variable in output_set:
-                            output_set[variable].updatePredictions(
+                if predict_labels:
+                    if evaluation_set.has_labels:
+                        predicted_evaluation_labels = class_ids_to_class_names(
+                            predicted_evaluation_label_ids)
+                    else:
+                        predicted_evaluation_labels = None
+                    
+                    if evaluation_set.has_superset_labels:
+                        predicted_evaluation_superset_labels = \
+                            superset_class_ids_to_superset_class_names(
+                                predicted_evaluation_superset_label_ids)
+                    else:
+                        predicted_evaluation_superset_labels = None
+                    
+                    for output_set in output_sets:
+                        if isinstance(output_set, dict):
+                            for variable in output_set:
+                                output_set[variable].updatePredictions(
+                                    predicted_cluster_ids =
+                                        evaluation_cluster_ids,
+                                    predicted_labels =
+                                        predicted_evaluation_labels,
+                                    predicted_superset_labels = 
+                                        predicted_evaluation_superset_labels
+                                )
+                        else:
+                            output_set.updatePredictions(
                                 predicted_cluster_ids = evaluation_cluster_ids,
                                 predicted_labels = predicted_evaluation_labels,
                                 predicted_superset_labels = 
                                     predicted_evaluation_superset_labels
                             )
-                    else:
-                        output_set.updatePredictions(
-                            predicted_cluster_ids = evaluation_cluster_ids,
-                            predicted_labels = predicted_evaluation_labels,
-                            predicted_superset_labels = 
-                                predicted_evaluation_superset_labels
-                        )
+                
+                if len(output_sets) == 1:
+                    output_sets = output_sets[0]
+                
+                output_sets_for_model_parameter_sets[
+                    model_parameter_set_name] = output_sets
+        
+        if multiple_model_parameter_sets:
+            return output_sets_for_model_parameter_sets
+        else:
+            return output_sets_for_model_parameter_sets[
+                model_parameter_set_names[0]]
+    
+    def encode(self, data_set, batch_size = 1000,
+        use_early_stopping_model = False, use_best_model = False,
+        output_directory = None):
+        
+        # Only q(y|x) and the encoders for q(z|x,y) are run, and the latent
+        # means are used as embeddings, so no latent samples or
+        # reconstructions are computed.
+        
+        M = data_set.number_of_examples
+        
+        if data_set.has_preprocessed_values:
+            x = data_set.preprocessed_values
+        else:
+            x = data_set.values
+        
+        noisy_preprocess = data_set.noisy_preprocess
+        
+        if self.count_sum_feature:
+            n_feature = data_set.normalised_count_sum
+        
+        if use_early_stopping_model:
+            log_directory = self.early_stopping_log_directory
+        elif use_best_model:
+            log_directory = self.best_model_log_directory
+        else:
+            log_directory = self.log_directory
+        
+        checkpoint = tf.train.get_checkpoint_state(log_directory)
+        
+        with tf.Session(graph = self.graph,
+            config = self.session_configuration) as session:
             
-            if len(output_sets) == 1:
-                output_sets = output_sets[0]
+            if checkpoint:
+                model_checkpoint_path = correctModelCheckpointPath(
+                    checkpoint.model_checkpoint_path,
+                    log_directory
+                )
+                self.saver.restore(session, model_checkpoint_path)
+            else:
+                print("Cannot encode data when model has not been trained.")
+                return None
+            
+            print("Encoding {} set.".format(data_set.kind))
+            encoding_time_start = time()
+            
+            z_mean = outputArray((M, self.latent_size), output_directory,
+                "{}-z".format(data_set.kind))
+            y_mean = outputArray((M, self.K), output_directory,
+                "{}-y".format(data_set.kind))
+            
+            for i in range(0, M, batch_size):
+                
+                indices = numpy.arange(i, min(i + batch_size, M))
+                
+                x_batch = x[indices]
+                
+                if noisy_preprocess:
+                    x_batch = noisy_preprocess(x_batch)
+                
+                feed_dict_batch = {
+                    self.x: x_batch.toarray(),
+                    self.is_training: False
+                }
+                
+                if self.count_sum_feature:
+                    feed_dict_batch[self.n_feature] = n_feature[indices]
+                
+                z_mean[indices], y_mean[indices] = session.run(
+                    [self.z_mean, self.y_mean],
+                    feed_dict = feed_dict_batch
+                )
             
-            return output_sets
+            z_mean = finaliseOutputArray(z_mean)
+            y_mean = finaliseOutputArray(y_mean)
+            
+            encoding_duration = time() - encoding_time_start
+            print("{} set encoded ({}).".format(
+                data_set.kind.capitalize(), formatDuration(encoding_duration)))
+        
+        z_data_set = DataSet(
+            data_set.name,
+            values = z_mean,
+            preprocessed_values = None,
+            labels = data_set.labels,
+            example_names = data_set.example_names,
+            feature_names = numpy.array(["z variable {}".format(
+                i + 1) for i in range(self.latent_size)]),
+            feature_selection = data_set.feature_selection,
+            example_filter = data_set.example_filter,
+            preprocessing_methods = data_set.preprocessing_methods,
+            kind = data_set.kind,
+            version = "z"
+        )
+        
+        y_data_set = DataSet(
+            data_set.name,
+            values = y_mean,
+            preprocessed_values = None,
+            labels = data_set.labels,
+            example_names = data_set.example_names,
+            feature_names = numpy.array(["y variable {}".format(
+                i + 1) for i in range(self.K)]),
+            feature_selection = data_set.feature_selection,
+            example_filter = data_set.example_filter,
+            preprocessing_methods = data_set.preprocessing_methods,
+            kind = data_set.kind,
+            version = "y"
+        )
+        
+        latent_data_sets = {
+            "z": z_data_set,
+            "y": y_data_set
+        }
+        
+        return latent_data_sets
+    
+    def exportInferenceGraph(self, use_early_stopping_model = False,
+        use_best_model = False, count_sum_maximum = None,
+        preprocessing = None, output_directory = None):
+        
+        # Latent samples and reconstructions are computed as during
+        # evaluation. The preprocessing of inputs and targets used for
+        # training (see `data.inferencePreprocessingForDataSet`) is recorded,
+        # so it can be applied to new data before running the graph.
+        
+        inputs = {
+            "x": self.x,
+            "t": self.t
+        }
+        
+        if self.count_sum:
+            inputs["n"] = self.n
+        
+        if self.count_sum_feature:
+            inputs["n_feature"] = self.n_feature
+        
+        outputs = {
+            "z": self.z_mean,
+            "y": self.y_mean,
+            "reconstruction": self.p_x_mean
+        }
+        
+        constants = {
+            self.is_training: False,
+            self.warm_up_weight: 1.0,
+            self.S_iw: self.number_of_importance_samples["evaluation"],
+            self.S_mc: self.number_of_monte_carlo_samples["evaluation"]
+        }
+        
+        metadata = {
+            "model": self.name,
+            "feature size": self.feature_size,
+            "latent size": self.latent_size,
+            "number of clusters": self.K,
+            "count sum maximum": count_sum_maximum,
+            "preprocessing": preprocessing
+        }
+        
+        return freezeInferenceGraph(
+            self,
+            modelParameterSetName(use_early_stopping_model, use_best_model),
+            inputs, outputs, constants, metadata, output_directory
+        )
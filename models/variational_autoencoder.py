@@ -23,7 +23,11 @@ from models.auxiliary import (
     earlyStoppingStatus,
     trainingString, dataString,
     correctModelCheckpointPath,
-    copyModelDirectory, removeOldCheckpoints
+    copyModelDirectory, removeOldCheckpoints,
+    TrainingProfiler, DataParallelTrainer, formatProfileSummary,
+    outputArray, finaliseOutputArray,
+    modelParameterSetName, modelParameterSetLogDirectory,
+    freezeInferenceGraph
 )
 
 from tensorflow.python.ops.nn import relu, softmax
@@ -37,15 +41,15 @@ from distributions import distributions, latent_distributions, Categorized
 
 import numpy
 from numpy import inf
-import scipy.sparse
 
 import copy
 import os, shutil
+import contextlib
 from time import time
 from auxiliary import formatDuration, normaliseString
 
 from data import DataSet
-from analysis import analyseIntermediateResults
+from analysis import analyseIntermediateResults, IntermediateResultsAnalyser
 from auxiliary import loadLearningCurves
 
 class VariationalAutoencoder(object):
@@ -63,6 +67,7 @@ class VariationalAutoencoder(object):
         count_sum = True,
         number_of_warm_up_epochs = 0, 
         epsilon = 1e-6,
+        intra_op_parallelism_threads = 0, inter_op_parallelism_threads = 0,
         log_directory = "log", results_directory = "results"):
         
         # Class setup
@@ -140,6 +145,13 @@ class VariationalAutoencoder(object):
         self.base_log_directory = log_directory
         self.base_results_directory = results_directory
         
+        # Numbers of threads used within and between operations by sessions
+        # (0: chosen by TensorFlow)
+        self.session_configuration = tf.ConfigProto(
+            intra_op_parallelism_threads = intra_op_parallelism_threads,
+            inter_op_parallelism_threads = inter_op_parallelism_threads
+        )
+        
         # Early stopping
         
         self.early_stopping_rounds = 10
@@ -655,19 +667,12 @@ class VariationalAutoencoder(object):
             
             if "constrained" in self.reconstruction_distribution_name or \
                 "multinomial" in self.reconstruction_distribution_name:
-                self.p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta,
-                    replicated_n
-                )
-            elif "multinomial" in self.reconstruction_distribution_name:
-                self.p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta,
-                    replicated_n
-                )
+                x_distribution_parameters = [x_theta, replicated_n]
             else:
-                self.p_x_given_z = self.reconstruction_distribution["class"](
-                    x_theta
-                )
+                x_distribution_parameters = [x_theta]
+            
+            self.p_x_given_z = self.reconstruction_distribution["class"](
+                *x_distribution_parameters)
             
             if self.k_max:
                 x_logits = dense_layer(
@@ -686,7 +691,9 @@ class VariationalAutoencoder(object):
                 
                 self.p_x_given_z = Categorized(
                     dist = self.p_x_given_z,
-                    cat = Categorical(logits = x_logits)
+                    cat = Categorical(logits = x_logits),
+                    dist_class = self.reconstruction_distribution["class"],
+                    dist_parameters = x_distribution_parameters
                 )
             
 
@@ -975,8 +982,10 @@ class VariationalAutoencoder(object):
     
     def train(self, training_set, validation_set,
         number_of_epochs = 100, batch_size = 100, learning_rate = 1e-3,
-        plotting_interval = None, reset_training = False,
-        temporary_log_directory = None):
+        plotting_interval = None, number_of_plotting_workers = 0,
+        reset_training = False, temporary_log_directory = None,
+        profile = False, profiling_trace_steps = None,
+        number_of_training_workers = 1, synchronisation_interval = 1):
         
         if reset_training and os.path.exists(self.log_directory):
             shutil.rmtree(self.log_directory)
@@ -1109,6 +1118,10 @@ class VariationalAutoencoder(object):
         ### Preprocessing function at every epoch
         noisy_preprocess = training_set.noisy_preprocess
         
+        if noisy_preprocess and number_of_training_workers > 1:
+            raise ValueError("Values cannot be noisily preprocessed for "
+                "each epoch when training in parallel.")
+        
         ### Input and output
         if not noisy_preprocess:
             
@@ -1131,8 +1144,10 @@ class VariationalAutoencoder(object):
             preparing_data_duration)))
         print()
         
-        ## Display intervals during every epoch
-        steps_per_epoch = numpy.ceil(M_train / batch_size)
+        ## Display intervals during every epoch (of the training process
+        ## itself, when training in parallel)
+        steps_per_epoch = numpy.ceil(
+            numpy.ceil(M_train / number_of_training_workers) / batch_size)
         output_at_step = numpy.round(numpy.linspace(0, steps_per_epoch, 11))
         
         ## Learning curves
@@ -1149,7 +1164,118 @@ class VariationalAutoencoder(object):
             }
         }
         
-        with tf.Session(graph = self.graph) as session:
+        ## Background processes (stopped when leaving the session, also
+        ## on errors)
+        background_processes = contextlib.ExitStack()
+        
+        ## Intermediate results (plotted in background processes forked
+        ## before the session is created)
+        if number_of_plotting_workers:
+            intermediate_results_analyser = \
+                background_processes.enter_context(
+                    IntermediateResultsAnalyser(
+                        data_set = validation_set,
+                        number_of_workers = number_of_plotting_workers
+                    )
+                )
+            plotIntermediateResults = intermediate_results_analyser.analyse
+        else:
+            plotIntermediateResults = analyseIntermediateResults
+        
+        ## Profiling
+        profiler = TrainingProfiler(
+            enabled = profile,
+            trace_steps = profiling_trace_steps
+        )
+        
+        def saveTrainingProfile(training_duration, message = None):
+            
+            details = {
+                "model": self.name,
+                "epochs": [epoch_start, number_of_epochs],
+                "batch size": batch_size,
+                "learning rate": learning_rate,
+                "training time": training_duration
+            }
+            
+            if message:
+                details["message"] = message
+            
+            profile_path = profiler.save(
+                directory = os.path.join(self.base_results_directory,
+                    self.name, "profiles"),
+                details = details
+            )
+            print("Training profile saved to {}:".format(profile_path))
+            print(formatProfileSummary(profiler.summary()))
+            print()
+        
+        ## Training step (also run by workers when training in parallel)
+        
+        def trainingStep(session, batch_indices, warm_up_weight, step = None):
+            
+            profiler.start("gather")
+            x_batch = x_train[batch_indices]
+            t_batch = t_train[batch_indices]
+            
+            profiler.start("densify")
+            x_batch = x_batch.toarray()
+            t_batch = t_batch.toarray()
+            
+            profiler.start("feed")
+            feed_dict_batch = {
+                self.x: x_batch,
+                self.t: t_batch,
+                self.is_training: True,
+                self.use_deterministic_z: False,
+                self.learning_rate: learning_rate, 
+                self.warm_up_weight: warm_up_weight,
+                self.number_of_iw_samples:
+                    self.number_of_importance_samples["training"],
+                self.number_of_mc_samples:
+                    self.number_of_monte_carlo_samples["training"]
+            }
+            
+            if self.count_sum:
+                feed_dict_batch[self.n] = n_train[batch_indices]
+
+            if self.count_sum_feature:
+                feed_dict_batch[self.n_feature] = \
+                    n_feature_train[batch_indices]
+
+            # Run the stochastic batch training operation
+            profiler.start("session_run")
+            _, batch_loss = session.run(
+                [self.train_op, self.lower_bound],
+                feed_dict = feed_dict_batch,
+                options = profiler.runOptions(step),
+                run_metadata = profiler.runMetadata(step)
+            )
+            profiler.endStep()
+            
+            return batch_loss
+        
+        ## Data-parallel training (replicas trained in worker processes
+        ## forked before the session is created)
+        if number_of_training_workers > 1:
+            data_parallel_trainer = background_processes.enter_context(
+                DataParallelTrainer(
+                    graph = self.graph,
+                    trainingStep = trainingStep,
+                    global_step = self.global_step,
+                    number_of_workers = number_of_training_workers,
+                    synchronisation_interval = synchronisation_interval,
+                    session_configuration = self.session_configuration
+                )
+            )
+            session_configuration = \
+                data_parallel_trainer.session_configuration
+        else:
+            data_parallel_trainer = None
+            session_configuration = self.session_configuration
+        
+        with background_processes, tf.Session(graph = self.graph,
+            config = session_configuration) as session:
             
             parameter_summary_writer = tf.summary.FileWriter(
                 log_directory)
@@ -1247,52 +1373,34 @@ class VariationalAutoencoder(object):
                 
                 shuffled_indices = numpy.random.permutation(M_train)
                 
-                for i in range(0, M_train, batch_size):
+                if data_parallel_trainer:
+                    shuffled_indices = data_parallel_trainer.startEpoch(
+                        session, shuffled_indices, batch_size, warm_up_weight)
+                
+                for i in range(0, len(shuffled_indices), batch_size):
                     
                     # Internal setup
                     
                     step_time_start = time()
                     
+                    profiler.start("session_run")
                     step = session.run(self.global_step)
                     
-                    # Prepare batch
+                    # Prepare batch and run the stochastic batch training
+                    # operation
                     
                     batch_indices = shuffled_indices[i:(i + batch_size)]
+                    batch_loss = trainingStep(session, batch_indices,
+                        warm_up_weight, step)
                     
-                    x_batch = x_train[batch_indices].toarray()
-                    t_batch = t_train[batch_indices].toarray()
-                    
-                    feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
-                        self.is_training: True,
-                        self.use_deterministic_z: False,
-                        self.learning_rate: learning_rate, 
-                        self.warm_up_weight: warm_up_weight,
-                        self.number_of_iw_samples:
-                            self.number_of_importance_samples["training"],
-                        self.number_of_mc_samples:
-                            self.number_of_monte_carlo_samples["training"]
-                    }
-                    
-                    if self.count_sum:
-                        feed_dict_batch[self.n] = n_train[batch_indices]
-
-                    if self.count_sum_feature:
-                        feed_dict_batch[self.n_feature] = \
-                            n_feature_train[batch_indices]
-
-                    # Run the stochastic batch training operation
-                    _, batch_loss = session.run(
-                        [self.train_op, self.lower_bound],
-                        feed_dict = feed_dict_batch
-                    )
+                    if data_parallel_trainer:
+                        data_parallel_trainer.step(session)
                     
                     # Compute step duration
                     step_duration = time() - step_time_start
                     
                     # Print evaluation and output summaries
-                    if (step + 1 - steps_per_epoch * epoch) in output_at_step:
+                    if (i // batch_size + 1) in output_at_step:
                         
                         print('Step {:d} ({}): {:.5g}.'.format(
                             int(step + 1), formatDuration(step_duration),
@@ -1305,8 +1413,16 @@ class VariationalAutoencoder(object):
                                 time() - training_time_start)
                             status["last epoch time"] = formatDuration(
                                 time() - epoch_time_start)
+                            if profile:
+                                saveTrainingProfile(
+                                    time() - training_time_start,
+                                    message = status["message"]
+                                )
                             return status
                 
+                if data_parallel_trainer:
+                    data_parallel_trainer.endEpoch(session)
+                
                 print()
                 
                 epoch_duration = time() - epoch_time_start
@@ -1319,6 +1435,7 @@ class VariationalAutoencoder(object):
                     print('    Warm-up weight: {:.2g}'.format(warm_up_weight))
 
                 # Export parameter summaries
+                profiler.start("summaries")
                 parameter_summary_string = session.run(
                     self.parameter_summary,
                     feed_dict = {self.warm_up_weight: warm_up_weight}
@@ -1328,6 +1445,7 @@ class VariationalAutoencoder(object):
                 parameter_summary_writer.flush()
                 
                 # Evaluation
+                profiler.start("evaluation")
                 print('    Evaluating model.')
                 
                 ## Training
@@ -1392,6 +1510,7 @@ class VariationalAutoencoder(object):
                 ## Summaries
                 
                 ### Losses
+                profiler.start("summaries")
                 summary = tf.Summary()
                 summary.value.add(tag="losses/lower_bound",
                     simple_value = ELBO_train)
@@ -1409,6 +1528,7 @@ class VariationalAutoencoder(object):
                 training_summary_writer.add_summary(summary,
                     global_step = epoch + 1)
                 training_summary_writer.flush()
+                profiler.start("evaluation")
                 
                 print("    Training set ({}): ".format(
                     formatDuration(evaluating_duration)) + \
@@ -1479,6 +1599,7 @@ class VariationalAutoencoder(object):
                 ## Summaries
                 
                 ### Losses
+                profiler.start("summaries")
                 summary = tf.Summary()
                 summary.value.add(tag="losses/lower_bound",
                     simple_value = ELBO_valid)
@@ -1517,6 +1638,7 @@ class VariationalAutoencoder(object):
                 validation_summary_writer.add_summary(summary,
                     global_step = epoch + 1)
                 validation_summary_writer.flush()
+                profiler.start("evaluation")
                 
                 evaluating_duration = time() - evaluating_time_start
                 print("    Validation set ({}): ".format(
@@ -1525,6 +1647,7 @@ class VariationalAutoencoder(object):
                     ELBO_valid, ENRE_valid, KL_valid))
                 
                 # Early stopping
+                profiler.start("checkpointing")
                 if not self.stopped_early:
                     
                     if ELBO_valid < ELBO_valid_early_stopping:
@@ -1596,6 +1719,7 @@ class VariationalAutoencoder(object):
                 print()
                 
                 # Plot latent validation values
+                profiler.start("plotting")
                 if plotting_interval is None:
                     under_10 = epoch < 10
                     under_100 = epoch < 100 and (epoch + 1) % 10 == 0
@@ -1629,7 +1753,7 @@ class VariationalAutoencoder(object):
                         }
                     else:
                         centroids = None
-                    analyseIntermediateResults(
+                    plotIntermediateResults(
                         learning_curves, epoch_start, epoch,
                         q_z_mean_valid, validation_set, centroids,
                         self.name, self.type,
@@ -1637,7 +1761,7 @@ class VariationalAutoencoder(object):
                     )
                     print()
                 else:
-                    analyseIntermediateResults(
+                    plotIntermediateResults(
                         learning_curves, epoch_start,
                         model_name = self.name,
                         model_type = self.type,
@@ -1645,6 +1769,8 @@ class VariationalAutoencoder(object):
                     )
                     print()
                 
+                profiler.endEpoch()
+                
                 # Update variables for previous iteration
                 ELBO_valid_prev = ELBO_valid
             
@@ -1654,6 +1780,9 @@ class VariationalAutoencoder(object):
                 number_of_epochs, formatDuration(training_duration)))
             print()
             
+            if profile:
+                saveTrainingProfile(training_duration)
+            
             # Clean up
             
             removeOldCheckpoints(log_directory)
@@ -1684,7 +1813,26 @@ class VariationalAutoencoder(object):
         batch_size = 100, predict_labels = False,
         use_early_stopping_model = False, use_best_model = False,
         use_deterministic_z = False, output_versions = "all",
-        log_results = True):
+        log_results = True, stream_reconstructions = False,
+        metric_accumulators = [], model_parameter_set_names = None):
+        
+        # Several model parameter sets can be evaluated in one pass over the
+        # evaluation set by naming them. Each batch is then prepared once
+        # and run through a session for each parameter set. Output sets and
+        # metric accumulators are then dictionaries keyed by parameter set.
+        # Reconstructions for more than one parameter set are always
+        # streamed, so they are not held in memory at the same time.
+        
+        if model_parameter_set_names is None:
+            multiple_model_parameter_sets = False
+            model_parameter_set_names = [modelParameterSetName(
+                use_early_stopping_model, use_best_model)]
+            metric_accumulators = {
+                model_parameter_set_names[0]: metric_accumulators}
+        else:
+            multiple_model_parameter_sets = True
+            if not metric_accumulators:
+                metric_accumulators = {}
         
         if output_versions == "all":
             output_versions = ["transformed", "reconstructed", "latent"]
@@ -1741,59 +1889,74 @@ class VariationalAutoencoder(object):
             print()
     
         # max_count = int(max(t_eval, axis = (0, 1)))
-
-        if use_early_stopping_model:
-            log_directory = self.early_stopping_log_directory
-        elif use_best_model:
-            log_directory = self.best_model_log_directory
-        else:
-            log_directory = self.log_directory
-            
-        checkpoint = tf.train.get_checkpoint_state(log_directory)
         
-        if log_results:
-            eval_summary_directory = os.path.join(log_directory, "evaluation")
-            if os.path.exists(eval_summary_directory):
-                shutil.rmtree(eval_summary_directory)
+        evaluations = {}
         
-        with tf.Session(graph = self.graph) as session:
-            
-            if log_results:
-                eval_summary_writer = tf.summary.FileWriter(
-                    eval_summary_directory)
+        with contextlib.ExitStack() as sessions:
             
-            if checkpoint:
+            for model_parameter_set_name in model_parameter_set_names:
+                
+                log_directory = modelParameterSetLogDirectory(self,
+                    model_parameter_set_name)
+                
+                checkpoint = tf.train.get_checkpoint_state(log_directory)
+                
+                if not checkpoint:
+                    print("Cannot evaluate model when it has not been trained.")
+                    if multiple_model_parameter_sets:
+                        return {
+                            name: [None] * len(output_versions)
+                            for name in model_parameter_set_names
+                        }
+                    else:
+                        return [None] * len(output_versions)
+                
+                session = sessions.enter_context(
+                    tf.Session(graph = self.graph,
+                        config = self.session_configuration))
+                
                 model_checkpoint_path = correctModelCheckpointPath(
                     checkpoint.model_checkpoint_path,
                     log_directory
                 )
                 self.saver.restore(session, model_checkpoint_path)
-                epoch = int(os.path.split(model_checkpoint_path)[-1]
-                    .split('-')[-1])
-            else:
-                print("Cannot evaluate model when it has not been trained.")
-                return [None] * len(output_versions)
+                
+                evaluation = {
+                    "session": session,
+                    "log directory": log_directory,
+                    "epoch": int(os.path.split(model_checkpoint_path)[-1]
+                        .split('-')[-1]),
+                    "metric accumulators": metric_accumulators.get(
+                        model_parameter_set_name, []),
+                    "ELBO": 0,
+                    "KL": 0,
+                    "ENRE": 0
+                }
+                
+                if "reconstructed" in output_versions:
+                    if stream_reconstructions \
+                        or len(model_parameter_set_names) > 1:
+                        reconstruction_directory = os.path.join(
+                            log_directory, "reconstructions")
+                    else:
+                        reconstruction_directory = None
+                    evaluation["p_x_mean"] = outputArray((M_eval, F_eval),
+                        reconstruction_directory, evaluation_set.kind,
+                        temporary = True)
+                    evaluation["p_x_stddev"] = {}
+                    evaluation["stddev_of_p_x_mean"] = {}
+                
+                if "latent" in output_versions:
+                    evaluation["q_z_mean"] = numpy.empty(
+                        [M_eval, self.latent_size], numpy.float32)
+                
+                evaluations[model_parameter_set_name] = evaluation
             
             data_string = dataString(evaluation_set,
                 self.reconstruction_distribution_name)
             print('Evaluating trained model on {}.'.format(data_string))
             evaluating_time_start = time()
             
-            ELBO_eval = 0
-            KL_eval = 0
-            ENRE_eval = 0
-            
-            if "reconstructed" in output_versions:
-                p_x_mean_eval = numpy.empty((M_eval, F_eval), numpy.float32)
-                p_x_stddev_eval = scipy.sparse.lil_matrix((M_eval, F_eval),
-                    dtype = numpy.float32)
-                stddev_of_p_x_mean_eval = scipy.sparse.lil_matrix((M_eval, F_eval),
-                    dtype = numpy.float32)
-            
-            if "latent" in output_versions:
-                q_z_mean_eval = numpy.empty([M_eval, self.latent_size],
-                    numpy.float32)
-            
             if use_deterministic_z:
                 number_of_iw_samples = 1
                 number_of_mc_samples = 1
@@ -1802,17 +1965,53 @@ class VariationalAutoencoder(object):
                     self.number_of_importance_samples["evaluation"]
                 number_of_mc_samples = \
                     self.number_of_monte_carlo_samples["evaluation"]
+            
+            # Only fetch what the requested outputs need, so the remaining
+            # parts of the graph are not run. Losses need the decoder, so
+            # they are only computed when logged or when reconstructions are
+            # computed anyway.
+            
+            compute_losses = log_results \
+                or "reconstructed" in output_versions \
+                or any(metric_accumulators.values())
+            
+            fetches = {}
+            
+            if compute_losses:
+                fetches["ELBO"] = self.ELBO
+                fetches["KL"] = self.KL
+                fetches["ENRE"] = self.ENRE
+            
+            if "reconstructed" in output_versions \
+                or any(metric_accumulators.values()):
+                fetches["p_x_mean"] = self.p_x_mean
+            
+            if "latent" in output_versions:
+                fetches["q_z_mean"] = self.q_z_mean
+            
+            standard_deviation_fetches = {
+                "p_x_stddev": self.p_x_stddev,
+                "stddev_of_p_x_mean": self.stddev_of_p_x_given_z_mean
+            }
+            
+            sorted_evaluation_subset_indices = numpy.array(
+                sorted(evaluation_subset_indices), numpy.int64)
 
             for i in range(0, M_eval, batch_size):
                 
                 indices = numpy.arange(i, min(i + batch_size, M_eval))
                 
-                subset_indices = numpy.array(list(
-                    evaluation_subset_indices.intersection(indices)))
+                subset_indices = sorted_evaluation_subset_indices[
+                    numpy.searchsorted(sorted_evaluation_subset_indices, i):
+                    numpy.searchsorted(sorted_evaluation_subset_indices,
+                        i + batch_size)
+                ]
+                
+                t_batch = t_eval[indices].toarray()
                 
                 feed_dict_batch = {
                     self.x: x_eval[indices].toarray(),
-                    self.t: t_eval[indices].toarray(),
+                    self.t: t_batch,
                     self.is_training: False,
                     self.use_deterministic_z: use_deterministic_z,
                     self.warm_up_weight: 1.0,
@@ -1825,113 +2024,186 @@ class VariationalAutoencoder(object):
                 if self.count_sum_feature:
                     feed_dict_batch[self.n_feature] = n_feature_eval[indices]
                 
-                (ELBO_i, KL_i, ENRE_i, p_x_mean_i,
-                    p_x_stddev_i, stddev_of_p_x_mean_i,
-                    q_z_mean_i) = session.run(
-                    [self.ELBO, self.KL, self.ENRE, self.p_x_mean,
-                        self.p_x_stddev, self.stddev_of_p_x_given_z_mean,
-                        self.q_z_mean],
-                    feed_dict = feed_dict_batch
-                )
+                batch_fetches = fetches.copy()
                 
-                ELBO_eval += ELBO_i
-                KL_eval += KL_i
-                ENRE_eval += ENRE_i
+                # Standard deviations are only kept for subset examples.
+                if "reconstructed" in output_versions \
+                    and subset_indices.size > 0:
+                    batch_fetches.update(standard_deviation_fetches)
                 
-                if "reconstructed" in output_versions:
-                    # Save Importance weighted Monte Carlo estimates of: 
-                    # Reconstruction mean (marginalised conditional mean): 
-                    #      E[x] = E[E[x|z]] = E_q(z|x)[E_p(x|z)[x]]
-                    #           = E_z[p_x_given_z.mean]
-                    #     \approx 1/(R*L) \sum^R_r w_r \sum^L_{l=1}
-                    # p_x_given_z.mean
-                    p_x_mean_eval[indices] = p_x_mean_i
+                if evaluation_set.has_labels:
+                    labels_batch = evaluation_set.labels[indices]
+                else:
+                    labels_batch = None
+                
+                for evaluation in evaluations.values():
                     
-                    if subset_indices.size > 0:
+                    results_i = evaluation["session"].run(batch_fetches,
+                        feed_dict = feed_dict_batch)
+                    
+                    if compute_losses:
+                        evaluation["ELBO"] += results_i["ELBO"]
+                        evaluation["KL"] += results_i["KL"]
+                        evaluation["ENRE"] += results_i["ENRE"]
+                    
+                    for metric_accumulator in \
+                        evaluation["metric accumulators"]:
+                        metric_accumulator.update(t_batch,
+                            results_i["p_x_mean"], labels_batch)
+                    
+                    if "reconstructed" in output_versions:
+                        # Save Importance weighted Monte Carlo estimates of: 
+                        # Reconstruction mean (marginalised conditional mean): 
+                        #      E[x] = E[E[x|z]] = E_q(z|x)[E_p(x|z)[x]]
+                        #           = E_z[p_x_given_z.mean]
+                        #     \approx 1/(R*L) \sum^R_r w_r \sum^L_{l=1}
+                        # p_x_given_z.mean
+                        evaluation["p_x_mean"][indices] = results_i["p_x_mean"]
                         
-                        # Reconstruction standard deviation: 
-                        #     sqrt(V[x]) = sqrt(E[V[x|z]] + V[E[x|z]])
-                        #     = E_z[p_x_given_z.var] + E_z[(p_x_given_z.mean
-                        #       - E[x])^2]
-                        p_x_stddev_eval[subset_indices] = \
-                            p_x_stddev_i[subset_indices - i]
+                        for j in subset_indices:
+                            
+                            # Reconstruction standard deviation: 
+                            #     sqrt(V[x]) = sqrt(E[V[x|z]] + V[E[x|z]])
+                            #     = E_z[p_x_given_z.var]
+                            #       + E_z[(p_x_given_z.mean - E[x])^2]
+                            evaluation["p_x_stddev"][j] = \
+                                results_i["p_x_stddev"][j - i]
+                            
+                            # Estimated standard deviation of Monte Carlo
+                            # estimate E[x].
+                            evaluation["stddev_of_p_x_mean"][j] = \
+                                results_i["stddev_of_p_x_mean"][j - i]
                     
-                        # Estimated standard deviation of Monte Carlo estimate
-                        # E[x].
-                        stddev_of_p_x_mean_eval[subset_indices] = \
-                            stddev_of_p_x_mean_i[subset_indices - i]
-                
-                if "latent" in output_versions:
-                    # Latent space
-                    q_z_mean_eval[indices] = q_z_mean_i
-            
-            ELBO_eval /= M_eval / batch_size
-            KL_eval /= M_eval / batch_size
-            ENRE_eval /= M_eval / batch_size
+                    if "latent" in output_versions:
+                        # Latent space
+                        evaluation["q_z_mean"][indices] = results_i["q_z_mean"]
             
-            ## Summaries
+            evaluating_duration = time() - evaluating_time_start
             
-            if log_results:
+            output_sets_for_model_parameter_sets = {}
             
-                summary = tf.Summary()
-                summary.value.add(tag="losses/lower_bound",
-                    simple_value = ELBO_eval)
-                summary.value.add(tag="losses/reconstruction_error",
-                    simple_value = ENRE_eval)
-                summary.value.add(tag="losses/kl_divergence",
-                    simple_value = KL_eval)
+            for model_parameter_set_name, evaluation \
+                in evaluations.items():
                 
-                ### Centroids
-            
-                p_z_probabilities, p_z_means, p_z_variances = session.run(
-                    [self.p_z_probabilities, self.p_z_means, self.p_z_variances]
-                )
-            
-                for k in range(len(p_z_probabilities)):
-                    summary.value.add(
-                        tag="prior/cluster_{}/probability".format(k),
-                        simple_value = p_z_probabilities[k]
+                session = evaluation["session"]
+                
+                ELBO_eval = evaluation["ELBO"] / (M_eval / batch_size)
+                KL_eval = evaluation["KL"] / (M_eval / batch_size)
+                ENRE_eval = evaluation["ENRE"] / (M_eval / batch_size)
+                
+                ## Summaries
+                
+                if log_results:
+                    
+                    eval_summary_directory = os.path.join(
+                        evaluation["log directory"], "evaluation")
+                    if os.path.exists(eval_summary_directory):
+                        shutil.rmtree(eval_summary_directory)
+                    
+                    eval_summary_writer = tf.summary.FileWriter(
+                        eval_summary_directory)
+                    
+                    summary = tf.Summary()
+                    summary.value.add(tag="losses/lower_bound",
+                        simple_value = ELBO_eval)
+                    summary.value.add(tag="losses/reconstruction_error",
+                        simple_value = ENRE_eval)
+                    summary.value.add(tag="losses/kl_divergence",
+                        simple_value = KL_eval)
+                    
+                    ### Centroids
+                    
+                    p_z_probabilities, p_z_means, p_z_variances = session.run(
+                        [self.p_z_probabilities, self.p_z_means,
+                            self.p_z_variances]
                     )
-                    for l in range(self.latent_size):
-                        # The same Gaussian for all
-                        if not p_z_means[k].shape:
-                            p_z_mean_k_l = p_z_means[k]
-                            p_z_variances_k_l = p_z_variances[k]
-                        # Different Gaussians for all
-                        else:
-                            p_z_mean_k_l = p_z_means[k][l]
-                            p_z_variances_k_l = p_z_variances[k][l]
+                    
+                    for k in range(len(p_z_probabilities)):
                         summary.value.add(
-                            tag="prior/cluster_{}/mean/dimension_{}".format(
-                                k, l),
-                            simple_value = p_z_mean_k_l
+                            tag="prior/cluster_{}/probability".format(k),
+                            simple_value = p_z_probabilities[k]
                         )
-                        summary.value.add(
-                            tag="prior/cluster_{}/variance/dimension_{}"\
-                                .format(k, l),
-                            simple_value = p_z_variances_k_l
+                        for l in range(self.latent_size):
+                            # The same Gaussian for all
+                            if not p_z_means[k].shape:
+                                p_z_mean_k_l = p_z_means[k]
+                                p_z_variances_k_l = p_z_variances[k]
+                            # Different Gaussians for all
+                            else:
+                                p_z_mean_k_l = p_z_means[k][l]
+                                p_z_variances_k_l = p_z_variances[k][l]
+                            summary.value.add(
+                                tag="prior/cluster_{}/mean/dimension_{}"\
+                                    .format(k, l),
+                                simple_value = p_z_mean_k_l
+                            )
+                            summary.value.add(
+                                tag="prior/cluster_{}/variance/dimension_{}"\
+                                    .format(k, l),
+                                simple_value = p_z_variances_k_l
+                            )
+                    
+                    ### Write summaries
+                    eval_summary_writer.add_summary(summary,
+                        global_step = evaluation["epoch"])
+                    eval_summary_writer.close()
+                
+                if multiple_model_parameter_sets:
+                    evaluation_set_string = "{} set with {}".format(
+                        evaluation_set.kind.capitalize(),
+                        model_parameter_set_name)
+                else:
+                    evaluation_set_string = "{} set".format(
+                        evaluation_set.kind.capitalize())
+                
+                evaluation_string = "    {} ({})".format(
+                    evaluation_set_string,
+                    formatDuration(evaluating_duration))
+                if compute_losses:
+                    evaluation_string += \
+                        ": ELBO: {:.5g}, ENRE: {:.5g}, KL: {:.5g}".format(
+                        ELBO_eval, ENRE_eval, KL_eval)
+                evaluation_string += "."
+                
+                print(evaluation_string)
+                
+                # Data sets
+                
+                output_sets = [None] * len(output_versions)
+                
+                if "transformed" in output_versions:
+                    if evaluation_set_transformed:
+                        transformed_evaluation_set = DataSet(
+                            evaluation_set.name,
+                            values = t_eval,
+                            preprocessed_values = None,
+                            labels = evaluation_set.labels,
+                            example_names = evaluation_set.example_names,
+                            feature_names = evaluation_set.feature_names,
+                            feature_selection =
+                                evaluation_set.feature_selection,
+                            example_filter = evaluation_set.example_filter,
+                            preprocessing_methods =
+                                evaluation_set.preprocessing_methods,
+                            kind = evaluation_set.kind,
+                            version = "transformed"
                         )
+                    elif multiple_model_parameter_sets:
+                        # Each parameter set gets its own predictions.
+                        transformed_evaluation_set = copy.copy(evaluation_set)
+                    else:
+                        transformed_evaluation_set = evaluation_set
+                    
+                    index = output_versions.index("transformed")
+                    output_sets[index] = transformed_evaluation_set
                 
-                ### Write summaries
-                eval_summary_writer.add_summary(summary, global_step = epoch)
-                eval_summary_writer.flush()
-            
-            evaluating_duration = time() - evaluating_time_start
-            print("    {} set ({}): ".format(
-                evaluation_set.kind.capitalize(),
-                formatDuration(evaluating_duration)) + \
-                "ELBO: {:.5g}, ENRE: {:.5g}, KL: {:.5g}.".format(
-                ELBO_eval, ENRE_eval, KL_eval))
-            
-            # Data sets
-            
-            output_sets = [None] * len(output_versions)
-            
-            if "transformed" in output_versions:
-                if evaluation_set_transformed:
-                    transformed_evaluation_set = DataSet(
+                if "reconstructed" in output_versions:
+                    reconstructed_evaluation_set = DataSet(
                         evaluation_set.name,
-                        values = t_eval,
+                        values = finaliseOutputArray(evaluation["p_x_mean"]),
+                        total_standard_deviations = evaluation["p_x_stddev"],
+                        explained_standard_deviations =
+                            evaluation["stddev_of_p_x_mean"],
                         preprocessed_values = None,
                         labels = evaluation_set.labels,
                         example_names = evaluation_set.example_names,
@@ -1941,57 +2213,188 @@ class VariationalAutoencoder(object):
                         preprocessing_methods =
                             evaluation_set.preprocessing_methods,
                         kind = evaluation_set.kind,
-                        version = "transformed"
+                        version = "reconstructed"
                     )
-                else:
-                    transformed_evaluation_set = evaluation_set
-                
-                index = output_versions.index("transformed")
-                output_sets[index] = transformed_evaluation_set
-            
-            if "reconstructed" in output_versions:
-                reconstructed_evaluation_set = DataSet(
-                    evaluation_set.name,
-                    values = p_x_mean_eval,
-                    total_standard_deviations = p_x_stddev_eval,
-                    explained_standard_deviations = stddev_of_p_x_mean_eval,
-                    preprocessed_values = None,
-                    labels = evaluation_set.labels,
-                    example_names = evaluation_set.example_names,
-                    feature_names = evaluation_set.feature_names,
-                    feature_selection = evaluation_set.feature_selection,
-                    example_filter = evaluation_set.example_filter,
-                    preprocessing_methods = evaluation_set.preprocessing_methods,
-                    kind = evaluation_set.kind,
-                    version = "reconstructed"
-                )
-                index = output_versions.index("reconstructed")
-                output_sets[index] = reconstructed_evaluation_set
+                    index = output_versions.index("reconstructed")
+                    output_sets[index] = reconstructed_evaluation_set
+                
+                if "latent" in output_versions:
+                    z_evaluation_set = DataSet(
+                        evaluation_set.name,
+                        values = evaluation["q_z_mean"],
+                        preprocessed_values = None,
+                        labels = evaluation_set.labels,
+                        example_names = evaluation_set.example_names,
+                        feature_names = numpy.array([
+                            "latent variable {}".format(i + 1)
+                            for i in range(self.latent_size)
+                        ]),
+                        feature_selection = evaluation_set.feature_selection,
+                        example_filter = evaluation_set.example_filter,
+                        preprocessing_methods =
+                            evaluation_set.preprocessing_methods,
+                        kind = evaluation_set.kind,
+                        version = "z"
+                    )
+                    
+                    latent_evaluation_sets = {
+                        "z": z_evaluation_set
+                    }
+                    
+                    index = output_versions.index("latent")
+                    output_sets[index] = latent_evaluation_sets
+                
+                if len(output_sets) == 1:
+                    output_sets = output_sets[0]
+                
+                output_sets_for_model_parameter_sets[
+                    model_parameter_set_name] = output_sets
+        
+        if multiple_model_parameter_sets:
+            return output_sets_for_model_parameter_sets
+        else:
+            return output_sets_for_model_parameter_sets[
+                model_parameter_set_names[0]]
+    
+    def encode(self, data_set, batch_size = 1000,
+        use_early_stopping_model = False, use_best_model = False,
+        output_directory = None):
+        
+        # Only the encoder is run, and the latent means are used as
+        # embeddings, so no latent samples or reconstructions are computed.
+        
+        M = data_set.number_of_examples
+        
+        if data_set.has_preprocessed_values:
+            x = data_set.preprocessed_values
+        else:
+            x = data_set.values
+        
+        noisy_preprocess = data_set.noisy_preprocess
+        
+        if self.count_sum_feature:
+            n_feature = data_set.normalised_count_sum
+        
+        if use_early_stopping_model:
+            log_directory = self.early_stopping_log_directory
+        elif use_best_model:
+            log_directory = self.best_model_log_directory
+        else:
+            log_directory = self.log_directory
+        
+        checkpoint = tf.train.get_checkpoint_state(log_directory)
+        
+        with tf.Session(graph = self.graph,
+            config = self.session_configuration) as session:
             
-            if "latent" in output_versions:
-                z_evaluation_set = DataSet(
-                    evaluation_set.name,
-                    values = q_z_mean_eval,
-                    preprocessed_values = None,
-                    labels = evaluation_set.labels,
-                    example_names = evaluation_set.example_names,
-                    feature_names = numpy.array(["latent variable {}".format(
-                        i + 1) for i in range(self.latent_size)]),
-                    feature_selection = evaluation_set.feature_selection,
-                    example_filter = evaluation_set.example_filter,
-                    preprocessing_methods = evaluation_set.preprocessing_methods,
-                    kind = evaluation_set.kind,
-                    version = "z"
+            if checkpoint:
+                model_checkpoint_path = correctModelCheckpointPath(
+                    checkpoint.model_checkpoint_path,
+                    log_directory
                 )
+                self.saver.restore(session, model_checkpoint_path)
+            else:
+                print("Cannot encode data when model has not been trained.")
+                return None
             
-                latent_evaluation_sets = {
-                    "z": z_evaluation_set
-                }
-                
-                index = output_versions.index("latent")
-                output_sets[index] = latent_evaluation_sets
+            print("Encoding {} set.".format(data_set.kind))
+            encoding_time_start = time()
             
-            if len(output_sets) == 1:
-                output_sets = output_sets[0]
+            q_z_mean = outputArray((M, self.latent_size), output_directory,
+                "{}-z".format(data_set.kind))
             
-            return output_sets
+            for i in range(0, M, batch_size):
+                
+                indices = numpy.arange(i, min(i + batch_size, M))
+                
+                x_batch = x[indices]
+                
+                if noisy_preprocess:
+                    x_batch = noisy_preprocess(x_batch)
+                
+                feed_dict_batch = {
+                    self.x: x_batch.toarray(),
+                    self.is_training: False
+                }
+                
+                if self.count_sum_feature:
+                    feed_dict_batch[self.n_feature] = n_feature[indices]
+                
+                q_z_mean[indices] = session.run(self.q_z_mean,
+                    feed_dict = feed_dict_batch)
+            
+            q_z_mean = finaliseOutputArray(q_z_mean)
+            
+            encoding_duration = time() - encoding_time_start
+            print("{} set encoded ({}).".format(
+                data_set.kind.capitalize(), formatDuration(encoding_duration)))
+        
+        z_data_set = DataSet(
+            data_set.name,
+            values = q_z_mean,
+            preprocessed_values = None,
+            labels = data_set.labels,
+            example_names = data_set.example_names,
+            feature_names = numpy.array(["latent variable {}".format(
+                i + 1) for i in range(self.latent_size)]),
+            feature_selection = data_set.feature_selection,
+            example_filter = data_set.example_filter,
+            preprocessing_methods = data_set.preprocessing_methods,
+            kind = data_set.kind,
+            version = "z"
+        )
+        
+        latent_data_sets = {
+            "z": z_data_set
+        }
+        
+        return latent_data_sets
+    
+    def exportInferenceGraph(self, use_early_stopping_model = False,
+        use_best_model = False, count_sum_maximum = None,
+        preprocessing = None, output_directory = None):
+        
+        # Latent samples and reconstructions are computed as during
+        # evaluation. The preprocessing of inputs and targets used for
+        # training (see `data.inferencePreprocessingForDataSet`) is recorded,
+        # so it can be applied to new data before running the graph.
+        
+        inputs = {
+            "x": self.x,
+            "t": self.t
+        }
+        
+        if self.count_sum:
+            inputs["n"] = self.n
+        
+        if self.count_sum_feature:
+            inputs["n_feature"] = self.n_feature
+        
+        outputs = {
+            "z": self.q_z_mean,
+            "reconstruction": self.p_x_mean
+        }
+        
+        constants = {
+            self.is_training: False,
+            self.use_deterministic_z: False,
+            self.warm_up_weight: 1.0,
+            self.number_of_iw_samples:
+                self.number_of_importance_samples["evaluation"],
+            self.number_of_mc_samples:
+                self.number_of_monte_carlo_samples["evaluation"]
+        }
+        
+        metadata = {
+            "model": self.name,
+            "feature size": self.feature_size,
+            "latent size": self.latent_size,
+            "count sum maximum": count_sum_maximum,
+            "preprocessing": preprocessing
+        }
+        
+        return freezeInferenceGraph(
+            self,
+            modelParameterSetName(use_early_stopping_model, use_best_model),
+            inputs, outputs, constants, metadata, output_directory
+        )
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+
+# ======================================================================== #
+# 
+# Copyright (c) 2017 - 2018 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# 
+# ======================================================================== #
+
+# Sweeps over model configurations sharing one data set. The data set is
+# loaded and split once in this process, and each configuration is then run
+# by `main.py` in a worker process forked from it, so the values of the data
+# sets are shared with the workers copy-on-write instead of being loaded
+# again. TensorFlow is only imported in the workers.
+
+import data
+
+from main import main as runConfiguration, parser as main_parser
+
+from auxiliary import (
+    formatTime, formatDuration,
+    normaliseString, title, subtitle
+)
+
+import os
+import sys
+import json
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import argparse
+from time import time, strftime
+
+# Arguments of `main.py` determining the data set, which are shared by all
+# configurations in a sweep
+data_set_arguments = [
+    "input_file_or_name", "data_directory",
+    "map_features", "feature_selection", "feature_parameter",
+    "example_filter",
+    "preprocessing_methods", "noisy_preprocessing_methods",
+    "splitting_method", "splitting_fraction"
+]
+
+sweep_status_extension = ".json"
+run_log_extension = ".log"
+
+def main(configurations_path = None, model_types = None,
+    reconstruction_distributions = None, latent_sizes = None,
+    hidden_size_sets = None, numbers_of_classes = None,
+    number_of_workers = 2, main_arguments = []):
+    
+    # Setup
+    
+    base_configuration = vars(main_parser.parse_args(main_arguments))
+    
+    if configurations_path:
+        with open(configurations_path, "r") as configurations_file:
+            configurations = json.load(configurations_file)
+    else:
+        configurations = [{}]
+    
+    grid = {
+        "model_type": model_types,
+        "reconstruction_distribution": reconstruction_distributions,
+        "latent_size": latent_sizes,
+        "hidden_sizes": hidden_size_sets,
+        "number_of_classes": numbers_of_classes
+    }
+    
+    runs = sweepRuns(base_configuration, configurations, grid)
+    
+    binarise_values, noisy_preprocessing_methods = sweepBinarisation(runs)
+    
+    # Thread budgets
+    
+    number_of_workers = max(1, min(number_of_workers, len(runs)))
+    
+    if not base_configuration["intra_op_parallelism_threads"]:
+        intra_op_parallelism_threads = max(1,
+            multiprocessing.cpu_count() // number_of_workers)
+    else:
+        intra_op_parallelism_threads = \
+            base_configuration["intra_op_parallelism_threads"]
+    
+    for run in runs:
+        if not run["configuration"]["intra_op_parallelism_threads"]:
+            run["configuration"]["intra_op_parallelism_threads"] = \
+                intra_op_parallelism_threads
+        if run["configuration"]["number_of_figure_workers"] is None:
+            run["configuration"]["number_of_figure_workers"] = 1
+        run["configuration"]["analyse_data"] = False
+    
+    print(title("Sweep"))
+    
+    print("{} configurations run by {} workers".format(
+        len(runs), number_of_workers),
+        "with {} intra-op threads each.".format(
+            intra_op_parallelism_threads))
+    print()
+    
+    # Data
+    
+    print(subtitle("Data"))
+    
+    data_time_start = time()
+    
+    data_set = data.DataSet(
+        base_configuration["input_file_or_name"],
+        directory = base_configuration["data_directory"],
+        map_features = base_configuration["map_features"],
+        feature_selection = base_configuration["feature_selection"],
+        feature_parameter = base_configuration["feature_parameter"],
+        example_filter = base_configuration["example_filter"],
+        preprocessing_methods = base_configuration["preprocessing_methods"],
+        binarise_values = binarise_values,
+        noisy_preprocessing_methods = noisy_preprocessing_methods
+    )
+    
+    full_data_set_needed = any(
+        run["configuration"]["evaluation_set_name"] == "full"
+        for run in runs
+    )
+    
+    if full_data_set_needed:
+        data_set.load()
+    
+    training_set, validation_set, test_set = data_set.split(
+        base_configuration["splitting_method"],
+        base_configuration["splitting_fraction"]
+    )
+    
+    if not full_data_set_needed:
+        data_set.clear()
+    
+    data_sets = (data_set, training_set, validation_set, test_set)
+    
+    data_duration = time() - data_time_start
+    print("Data set loaded and split ({}).".format(
+        formatDuration(data_duration)))
+    print()
+    
+    # Status and logs
+    
+    sweep_name = "sweep-" + strftime("%Y%m%d-%H%M%S")
+    
+    log_directory = os.path.join(
+        data.directory(base_configuration["log_directory"], data_set,
+            base_configuration["splitting_method"],
+            base_configuration["splitting_fraction"]),
+        sweep_name
+    )
+    results_directory = data.directory(
+        base_configuration["results_directory"], data_set,
+        base_configuration["splitting_method"],
+        base_configuration["splitting_fraction"]
+    )
+    
+    for directory in [log_directory, results_directory]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+    
+    status_path = os.path.join(results_directory,
+        sweep_name + sweep_status_extension)
+    
+    for run in runs:
+        run["log path"] = os.path.join(log_directory,
+            run["name"] + run_log_extension)
+    
+    print("Logs of runs are saved in {}.".format(log_directory))
+    print("Status of the sweep is saved to {}.".format(status_path))
+    print()
+    
+    # Runs
+    
+    print(subtitle("Runs"))
+    
+    sweep_time_start = time()
+    
+    runSweep(runs, data_sets, number_of_workers, status_path)
+    
+    sweep_duration = time() - sweep_time_start
+    
+    number_of_failed_runs = sum(run["status"] == "failed" for run in runs)
+    
+    print()
+    print("{} of {} runs finished ({}).".format(
+        len(runs) - number_of_failed_runs, len(runs),
+        formatDuration(sweep_duration)))
+    
+    if number_of_failed_runs:
+        sys.exit(1)
+
+def sweepRuns(base_configuration, configurations, grid):
+    """
+    Combine each configuration with each combination of the values in
+    `grid` (a dictionary of `main.py` arguments and lists of values, which
+    are ignored if `None`) and complete them using `base_configuration`.
+    """
+    
+    grid = {
+        argument: values
+        for argument, values in grid.items()
+        if values is not None
+    }
+    
+    runs = []
+    
+    for configuration in configurations:
+        for grid_values in itertools.product(*grid.values()):
+            
+            changes = dict(configuration)
+            changes.update(zip(grid.keys(), grid_values))
+            
+            for argument in changes:
+                if argument not in base_configuration:
+                    raise ValueError(
+                        "Argument `{}` not found for `main.py`."
+                        .format(argument))
+                if argument in data_set_arguments:
+                    raise ValueError(
+                        "Data set argument `{}` cannot be changed in a sweep."
+                        .format(argument))
+            
+            run_configuration = dict(base_configuration)
+            run_configuration.update(changes)
+            
+            runs.append({
+                "name": runName(changes) or "base",
+                "changes": changes,
+                "configuration": run_configuration,
+                "status": "pending"
+            })
+    
+    run_names = [run["name"] for run in runs]
+    
+    if len(set(run_names)) != len(run_names):
+        raise ValueError("Configurations in sweep are not unique.")
+    
+    return runs
+
+def runName(changes):
+    
+    name_parts = []
+    
+    for argument, value in changes.items():
+        if isinstance(value, (list, tuple)):
+            value = "x".join(map(str, value))
+        name_parts.append("{}_{}".format(argument, normaliseString(str(value))))
+    
+    return "-".join(name_parts)
+
+def sweepBinarisation(runs):
+    
+    # Models with a Bernoulli distribution are trained on binarised values,
+    # as in `main.py`, but the data set is shared by all runs.
+    
+    binarised_runs = [
+        normaliseString(run["configuration"]["reconstruction_distribution"])
+            == "bernoulli"
+        for run in runs
+    ]
+    
+    noisy_preprocessing_methods = \
+        list(runs[0]["configuration"]["noisy_preprocessing_methods"])
+    
+    if not any(binarised_runs):
+        return False, noisy_preprocessing_methods
+    elif not all(binarised_runs):
+        raise ValueError("Configurations with and without a Bernoulli "
+            "reconstruction distribution cannot share a data set, "
+            "so these have to be swept separately.")
+    
+    if noisy_preprocessing_methods:
+        if noisy_preprocessing_methods[-1] != "binarise":
+            noisy_preprocessing_methods.append("binarise")
+        return False, noisy_preprocessing_methods
+    else:
+        return True, noisy_preprocessing_methods
+
+def runSweep(runs, data_sets, number_of_workers, status_path):
+    
+    # Each run is a separate forked process, since TensorFlow sessions
+    # cannot be reused safely across forks, and runs can start processes of
+    # their own to plot figures.
+    
+    context = multiprocessing.get_context("fork")
+    
+    pending_run_indices = list(range(len(runs)))
+    running_processes = {}
+    
+    while pending_run_indices or running_processes:
+        
+        while pending_run_indices \
+            and len(running_processes) < number_of_workers:
+            
+            run_index = pending_run_indices.pop(0)
+            run = runs[run_index]
+            
+            process = context.Process(
+                target = _runInWorker,
+                args = (run["configuration"], data_sets, run["log path"])
+            )
+            process.start()
+            
+            running_processes[process.sentinel] = (run_index, process)
+            
+            run["status"] = "running"
+            run["start time"] = time()
+            saveSweepStatus(runs, status_path)
+            
+            print("{}: started.".format(run["name"]))
+        
+        finished_sentinels = multiprocessing.connection.wait(
+            list(running_processes))
+        
+        for sentinel in finished_sentinels:
+            
+            run_index, process = running_processes.pop(sentinel)
+            process.join()
+            
+            run = runs[run_index]
+            run["duration"] = time() - run["start time"]
+            
+            if process.exitcode == 0:
+                run["status"] = "finished"
+            else:
+                run["status"] = "failed"
+            
+            saveSweepStatus(runs, status_path)
+            
+            print("{}: {} ({}).".format(run["name"], run["status"],
+                formatDuration(run["duration"])))
+
+def _runInWorker(configuration, data_sets, log_path):
+    
+    # Output, also from TensorFlow itself, is written to the log of the run.
+    # Runs not completing, because modelling is cancelled or training fails,
+    # exit with an error, so they are marked as failed.
+    
+    log_file = open(log_path, "w")
+    os.dup2(log_file.fileno(), sys.stdout.fileno())
+    os.dup2(log_file.fileno(), sys.stderr.fileno())
+    
+    completed = runConfiguration(data_sets = data_sets, **configuration)
+    
+    if not completed:
+        sys.exit(1)
+
+def saveSweepStatus(runs, status_path):
+    
+    status = []
+    
+    for run in runs:
+        run_status = {
+            "name": run["name"],
+            "changes": run["changes"],
+            "status": run["status"],
+            "log path": run["log path"]
+        }
+        if "start time" in run:
+            run_status["start time"] = formatTime(run["start time"])
+        if "duration" in run:
+            run_status["duration"] = run["duration"]
+        status.append(run_status)
+    
+    with open(status_path, "w") as status_file:
+        json.dump(status, status_file, indent = 4)
+
+parser = argparse.ArgumentParser(
+    description = "Sweep over scVAE model configurations sharing one data set. Arguments not listed here are passed on to `main.py` and are shared by all configurations.",
+    formatter_class = argparse.ArgumentDefaultsHelpFormatter,
+    allow_abbrev = False
+)
+parser.add_argument(
+    "--configurations",
+    type = str,
+    dest = "configurations_path",
+    help = "path to JSON file with a list of configurations, each a dictionary of `main.py` arguments (e.g. {\"model_type\": \"GMVAE\", \"latent_size\": 25}), which are combined with the grid"
+)
+parser.add_argument(
+    "--model-types",
+    type = str,
+    nargs = "+",
+    help = "model types in the grid"
+)
+parser.add_argument(
+    "--reconstruction-distributions",
+    type = str,
+    nargs = "+",
+    help = "reconstruction distributions in the grid"
+)
+parser.add_argument(
+    "--latent-sizes",
+    type = int,
+    nargs = "+",
+    help = "sizes of latent space in the grid"
+)
+parser.add_argument(
+    "--hidden-size-sets",
+    type = int,
+    nargs = "+",
+    action = "append",
+    help = "sizes of hidden layers in the grid (can be repeated for each network architecture)"
+)
+parser.add_argument(
+    "--numbers-of-classes",
+    type = int,
+    nargs = "+",
+    help = "numbers of classes to be used in the grid"
+)
+parser.add_argument(
+    "--number-of-workers",
+    type = int,
+    default = 2,
+    help = "number of configurations run at the same time (each using all cores divided by this for TensorFlow unless `--intra-op-parallelism-threads` is given)"
+)
+
+if __name__ == '__main__':
+    arguments, main_arguments = parser.parse_known_args()
+    main(main_arguments = main_arguments, **vars(arguments))